@@ -9,20 +9,156 @@
 '''
 
 
-import kserve
+import os
+import glob
+import time
 import argparse
+import tempfile
+_import_start = time.perf_counter()
+
+# 多进程(kserve --workers大于1): 各worker进程的prometheus指标写入PROMETHEUS_MULTIPROC_DIR, 由主进程的指标端口汇总,
+# 需在导入prometheus_client(kserve及metrics)之前设置; 指定的目录中上次运行留下的指标文件先清除
+_workers_parser = argparse.ArgumentParser(add_help=False)
+_workers_parser.add_argument('--workers', type=int, default=1)
+if _workers_parser.parse_known_args()[0].workers > 1:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        for _path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+            os.remove(_path)
+    else:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="facequality_metrics_")
+
+import kserve
 from .transformer import Transformer
+from .server import ModelServer
+from . import metrics
+
+_import_seconds = time.perf_counter() - _import_start
+metrics.observe_startup("import", _import_seconds)
 
 DEFAULT_MODEL_NAME = "model"
 
 parser = argparse.ArgumentParser(parents=[kserve.model_server.parser])
 parser.add_argument('--model_name', default=DEFAULT_MODEL_NAME,
                     help='The name that the model is served under.')
-parser.add_argument('--predictor_host', help='The URL for the model predict function', required=True)
+parser.add_argument('--predictor_host', help='The URL for the model predict function, not required when --cpu_mode only.')
+parser.add_argument('--protocol', default='grpc', choices=['grpc', 'http'],
+                    help='The protocol used to call the triton predictor.')
+parser.add_argument('--infer_mode', default='async', choices=['sync', 'async', 'aio'],
+                    help='Call triton synchronously, asynchronously with callbacks, or with asyncio.')
+parser.add_argument('--max_inflight', type=int, default=100,
+                    help='Max concurrent in-flight triton requests in async mode.')
+parser.add_argument('--infer_timeout', type=float, default=30,
+                    help='Timeout in seconds of a single triton request.')
+parser.add_argument('--max_batch_size', type=int, default=0,
+                    help='Max images merged into one triton call by the dynamic batcher, 0 to disable.')
+parser.add_argument('--max_batch_wait_ms', type=int, default=5,
+                    help='Max milliseconds the dynamic batcher waits to fill a batch.')
+parser.add_argument('--decode_workers', type=int, default=4,
+                    help='Threads used to decode and resize the images of a MultiRequest in parallel, 0 to disable.')
+parser.add_argument('--url_timeout', type=float, default=10,
+                    help='Read timeout in seconds when downloading url images.')
+parser.add_argument('--url_retries', type=int, default=2,
+                    help='Retries when downloading url images fails.')
+parser.add_argument('--cache_size', type=int, default=0,
+                    help='Max entries of the score cache keyed by image content hash, 0 to disable.')
+parser.add_argument('--cache_ttl', type=float, default=3600,
+                    help='Seconds a cached score stays valid.')
+parser.add_argument('--cache_max_mb', type=int, default=64,
+                    help='Memory limit of the score cache in MB.')
+parser.add_argument('--use_shm', action='store_true',
+                    help='Send input/output tensors through system shared memory to a co-located triton.')
+parser.add_argument('--cpu_mode', default='off', choices=['off', 'only', 'failover', 'overflow'],
+                    help='Run the model on CPU with ONNX Runtime: only, as failover when triton fails or is slow, '
+                         'or as overflow of the slow triton.')
+parser.add_argument('--cpu_model_path', default=None, help='The onnx model file of the cpu backend.')
+parser.add_argument('--cpu_threads', type=int, default=4, help='Threads of a single cpu inference.')
+parser.add_argument('--cpu_workers', type=int, default=1, help='Concurrent cpu inferences.')
+parser.add_argument('--cpu_latency_ms', type=float, default=100,
+                    help='Average triton latency in milliseconds above which requests fall back to cpu.')
+parser.add_argument('--chunk_size', type=int, default=64,
+                    help='Max images per triton call, larger requests are split into pipelined chunks, 0 to disable.')
+parser.add_argument('--max_chunks_inflight', type=int, default=4,
+                    help='Max concurrent in-flight chunks of a single large request.')
+parser.add_argument('--auto_tune', action='store_true',
+                    help='Probe triton and keep adjusting the in-flight limit and the dynamic batch cap '
+                         'to maximize throughput under --latency_slo_ms.')
+parser.add_argument('--latency_slo_ms', type=float, default=100,
+                    help='p95 inference latency target in milliseconds of the auto tuner.')
+parser.add_argument('--tune_interval', type=float, default=30,
+                    help='Seconds between auto tuner adjustments based on live latency.')
+parser.add_argument('--pipeline_config', default=None,
+                    help='JSON config of a multi-model pipeline run for each request instead of the single model.')
+parser.add_argument('--request_timeout', type=float, default=None,
+                    help='Default request deadline in seconds when the X-Request-Timeout-Ms header is absent, '
+                         'defaults to --infer_timeout.')
+parser.add_argument('--max_pending', type=int, default=0,
+                    help='Max requests being processed at once, further requests are rejected immediately, 0 for no limit.')
+parser.add_argument('--shed_status', type=int, default=429, choices=[429, 503],
+                    help='HTTP status returned to rejected requests.')
+parser.add_argument('--fast_json', action='store_true',
+                    help='Parse requests and build responses without the pydantic models, same wire format.')
+parser.add_argument('--reduced_decode', action='store_true',
+                    help='Decode jpeg images directly at 1/2, 1/4 or 1/8 scale while still covering the model input size.')
+parser.add_argument('--input_dtype', default='auto', choices=['auto', 'FP32', 'FP16', 'UINT8'],
+                    help='Input tensor dtype, auto follows the model metadata; UINT8 sends resized pixels '
+                         'normalized by a triton preprocessing model.')
+parser.add_argument('--triton_model', default='face_quality_trt_fp16',
+                    help='Name of the face quality model in triton, its input size, dtype and max batch size are '
+                         'read from the model metadata and config at startup.')
+parser.add_argument('--input_name', default='input.1', help='Input tensor name of the triton model.')
+parser.add_argument('--output_name', default='1346', help='Output tensor name of the triton model.')
+parser.add_argument('--warmup', action='store_true',
+                    help='Run dummy batches at the preferred batch sizes before reporting ready.')
+parser.add_argument('--metrics_port', type=int, default=8082,
+                    help='Port of the prometheus metrics endpoint, 0 to disable.')
+parser.add_argument('--enable_tracing', action='store_true',
+                    help='Emit OpenTelemetry spans for each request and pipeline stage.')
 
 args, _ = parser.parse_known_args()
+if args.predictor_host is None and args.cpu_mode != 'only':
+    parser.error('--predictor_host is required unless --cpu_mode only')
 
 if __name__ == "__main__":
-    transformer = Transformer(args.model_name, predictor_host=args.predictor_host)
-    server = kserve.ModelServer()
+    print("imports loaded in {:.3f}s".format(_import_seconds))
+    if args.metrics_port > 0:
+        metrics.start_metrics_server(args.metrics_port)
+    if args.enable_tracing:
+        metrics.enable_tracing()
+    transformer = Transformer(args.model_name, predictor_host=args.predictor_host,
+                              use_grpc=args.protocol == 'grpc',
+                              infer_mode=args.infer_mode,
+                              max_inflight=args.max_inflight,
+                              infer_timeout=args.infer_timeout,
+                              max_batch_size=args.max_batch_size,
+                              max_batch_wait_ms=args.max_batch_wait_ms,
+                              decode_workers=args.decode_workers,
+                              url_timeout=args.url_timeout,
+                              url_retries=args.url_retries,
+                              cache_size=args.cache_size,
+                              cache_ttl=args.cache_ttl,
+                              cache_max_mb=args.cache_max_mb,
+                              use_shm=args.use_shm,
+                              cpu_mode=args.cpu_mode,
+                              cpu_model_path=args.cpu_model_path,
+                              cpu_threads=args.cpu_threads,
+                              cpu_workers=args.cpu_workers,
+                              cpu_latency_ms=args.cpu_latency_ms,
+                              auto_tune=args.auto_tune,
+                              latency_slo_ms=args.latency_slo_ms,
+                              tune_interval=args.tune_interval,
+                              chunk_size=args.chunk_size,
+                              max_chunks_inflight=args.max_chunks_inflight,
+                              pipeline_config=args.pipeline_config,
+                              request_timeout=args.request_timeout,
+                              max_pending=args.max_pending,
+                              shed_status=args.shed_status,
+                              fast_json=args.fast_json,
+                              reduced_decode=args.reduced_decode,
+                              input_dtype=args.input_dtype,
+                              triton_model=args.triton_model,
+                              input_name=args.input_name,
+                              output_name=args.output_name,
+                              warmup=args.warmup,
+                              workers=args.workers)
+    server = ModelServer()
     server.start(models=[transformer])
@@ -0,0 +1,149 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : admission.py
+@Time    : 2026/10/18 23:41:52
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 请求准入控制及截止时间, 过载时尽早拒绝, 已超时的请求不再解码, 前置处理及发送到triton
+
+截止时间: 请求头X-Request-Timeout-Ms给出的超时(毫秒), 没有时使用服务的默认超时; 在preprocess中记入contextvar,
+解码, 等待在途名额, 前置处理及发送前检查, 剩余时间作为triton调用的client_timeout。
+准入: 同时处理中(preprocess到postprocess)的请求数有上限, 超出时立即以429或503拒绝, 不再排队。
+拒绝及超时以服务框架(kserve的tornado或fastapi)可识别的HTTP错误抛出, 都未安装时为RequestRejected。
+'''
+
+import time
+import threading
+import contextvars
+
+try:
+    from tornado.web import HTTPError
+except ImportError:
+    HTTPError = None
+
+try:
+    from fastapi import HTTPException
+except ImportError:
+    HTTPException = None
+
+from . import metrics
+
+
+TIMEOUT_HEADER = "x-request-timeout-ms"
+
+# 当前请求的截止时间(time.monotonic), None表示没有截止时间
+request_deadline = contextvars.ContextVar("facequality_request_deadline", default=None)
+# 当前请求是否持有准入名额
+_admitted = contextvars.ContextVar("facequality_request_admitted", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求已超过截止时间"""
+
+
+class RequestRejected(Exception):
+    """没有安装tornado及fastapi时使用的HTTP错误"""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def http_error(status_code, message):
+    """构造服务框架可识别的HTTP错误"""
+    if HTTPError is not None:
+        return HTTPError(status_code, reason=message)
+    if HTTPException is not None:
+        return HTTPException(status_code=status_code, detail=message)
+    return RequestRejected(status_code, message)
+
+
+def parse_deadline(timeout_header, default_timeout):
+    """按请求头中的超时(毫秒)或默认超时(秒)计算截止时间
+
+    Args:
+        timeout_header (str): X-Request-Timeout-Ms请求头, 没有时为None
+        default_timeout (float): 默认超时(秒), None表示没有截止时间
+
+    Returns:
+        float: time.monotonic截止时间, 没有截止时间时为None
+    """
+    timeout = default_timeout
+    if timeout_header is not None:
+        try:
+            timeout = float(timeout_header) / 1000.0
+        except ValueError:
+            raise ValueError("invalid {} header: {}".format(TIMEOUT_HEADER, timeout_header))
+    if timeout is None:
+        return None
+    return time.monotonic() + timeout
+
+
+def set_deadline(deadline):
+    request_deadline.set(deadline)
+
+
+def remaining(default=None):
+    """当前请求的剩余时间(秒), 没有截止时间时返回default, 有default时取两者较小值"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return default
+    left = deadline - time.monotonic()
+    return left if default is None else min(left, default)
+
+
+def expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def check_deadline(stage, deadline=None):
+    """已超过截止时间时抛出DeadlineExceeded, 取消后续处理
+
+    Args:
+        stage (str): 当前阶段, 用于错误信息及指标
+        deadline (float, optional): 截止时间, None时取当前请求的截止时间. Defaults to None.
+    """
+    if deadline is None:
+        deadline = request_deadline.get()
+    if expired(deadline):
+        metrics.observe_shed("deadline_" + stage)
+        raise DeadlineExceeded("request deadline exceeded before {}".format(stage))
+
+
+class AdmissionController():
+    """同时处理中的请求数上限, 超出时立即拒绝"""
+
+    def __init__(self, max_pending=0, reject_status=429):
+        """
+        Args:
+            max_pending (int, optional): 同时处理中的请求数上限, 0表示不限制. Defaults to 0.
+            reject_status (int, optional): 拒绝时返回的HTTP状态码, 429或503. Defaults to 429.
+        """
+        if reject_status not in (429, 503):
+            raise ValueError("invalid reject status: {}, must be 429 or 503".format(reject_status))
+        self.max_pending = max_pending
+        self.reject_status = reject_status
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """准入当前请求, 超出上限时抛出HTTP错误; 名额记在当前请求的上下文中"""
+        with self._lock:
+            if self.max_pending > 0 and self.pending >= self.max_pending:
+                rejected = True
+            else:
+                rejected = False
+                self.pending += 1
+        if rejected:
+            metrics.observe_shed("overload")
+            raise http_error(self.reject_status, "server overloaded, {} requests pending".format(self.max_pending))
+        _admitted.set(self)
+
+    def release(self):
+        """归还当前请求的名额, 重复调用无影响"""
+        if _admitted.get() is not self:
+            return
+        _admitted.set(None)
+        with self._lock:
+            self.pending -= 1
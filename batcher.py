@@ -0,0 +1,213 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : batcher.py
+@Time    : 2026/10/18 10:02:11
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 服务端动态组batch(micro-batching), 将同时到达的多个请求的图片合并为一次triton调用
+'''
+
+import time
+import threading
+import contextvars
+from queue import Queue, Empty
+from concurrent.futures import Future, ThreadPoolExecutor, InvalidStateError
+
+from .tuner import AdjustableSemaphore
+from . import admission
+from . import metrics
+
+
+class DynamicBatcher():
+    """动态组batch调度器
+
+    调用方通过submit提交一组图片并拿到一个Future, 后台线程把同一时间窗口内到达的
+    请求合并为一个NCHW batch调用predictor.infer, 再把分数按请求拆分回各自的Future。
+    max_inflight大于1时, 上一个batch还在推理时即开始收集并发送下一个batch, 同时在途的batch不超过上限。
+
+    Note:
+    -----
+    单个请求的图片数超过max_batch_size时不会被拆分, 会单独组成一个batch, 由predictor.infer按chunk_size分块调用。
+    """
+
+    def __init__(self, predictor, max_batch_size=32, max_wait_ms=5, max_inflight=1, observer=None):
+        """
+        Args:
+            predictor (FaceQualityPrediction): 算法调用对象, 需提供infer(images)方法.
+            max_batch_size (int, optional): 合并后batch的最大图片数, 运行中可修改. Defaults to 32.
+            max_wait_ms (int, optional): 第一个请求到达后最多等待的毫秒数. Defaults to 5.
+            max_inflight (int, optional): 同时在途的batch数上限, 运行中可通过set_inflight在1到该值之间调整,
+                predictor.infer需线程安全(http客户端只能为1). Defaults to 1.
+            observer (function, optional): 每个batch推理完成后调用observer(seconds, batch_size). Defaults to None.
+        """
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_inflight = max_inflight
+        self.observer = observer
+        self._inflight = AdjustableSemaphore(max_inflight)
+        self._executor = None
+        if max_inflight > 1:
+            self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="batch-infer")
+
+        self._queue = Queue()
+        self._pending = None
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="dynamic-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, images, deadline=None):
+        """提交一组图片, 返回Future, 结果为该组图片对应的人脸质量分数列表
+
+        Args:
+            images (list): 图片数据列表
+            deadline (float, optional): 截止时间(time.monotonic), 组batch时已超时的请求直接以DeadlineExceeded结束. Defaults to None.
+
+        Returns:
+            concurrent.futures.Future: 推理结果句柄
+        """
+        future = Future()
+        if self._closed:
+            future.set_exception(RuntimeError("DynamicBatcher is closed"))
+            return future
+        if len(images) == 0:
+            future.set_result([])
+            return future
+        self._queue.put((images, future, deadline))
+        return future
+
+    def infer(self, images):
+        """同步接口, 阻塞直到该组图片的分数返回"""
+        return self.submit(images).result()
+
+    def set_inflight(self, limit):
+        """调整同时在途的batch数, 不超过构造时的max_inflight"""
+        self._inflight.set_limit(max(1, min(limit, self.max_inflight)))
+
+    def close(self):
+        """停止后台线程, 已入队的请求会先处理完"""
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _next_batch(self):
+        """收集一个batch: 阻塞等待第一个请求, 然后在max_wait内尽量凑满max_batch_size"""
+        if self._pending is not None:
+            first, self._pending = self._pending, None
+        else:
+            first = self._queue.get()
+        if first is None:
+            return None
+        if self._expired(first):
+            return []
+
+        batch = [first]
+        batch_size = len(first[0])
+        deadline = time.time() + self.max_wait
+        while batch_size < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except Empty:
+                break
+            if item is None:
+                # 先处理当前batch, 再退出
+                self._queue.put(None)
+                break
+            if self._expired(item):
+                continue
+            if batch_size + len(item[0]) > self.max_batch_size:
+                # 放不下, 留到下一个batch
+                self._pending = item
+                break
+            batch.append(item)
+            batch_size += len(item[0])
+        return batch
+
+    def _run(self):
+        # 合并后的batch混合了多个请求, 指标中req_type记为batched
+        metrics.set_request_labels("batched", getattr(self.predictor.tritonclient, "transport", "unknown"))
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            if not batch:
+                continue
+
+            self._inflight.acquire()
+            try:
+                if self._executor is None:
+                    self._infer(batch)
+                else:
+                    # 工作线程沿用当前的指标标签
+                    self._executor.submit(contextvars.copy_context().run, self._infer, batch)
+            except Exception as e:
+                # 组batch线程不能因单个batch的错误退出, 否则之后的请求永远等不到结果
+                print("dynamic batcher dispatch failed: {}".format(e))
+                self._fail(batch, e)
+                if self._executor is not None:
+                    self._inflight.release()
+
+    def _expired(self, item):
+        """等待组batch期间已超过截止时间的请求不再推理"""
+        _, future, deadline = item
+        try:
+            admission.check_deadline("batch", deadline)
+        except admission.DeadlineExceeded as e:
+            _set_exception(future, e)
+            return True
+        return False
+
+    def _infer(self, batch):
+        try:
+            # batch中最晚的截止时间作为triton调用的超时, 不因单个请求的超时取消整个batch
+            deadlines = [deadline for _, _, deadline in batch]
+            admission.set_deadline(None if None in deadlines else max(deadlines))
+            images = []
+            for item_images, _, _ in batch:
+                images.extend(item_images)
+
+            t1 = time.perf_counter()
+            scores = self.predictor.infer(images)
+
+            # 按请求拆分分数
+            offset = 0
+            for item_images, future, _ in batch:
+                _set_result(future, scores[offset: offset + len(item_images)])
+                offset += len(item_images)
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        finally:
+            self._inflight.release()
+
+        if self.observer is not None:
+            try:
+                self.observer(time.perf_counter() - t1, len(images))
+            except Exception as e:
+                print("dynamic batcher observer failed: {}".format(e))
+
+    def _fail(self, batch, error):
+        """batch中还没有结果的请求以error结束"""
+        for _, future, _ in batch:
+            _set_exception(future, error)
+
+
+def _set_result(future, result):
+    # 调用方经asyncio.wrap_future等待时, 取消可能发生在检查之后, 已结束的Future不再设置
+    try:
+        future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def _set_exception(future, error):
+    try:
+        future.set_exception(error)
+    except InvalidStateError:
+        pass
@@ -0,0 +1,516 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : benchmark.py
+@Time    : 2026/10/18 17:05:42
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 性能压测工具, 对transformer服务, FaceQualityPrediction及模拟triton后端进行开环/闭环压测,
+           输出p50/p95/p99延迟, 吞吐及单请求cpu耗时的json结果
+
+使用示例:
+    # 无GPU环境: FaceQualityPrediction + 进程内模拟triton服务(mock_triton.py), 使用真实的grpc/http客户端
+    python -m facequality_transformer.benchmark --target mock --protocols grpc,http --batch_sizes 1,16 --concurrency 1,8
+
+    # 直连triton
+    python -m facequality_transformer.benchmark --target predictor --predictor_host localhost:8001 \
+        --protocols grpc --modes sync,async
+
+    # 请求体解析及解码开销: json(base64) vs 二进制请求
+    python -m facequality_transformer.benchmark --target ingest --payloads json,multipart,v2 --batch_sizes 1,16 --concurrency 1
+
+    # 输入张量类型对比: 每次调用发送的字节数及端到端延迟
+    python -m facequality_transformer.benchmark --target mock --protocols grpc,http --input_dtypes FP32,FP16,UINT8 \
+        --batch_sizes 16,64 --concurrency 1,8
+
+    # 请求解析及返回结果构造开销: pydantic路径 vs 快速路径(--fast_json), 同时检查两者输出一致
+    python -m facequality_transformer.benchmark --target serialize --serializers pydantic,fast --batch_sizes 1,64,512 \
+        --concurrency 1
+
+    # transformer服务(开环, 固定到达速率)
+    python -m facequality_transformer.benchmark --target transformer \
+        --url http://127.0.0.1:8080/v1/models/facequality:predict --load open --rate 200
+'''
+
+import sys
+import json
+import time
+import base64
+import argparse
+import threading
+from functools import partial
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import requests
+
+from .prediction import FaceQualityPrediction
+from .triton_client import TritonHttpClient, TritonGrpcClient
+from .mock_triton import MockTritonServer, MockFaceQualityModel
+from .binary_request import parse_binary_request, encode_multipart, encode_v2_binary
+from .utils import parse_item_images, decode_image_buffers
+
+
+class PredictorRunner():
+    """直接调用FaceQualityPrediction
+
+    http客户端不是线程安全的, 每个线程各自创建客户端; grpc客户端所有线程共享。
+    """
+
+    def __init__(self, make_client, protocol, mode, input_dtype="FP32", backend=None):
+        self.make_client = make_client
+        self.protocol = protocol
+        self.mode = mode
+        self.input_dtype = input_dtype
+        # 模拟triton的后端, 用于统计实际收到的请求字节数
+        self.backend = backend
+        self._request_bytes = {}
+        self._shared = None if protocol == "http" else self._new_predictor()
+        self._local = threading.local()
+
+    def _new_predictor(self, client=None):
+        # 与服务启动时一致, 按模型元数据及配置构造请求模板
+        client = client or self.make_client()
+        predictor = FaceQualityPrediction(client, input_dtype=self.input_dtype)
+        predictor.configure(client.load_model(predictor.model_name), self.input_dtype)
+        return predictor
+
+    def request_bytes(self, batch_size):
+        """每次调用发送到triton的请求字节数, 包括协议头及binary tensor格式的开销
+
+        发送一次调用, 由模拟triton统计实际收到的字节数; 连接真实triton时在进程内启动与模型配置一致的模拟triton测量。
+        """
+        if batch_size not in self._request_bytes:
+            predictor = self.predictor()
+            if self.backend is not None:
+                self._request_bytes[batch_size] = _measure_request_bytes(predictor, self.backend, batch_size)
+            else:
+                input_shape = (3,) + tuple(predictor.input_size[::-1])
+                model = MockFaceQualityModel(
+                    name=predictor.model_name, input_name=predictor.input_names[0],
+                    output_name=predictor.output_names[0], input_shape=input_shape, datatype=predictor.input_dtype,
+                    max_batch_size=predictor.max_batch_size, output_datatype=predictor.output_dtype)
+                with MockTritonServer(model=model) as server:
+                    client = type(predictor.tritonclient)(server.grpc_url if self.protocol == "grpc" else server.http_url)
+                    try:
+                        self._request_bytes[batch_size] = _measure_request_bytes(
+                            self._new_predictor(client), server.backend, batch_size)
+                    finally:
+                        client.close()
+        return self._request_bytes[batch_size]
+
+    def predictor(self):
+        if self._shared is not None:
+            return self._shared
+        predictor = getattr(self._local, "predictor", None)
+        if predictor is None:
+            predictor = self._new_predictor()
+            self._local.predictor = predictor
+        return predictor
+
+    def call(self, images):
+        self.predictor().infer(images)
+
+    def call_async(self, images, done):
+        """发送异步请求, 完成后调用done(error); http异步请求需在当前线程通过返回的句柄等待结果"""
+        predictor = self.predictor()
+        if self.protocol == "http":
+            return predictor.async_infer(images)
+        future = predictor.grpc_async_infer(images)
+        future.add_done_callback(lambda f: done(f.exception()))
+        return None
+
+
+def _measure_request_bytes(predictor, backend, batch_size):
+    """通过predictor发送一次batch_size张图片的调用, 返回模拟triton收到的请求字节数"""
+    images = [np.zeros(tuple(predictor.input_size[::-1]) + (3,), dtype=np.uint8)] * batch_size
+    before = backend.stats()["request_bytes"]
+    predictor.infer(images)
+    return backend.stats()["request_bytes"] - before
+
+
+def build_payload(payload, buffer, batch_size):
+    """构造batch_size张图片的请求体
+
+    Args:
+        payload (str): json(base64编码, 与kserver_client.py一致), multipart或v2(KServe v2 binary tensor)
+        buffer (bytes): jpeg编码的图片
+        batch_size (int): 图片数
+
+    Returns:
+        tuple: (请求体, 请求头)
+    """
+    if payload == "multipart":
+        body, content_type = encode_multipart([buffer] * batch_size)
+        return body, {"Content-Type": content_type}
+    if payload == "v2":
+        return encode_v2_binary([buffer] * batch_size)
+    item = "data:image/jpeg;base64,{}".format(base64.b64encode(buffer).decode())
+    if batch_size == 1:
+        request = {"data": {"item": item}}
+    else:
+        request = {"multi_data": [{"data": {"item": item}} for _ in range(batch_size)]}
+    return json.dumps(request).encode(), {"Content-Type": "application/json"}
+
+
+class TransformerRunner():
+    """通过http调用transformer服务, json请求体与kserver_client.py一致"""
+
+    def __init__(self, url, image, host=None, payload="json"):
+        self.url = url
+        self.payload = payload
+        self.buffer = cv2.imencode(".jpg", image)[1].tobytes()
+        self.headers = {"Host": host} if host else {}
+        self._bodies = {}
+        self._local = threading.local()
+
+    def body(self, batch_size):
+        if batch_size not in self._bodies:
+            body, headers = build_payload(self.payload, self.buffer, batch_size)
+            self._bodies[batch_size] = (body, dict(self.headers, **headers))
+        return self._bodies[batch_size]
+
+    def request_bytes(self, batch_size):
+        return len(self.body(batch_size)[0])
+
+    def call(self, images):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        body, headers = self.body(len(images))
+        r = session.post(self.url, data=body, headers=headers)
+        r.raise_for_status()
+
+
+class IngestRunner(TransformerRunner):
+    """进程内请求体解析及图片解码, 对比json(base64)与二进制请求的服务端开销, 不含网络传输及推理
+
+    json请求只做json解析, base64解码及图片解码, 不含pydantic对象构造, 对比结果偏保守。
+    """
+
+    def __init__(self, image, payload="json", min_size=None):
+        super().__init__(None, image, payload=payload)
+        self.min_size = min_size
+
+    def call(self, images):
+        body, headers = self.body(len(images))
+        if self.payload == "json":
+            request = json.loads(body)
+            if "multi_data" in request:
+                items = [req["data"]["item"] for req in request["multi_data"]]
+            else:
+                items = [request["data"]["item"]]
+            parse_item_images(items, min_size=self.min_size)
+        else:
+            decode_image_buffers(parse_binary_request(body, headers), min_size=self.min_size)
+
+
+class SerializeRunner():
+    """进程内json请求解析(不含图片解码)及返回结果构造/序列化, 对比pydantic路径与快速路径
+
+    构造时检查两条路径对同一请求及分数的输出是否一致, 结果写入压测报告的conformant字段。
+    """
+
+    def __init__(self, serializer="pydantic"):
+        # 依赖common_data_type, 只在该压测目标中导入
+        from . import serialization
+        self.serialization = serialization
+        self.fast = serializer == "fast"
+        self._bodies = {}
+        self._scores = {}
+
+    def body(self, batch_size):
+        if batch_size not in self._bodies:
+            item = "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQ"
+            request = {"multi_data": [{"data": {"item": item}} for _ in range(batch_size)]}
+            self._bodies[batch_size] = json.dumps(request).encode()
+            self._scores[batch_size] = np.random.rand(batch_size).astype(np.float32)
+        return self._bodies[batch_size], self._scores[batch_size]
+
+    def conformant(self, batch_size):
+        body, scores = self.body(batch_size)
+        s = self.serialization
+        request = json.loads(body)
+        return (s.parse_items(request) == s.parse_items_pydantic(request)
+                and json.dumps(s.build_response(scores)) == json.dumps(s.build_response_pydantic(scores)))
+
+    def request_bytes(self, batch_size):
+        return len(self.body(batch_size)[0])
+
+    def call(self, images):
+        body, scores = self.body(len(images))
+        s = self.serialization
+        # 与服务一致: 请求体按Transformer.parse的方式解析, 返回的dict由tornado的write以json.dumps序列化
+        if self.fast:
+            s.parse_items(s.loads(body))
+            response = s.build_response(scores)
+        else:
+            s.parse_items_pydantic(json.loads(body))
+            response = s.build_response_pydantic(scores)
+        json.dumps(response).encode()
+
+
+class Recorder():
+    """线程安全的延迟及错误记录"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def record(self, latency, error=None):
+        with self._lock:
+            if error is not None:
+                self.errors += 1
+                self.last_error = str(error)
+            else:
+                self.latencies.append(latency)
+
+
+def closed_loop(runner, images, concurrency, duration, mode):
+    """闭环压测: 始终保持concurrency个请求在途, 一个完成后立即发送下一个"""
+    recorder = Recorder()
+    deadline = time.time() + duration
+
+    if mode == "sync":
+        def worker():
+            while time.time() < deadline:
+                t1 = time.time()
+                try:
+                    runner.call(images)
+                    recorder.record(time.time() - t1)
+                except Exception as e:
+                    recorder.record(None, e)
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return recorder
+
+    # 异步: 单个线程发送, 在途请求数由信号量限制
+    window = threading.Semaphore(concurrency)
+    pending = deque()
+
+    def done(t1, error):
+        recorder.record(time.time() - t1, error)
+        window.release()
+
+    while time.time() < deadline:
+        if runner.protocol == "http" and len(pending) >= concurrency:
+            t1, handle = pending.popleft()
+            _wait_http(handle, t1, recorder, window)
+        window.acquire()
+        t1 = time.time()
+        try:
+            handle = runner.call_async(images, lambda error, t1=t1: done(t1, error))
+            if handle is not None:
+                pending.append((t1, handle))
+        except Exception as e:
+            done(t1, e)
+    while pending:
+        t1, handle = pending.popleft()
+        _wait_http(handle, t1, recorder, window)
+    for _ in range(concurrency):
+        window.acquire()
+    return recorder
+
+
+def _wait_http(handle, t1, recorder, window):
+    try:
+        handle.get_result()
+        recorder.record(time.time() - t1)
+    except Exception as e:
+        recorder.record(None, e)
+    window.release()
+
+
+def open_loop(runner, images, concurrency, duration, rate):
+    """开环压测: 按固定速率rate(请求/秒)发送, 与请求是否完成无关
+
+    延迟从计划发送时间开始计算, 线程池排队的时间也计入延迟, 避免coordinated omission。
+    """
+    recorder = Recorder()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def run(scheduled):
+        try:
+            runner.call(images)
+            recorder.record(time.time() - scheduled)
+        except Exception as e:
+            recorder.record(None, e)
+
+    t0 = time.time()
+    total = int(duration * rate)
+    for i in range(total):
+        scheduled = t0 + i / rate
+        delay = scheduled - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        executor.submit(run, scheduled)
+    executor.shutdown(wait=True)
+    return recorder
+
+
+def summarize(recorder, elapsed, cpu, batch_size):
+    completed = len(recorder.latencies)
+    latencies = np.array(recorder.latencies) * 1000.0 if completed else np.zeros(1)
+    requests_done = completed + recorder.errors
+    return {
+        "requests": completed,
+        "errors": recorder.errors,
+        "last_error": recorder.last_error,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "throughput_rps": round(completed / elapsed, 3),
+        "throughput_ips": round(completed * batch_size / elapsed, 3),
+        "cpu_ms_per_request": round(cpu * 1000.0 / requests_done, 3) if requests_done else None,
+    }
+
+
+def run_case(runner, image, batch_size, concurrency, args, mode):
+    images = [image] * batch_size
+    # 预热, 建立连接
+    try:
+        runner.call(images)
+    except Exception as e:
+        print("warm up failed:", e)
+
+    cpu0, t0 = time.process_time(), time.time()
+    if args.load == "open":
+        recorder = open_loop(runner, images, concurrency, args.duration, args.rate)
+    else:
+        recorder = closed_loop(runner, images, concurrency, args.duration, mode)
+    elapsed, cpu = time.time() - t0, time.process_time() - cpu0
+    return summarize(recorder, elapsed, cpu, batch_size)
+
+
+def make_runners(args):
+    """按target/protocol/mode生成(描述, runner, mode)列表"""
+    if args.target == "transformer":
+        for payload in args.payloads:
+            runner = TransformerRunner(args.url, args.image_data, args.host, payload=payload)
+            yield {"protocol": "http", "mode": "server", "payload": payload}, runner, "sync"
+        return
+
+    if args.target == "serialize":
+        for serializer in args.serializers:
+            yield {"protocol": "none", "mode": "sync", "serializer": serializer}, SerializeRunner(serializer), "sync"
+        return
+
+    if args.target == "ingest":
+        min_size = (112, 112) if args.reduced_decode else None
+        for payload in args.payloads:
+            desc = {"protocol": "none", "mode": "sync", "payload": payload, "reduced_decode": args.reduced_decode}
+            yield desc, IngestRunner(args.image_data, payload, min_size=min_size), "sync"
+        return
+
+    for input_dtype in args.input_dtypes:
+        server = None
+        if args.target == "mock":
+            # 模拟模型的输入类型与本轮的输入张量类型一致
+            server = MockTritonServer(model=MockFaceQualityModel(datatype=input_dtype),
+                                      latency_ms=args.mock_latency_ms, jitter_ms=args.mock_jitter_ms,
+                                      per_image_ms=args.mock_per_image_ms, workers=max(64, args.max_concurrency)).start()
+
+        try:
+            for protocol in args.protocols:
+                client_class = TritonGrpcClient if protocol == "grpc" else TritonHttpClient
+                if server is None:
+                    predictor_host = args.predictor_host
+                else:
+                    predictor_host = server.grpc_url if protocol == "grpc" else server.http_url
+                make_client = partial(client_class, predictor_host, concurrency=args.max_concurrency)
+                for mode in args.modes:
+                    runner = PredictorRunner(make_client, protocol, mode, input_dtype=input_dtype,
+                                             backend=server.backend if server is not None else None)
+                    yield {"protocol": protocol, "mode": mode, "input_dtype": input_dtype}, runner, mode
+        finally:
+            if server is not None:
+                server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="face quality transformer benchmark")
+    parser.add_argument('--target', default='mock', choices=['transformer', 'predictor', 'mock', 'ingest', 'serialize'],
+                        help='transformer: http service, predictor: FaceQualityPrediction with triton, mock: in-process mock triton '
+                             '(cpu_ms_per_request includes the mock server), ingest: in-process request parsing and decoding, '
+                             'serialize: in-process json request parsing and response building.')
+    parser.add_argument('--payloads', default='json',
+                        help='Comma separated request bodies for transformer/ingest targets: json,multipart,v2.')
+    parser.add_argument('--serializers', default='pydantic,fast',
+                        help='Comma separated request/response paths for the serialize target: pydantic,fast.')
+    parser.add_argument('--reduced_decode', action='store_true',
+                        help='Decode jpeg images at reduced scale covering 112x112 for the ingest target.')
+    parser.add_argument('--input_dtypes', default='FP32',
+                        help='Comma separated input tensor dtypes for predictor/mock targets: FP32,FP16,UINT8; '
+                             'request_bytes reports the bytes of each call received by triton, '
+                             'measured on the in-process mock triton.')
+    parser.add_argument('--url', default='http://127.0.0.1:8080/v1/models/facequality:predict',
+                        help='Transformer predict url when target is transformer.')
+    parser.add_argument('--host', default=None, help='Optional Host header for the transformer ingress.')
+    parser.add_argument('--predictor_host', default='localhost:8001', help='Triton host when target is predictor.')
+    parser.add_argument('--protocols', default='grpc', help='Comma separated protocols: grpc,http.')
+    parser.add_argument('--modes', default='sync', help='Comma separated call modes: sync,async.')
+    parser.add_argument('--batch_sizes', default='1,4,16', help='Comma separated batch sizes.')
+    parser.add_argument('--concurrency', default='1,8', help='Comma separated concurrency levels.')
+    parser.add_argument('--load', default='closed', choices=['closed', 'open'], help='Closed-loop or open-loop load.')
+    parser.add_argument('--rate', type=float, default=100, help='Requests per second of the open-loop load.')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of each benchmark case.')
+    parser.add_argument('--mock_latency_ms', type=float, default=2.0, help='Latency of the in-process mock triton.')
+    parser.add_argument('--mock_jitter_ms', type=float, default=0.0, help='Latency jitter of the in-process mock triton.')
+    parser.add_argument('--mock_per_image_ms', type=float, default=0.0,
+                        help='Extra latency per image of the in-process mock triton.')
+    parser.add_argument('--image', default='data/1-Harry_Belafonte_1.jpg', help='Image used to build requests.')
+    parser.add_argument('--output', default=None, help='Write the json report to this file instead of stdout.')
+    args = parser.parse_args(argv)
+
+    args.protocols = args.protocols.split(",")
+    args.modes = args.modes.split(",")
+    args.payloads = args.payloads.split(",")
+    args.serializers = args.serializers.split(",")
+    args.input_dtypes = args.input_dtypes.split(",")
+    batch_sizes = [int(x) for x in args.batch_sizes.split(",")]
+    concurrencies = [int(x) for x in args.concurrency.split(",")]
+    args.max_concurrency = max(concurrencies)
+    args.image_data = cv2.imread(args.image)
+    if args.image_data is None:
+        raise ValueError("failed to read image: {}".format(args.image))
+
+    results = []
+    for desc, runner, mode in make_runners(args):
+        if args.load == "open" and mode == "async":
+            # 开环压测由线程池按速率发送, 与调用方式无关
+            continue
+        for batch_size in batch_sizes:
+            for concurrency in concurrencies:
+                case = dict(target=args.target, load=args.load, batch_size=batch_size,
+                            concurrency=concurrency, **desc)
+                if args.load == "open":
+                    case["rate"] = args.rate
+                if hasattr(runner, "request_bytes"):
+                    case["request_bytes"] = runner.request_bytes(batch_size)
+                if hasattr(runner, "conformant"):
+                    case["conformant"] = runner.conformant(batch_size)
+                case.update(run_case(runner, args.image_data, batch_size, concurrency, args, mode))
+                print(json.dumps(case), file=sys.stderr, flush=True)
+                results.append(case)
+
+    report = json.dumps({"results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+    return results
+
+
+if __name__ == "__main__":
+    main()
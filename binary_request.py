@@ -0,0 +1,211 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : binary_request.py
+@Time    : 2026/10/18 21:03:27
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 二进制请求体解析及构造, 图片以原始jpeg/png字节上传, 不再经过base64及json
+
+支持三种格式, 与json请求共用同一个predict地址, 以Content-Type区分(server.TransformerPredictHandler将请求体原样传给preprocess):
+    1. multipart/form-data: 每个带filename的part为一张图片, 按顺序对应返回结果
+    2. KServe v2 binary tensor扩展: 请求头Inference-Header-Content-Length给出json头长度,
+       json头中一个BYTES类型输入(shape [N]), 数据区中每张图片为4字节小端长度加图片字节
+    3. application/octet-stream或image/*: 整个请求体为一张图片
+解析结果为指向请求体的memoryview, 解码时直接np.frombuffer交给cv2.imdecode, 不产生中间拷贝。
+'''
+
+import json
+import uuid
+import struct
+
+
+def get_header(headers, name):
+    """不区分大小写读取请求头, name为小写"""
+    if not headers:
+        return None
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+BINARY_CONTENT_TYPES = ("multipart/", "image/", "application/octet-stream")
+
+
+def is_binary_request(headers):
+    """按请求头判断是否为二进制请求, 没有Content-Type的请求仍按json处理"""
+    if get_header(headers, "inference-header-content-length") is not None:
+        return True
+    content_type = (get_header(headers, "content-type") or "").lower()
+    return content_type.startswith(BINARY_CONTENT_TYPES)
+
+
+def parse_binary_request(body, headers=None):
+    """解析二进制请求体
+
+    Args:
+        body (bytes): 原始请求体
+        headers (dict, optional): 请求头, 没有请求头时multipart按请求体第一行确定boundary. Defaults to None.
+
+    Returns:
+        list: 每张图片的memoryview
+
+    Raises:
+        ValueError: 请求体格式错误
+    """
+    if isinstance(body, memoryview):
+        # 需要bytes.find, handler传入的请求体本身为bytes, 不会走到这里
+        body = body.tobytes()
+    content_type = get_header(headers, "content-type") or ""
+
+    header_length = get_header(headers, "inference-header-content-length")
+    if header_length is not None:
+        return parse_v2_binary(body, int(header_length))
+    if content_type.startswith("multipart/") or body[:2] == b"--":
+        return [view for _, filename, view in parse_multipart(body, content_type) if filename is not None]
+    if len(body) == 0:
+        raise ValueError("empty request body")
+    return [memoryview(body)]
+
+
+def parse_multipart(body, content_type=None):
+    """解析multipart/form-data请求体
+
+    Args:
+        body (bytes): 原始请求体
+        content_type (str, optional): Content-Type请求头, 不含boundary时取请求体第一行. Defaults to None.
+
+    Returns:
+        list: (name, filename, memoryview)列表, 非文件字段的filename为None
+    """
+    boundary = None
+    for param in (content_type or "").split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary":
+            boundary = value.strip('"').encode("latin-1")
+    if boundary is None:
+        line_end = body.find(b"\r\n")
+        if body[:2] != b"--" or line_end < 0:
+            raise ValueError("invalid multipart body, boundary not found")
+        boundary = body[2:line_end]
+
+    delimiter = b"--" + boundary
+    view = memoryview(body)
+    pos = body.find(delimiter)
+    if pos < 0:
+        raise ValueError("invalid multipart body, boundary not found")
+
+    parts = []
+    while True:
+        pos += len(delimiter)
+        if body[pos:pos + 2] == b"--":
+            break
+        header_end = body.find(b"\r\n\r\n", pos)
+        if header_end < 0:
+            raise ValueError("invalid multipart body, part headers not terminated")
+        name, filename = _content_disposition(body[pos:header_end].decode("latin-1"))
+        start = header_end + 4
+        end = body.find(b"\r\n" + delimiter, start)
+        if end < 0:
+            raise ValueError("invalid multipart body, closing boundary not found")
+        parts.append((name, filename, view[start:end]))
+        pos = end + 2
+    return parts
+
+
+def _content_disposition(part_headers):
+    name, filename = None, None
+    for line in part_headers.split("\r\n"):
+        key, _, value = line.partition(":")
+        if key.strip().lower() != "content-disposition":
+            continue
+        for param in value.split(";")[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "name":
+                name = value.strip('"')
+            elif key == "filename":
+                filename = value.strip('"')
+    return name, filename
+
+
+def parse_v2_binary(body, header_length):
+    """解析KServe v2 binary tensor扩展的请求体, 取第一个BYTES类型输入的各个元素
+
+    Args:
+        body (bytes): 原始请求体
+        header_length (int): json头长度(Inference-Header-Content-Length)
+
+    Returns:
+        list: 每张图片的memoryview
+    """
+    try:
+        header = json.loads(body[:header_length])
+    except ValueError as e:
+        raise ValueError("invalid inference header: {}".format(e))
+
+    view = memoryview(body)
+    offset = header_length
+    for tensor in header.get("inputs", []):
+        size = tensor.get("parameters", {}).get("binary_data_size")
+        if size is None:
+            continue
+        if tensor.get("datatype") == "BYTES":
+            return _split_bytes_tensor(view[offset: offset + size])
+        offset += size
+    raise ValueError("no binary BYTES input found in the inference request")
+
+
+def _split_bytes_tensor(view):
+    # BYTES张量: 每个元素为4字节小端长度加数据
+    items = []
+    offset = 0
+    while offset < len(view):
+        if offset + 4 > len(view):
+            raise ValueError("invalid BYTES tensor data")
+        size, = struct.unpack_from("<I", view, offset)
+        offset += 4
+        if offset + size > len(view):
+            raise ValueError("invalid BYTES tensor data")
+        items.append(view[offset: offset + size])
+        offset += size
+    return items
+
+
+def encode_multipart(buffers, field="item"):
+    """构造multipart/form-data请求体
+
+    Args:
+        buffers (list): 图片编码后的字节列表
+        field (str, optional): 表单字段名. Defaults to "item".
+
+    Returns:
+        tuple: (请求体, Content-Type)
+    """
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for i, buffer in enumerate(buffers):
+        chunks.append("--{}\r\nContent-Disposition: form-data; name=\"{}\"; filename=\"{}\"\r\n"
+                      "Content-Type: application/octet-stream\r\n\r\n".format(boundary, field, i).encode())
+        chunks.append(bytes(buffer))
+        chunks.append(b"\r\n")
+    chunks.append("--{}--\r\n".format(boundary).encode())
+    return b"".join(chunks), "multipart/form-data; boundary={}".format(boundary)
+
+
+def encode_v2_binary(buffers, input_name="image"):
+    """构造KServe v2 binary tensor扩展的请求体
+
+    Args:
+        buffers (list): 图片编码后的字节列表
+        input_name (str, optional): 输入名称. Defaults to "image".
+
+    Returns:
+        tuple: (请求体, 请求头)
+    """
+    data = b"".join(struct.pack("<I", len(buffer)) + bytes(buffer) for buffer in buffers)
+    header = json.dumps({"inputs": [{
+        "name": input_name, "shape": [len(buffers)], "datatype": "BYTES",
+        "parameters": {"binary_data_size": len(data)}}]}).encode()
+    headers = {"Content-Type": "application/octet-stream", "Inference-Header-Content-Length": str(len(header))}
+    return header + data, headers
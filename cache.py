@@ -0,0 +1,131 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : cache.py
+@Time    : 2026/10/18 14:20:37
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 按图片内容hash缓存人脸质量分数, 重复发送的图片不再解码和调用triton
+'''
+
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from . import metrics
+
+
+def hash_item(item):
+    """计算图片item的hash
+
+    base64的item直接对原始字符串做hash(base64文本与图片字节一一对应, 无需先解码);
+    url/path的item以地址本身作为标识, 只用于同一请求内的去重, 不写入缓存(见cacheable_item)。
+
+    Args:
+        item (str): 图片item, path, url或base64编码
+
+    Returns:
+        bytes: 16字节摘要
+    """
+    return hashlib.blake2b(item.encode(), digest_size=16).digest()
+
+
+def cacheable_item(item):
+    """item的hash能否作为缓存key: 只有base64的item, url/path指向的图片可能被替换, 按地址缓存会返回旧图片的分数"""
+    return item[:4] == "data"
+
+
+def hash_buffer(buffer):
+    """计算二进制请求中图片字节的内容hash, buffer可以是bytes或memoryview
+
+    与hash_item的结果不互通, 同一张图片分别以base64和二进制发送时各自缓存。
+    """
+    return hashlib.blake2b(buffer, digest_size=16).digest()
+
+
+class ScoreCache():
+    """有界LRU/TTL分数缓存, 线程安全
+
+    key为(model_name, model_version, 内容hash), 只在相同模型名称及版本之间命中。
+    超出条目数或内存上限时淘汰最久未使用的条目, 过期条目在访问时删除。
+    """
+
+    def __init__(self, model_name, model_version="", max_entries=100000, max_bytes=64 << 20, ttl=3600):
+        """
+        Args:
+            model_name (str): 模型名称.
+            model_version (str, optional): 模型版本. Defaults to "".
+            max_entries (int, optional): 最大条目数. Defaults to 100000.
+            max_bytes (int, optional): 缓存估算内存上限(字节). Defaults to 64MB.
+            ttl (float, optional): 条目有效期(秒), 0表示不过期. Defaults to 3600.
+        """
+        self.namespace = (model_name, model_version)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, digest):
+        """查询缓存, 未命中或已过期时返回None"""
+        key = self.namespace + (digest,)
+        expired = False
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl > 0 and entry[1] < time.time():
+                self._remove(key)
+                entry, expired = None, True
+            if entry is None:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+            entries, size = len(self._data), self._bytes
+        metrics.observe_cache_lookup(entry is not None)
+        if expired:
+            metrics.observe_cache_size(entries, size)
+        return entry[0] if entry is not None else None
+
+    def put(self, digest, score):
+        key = self.namespace + (digest,)
+        expire = time.time() + self.ttl
+        evictions = 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (score, expire, self._entry_size(key, score))
+            self._bytes += self._data[key][2]
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                evictions += 1
+            self.evictions += evictions
+            entries, size = len(self._data), self._bytes
+        metrics.observe_cache_size(entries, size, evictions)
+
+    def stats(self):
+        """命中/未命中/淘汰计数及当前占用, 同样以prometheus指标facequality_cache_*暴露"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+            }
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    @staticmethod
+    def _entry_size(key, score):
+        # 估算单个条目内存: key元组, 摘要, 分数及OrderedDict节点开销
+        return sys.getsizeof(key) + sys.getsizeof(key[-1]) + sys.getsizeof(score) + 100
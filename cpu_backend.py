@@ -0,0 +1,386 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : cpu_backend.py
+@Time    : 2026/10/18 20:14:05
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 基于ONNX Runtime的CPU推理后端, 接口与TritonGrpcClient/TritonHttpClient一致, 可单独使用,
+           也可作为triton不可用或延迟过高时的降级/分流后端
+
+onnxruntime为可选依赖, 只在使用CPU后端时需要安装。
+'''
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tritonclient.utils import InferenceServerException
+
+from .triton_client import ModelSpec, _batch_size
+from . import admission
+from . import metrics
+
+
+# 降级到CPU的triton错误状态: 连接失败(没有状态), 不可用, 超时及服务端内部错误; 请求本身的错误(4xx, INVALID_ARGUMENT)不降级
+_FAILOVER_STATUSES = (None, "StatusCode.UNAVAILABLE", "StatusCode.DEADLINE_EXCEEDED", "StatusCode.CANCELLED",
+                      "StatusCode.RESOURCE_EXHAUSTED", "StatusCode.INTERNAL", "StatusCode.UNKNOWN",
+                      "500", "502", "503", "504")
+
+# onnx张量类型对应的triton datatype
+_ONNX_DATATYPES = {"tensor(float)": "FP32", "tensor(float16)": "FP16", "tensor(uint8)": "UINT8", "tensor(int64)": "INT64"}
+
+
+class OnnxInferResult():
+    """CPU推理结果, 与InferResult一样通过as_numpy取输出"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def as_numpy(self, name):
+        return self.outputs.get(name)
+
+
+class OnnxAsyncRequest():
+    """is_async=True时返回的句柄, 与http客户端的InferAsyncRequest一样通过get_result取结果"""
+
+    def __init__(self, future):
+        self._future = future
+
+    def get_result(self, block=True, timeout=None):
+        return self._future.result(timeout=timeout)
+
+
+class OnnxRuntimeClient():
+    """ONNX Runtime CPU推理客户端
+
+    推理在容量为workers的线程池中执行, 同时运行的session.run不超过workers个,
+    每个session.run使用threads个线程。模型输入输出名称与请求中的名称不一致时按位置对应。
+    """
+
+    transport = "cpu"
+
+    def __init__(self, model_path, threads=4, workers=1):
+        """
+        Args:
+            model_path (str): onnx模型文件路径.
+            threads (int, optional): 单次推理使用的线程数(intra_op_num_threads). Defaults to 4.
+            workers (int, optional): 同时执行的推理数. Defaults to 1.
+        """
+        # 只在使用CPU后端时导入
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("onnxruntime is required by the cpu backend, please install onnxruntime")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.model_path = model_path
+
+        self.input_names = [tensor.name for tensor in self.session.get_inputs()]
+        self.input_dtypes = [np.float16 if tensor.type == "tensor(float16)" else np.float32
+                             for tensor in self.session.get_inputs()]
+        self.output_names = [tensor.name for tensor in self.session.get_outputs()]
+
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cpu-infer")
+        print("cpu backend: {}, threads {}, workers {}".format(model_path, threads, workers))
+
+    def get_model_metadata(self, model_name, model_version=""):
+        """与triton相同格式的模型元数据, 由onnx模型的输入输出生成"""
+        def tensors(items):
+            return [{"name": tensor.name, "shape": [d if isinstance(d, int) else -1 for d in tensor.shape],
+                     "datatype": _ONNX_DATATYPES.get(tensor.type, tensor.type)} for tensor in items]
+        return {"name": model_name, "versions": [], "platform": "onnxruntime_onnx",
+                "inputs": tensors(self.session.get_inputs()), "outputs": tensors(self.session.get_outputs())}
+
+    def get_model_config(self, model_name, model_version=""):
+        """与triton相同格式的模型配置, onnx模型的batch维为动态维度, max_batch_size为0"""
+        return {"name": model_name, "max_batch_size": 0}
+
+    def load_model(self, model_name, spec=None):
+        """获取模型元数据及配置, CPU后端直接调用onnxruntime, 不构造请求模板"""
+        if spec is None:
+            spec = ModelSpec.from_triton(self.get_model_metadata(model_name), self.get_model_config(model_name))
+        return spec
+
+    def infer(self, model_name, input_dict, output_name_list, is_async=False, output_shm=None):
+        """CPU推理, 参数与TritonHttpClient.infer一致, model_name不使用
+
+        Returns:
+            OnnxAsyncRequest or OnnxInferResult: is_async为True时返回句柄, 否则返回推理结果.
+        """
+        if output_shm:
+            raise ValueError("shared memory transport is not supported by the cpu backend")
+        labels = metrics.labels_for(self.transport)
+        deadline = admission.request_deadline.get()
+        if is_async:
+            # 调用方在返回后即归还输入缓冲区
+            input_dict = {key: value.copy() for key, value in input_dict.items()}
+            return OnnxAsyncRequest(self.executor.submit(self._run, input_dict, output_name_list, labels, deadline))
+        return self.executor.submit(self._run, input_dict, output_name_list, labels, deadline).result()
+
+    def async_infer(self, model_name, input_dict, output_name_list, callback, output_shm=None):
+        """CPU异步推理, 参数与TritonGrpcClient.async_infer一致, 完成后调用callback(result, error)"""
+        if output_shm:
+            raise ValueError("shared memory transport is not supported by the cpu backend")
+        labels = metrics.labels_for(self.transport)
+        deadline = admission.request_deadline.get()
+        input_dict = {key: value.copy() for key, value in input_dict.items()}
+
+        def run():
+            try:
+                result = self._run(input_dict, output_name_list, labels, deadline)
+            except Exception as e:
+                callback(None, e)
+                return
+            callback(result, None)
+        self.executor.submit(run)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def _run(self, input_dict, output_name_list, labels, deadline=None):
+        # 在线程池中排队期间已超过截止时间的请求不再推理
+        admission.check_deadline("cpu_infer", deadline)
+        feeds = {}
+        for i, (name, value) in enumerate(input_dict.items()):
+            index = self.input_names.index(name) if name in self.input_names else i
+            dtype = self.input_dtypes[index]
+            feeds[self.input_names[index]] = value if value.dtype == dtype else value.astype(dtype)
+
+        with metrics.timed("cpu_infer", _batch_size(input_dict), labels):
+            values = self.session.run(None, feeds)
+
+        outputs = dict(zip(self.output_names, values))
+        return OnnxInferResult({
+            name: outputs[name] if name in outputs else values[i]
+            for i, name in enumerate(output_name_list)})
+
+
+class FallbackAsyncRequest():
+    """FallbackClient在is_async=True时返回的句柄, triton调用失败时在get_result中改由CPU重试"""
+
+    def __init__(self, client, request, retry_args, on_cpu):
+        self.client = client
+        self.request = request
+        self.retry_args = retry_args
+        self.on_cpu = on_cpu
+        self.t1 = time.perf_counter()
+
+    def get_result(self, block=True, timeout=None):
+        if self.on_cpu:
+            try:
+                return self.request.get_result(block=block, timeout=timeout)
+            finally:
+                self.client._end_cpu()
+
+        try:
+            result = self.request.get_result(block=block, timeout=timeout)
+        except Exception as e:
+            if not triton_unavailable(e):
+                raise
+            self.client._fail(e)
+            self.client._begin_cpu()
+            try:
+                return self.client.fallback.infer(*self.retry_args)
+            finally:
+                self.client._end_cpu()
+        self.client._record(time.perf_counter() - self.t1)
+        return result
+
+
+class FallbackClient():
+    """triton客户端加CPU后备, 接口与被包装的triton客户端一致
+
+    两种模式:
+        failover: triton调用失败或平均延迟超过阈值时, retry_interval秒内全部请求改走CPU, 之后重新尝试triton。
+        overflow: triton平均延迟超过阈值时, 在CPU有空闲(在途请求数小于CPU后端的workers)时把新请求分流到CPU;
+            triton调用失败时与failover相同。
+    triton调用失败的请求会在CPU上重试一次。只有triton不可用的错误(见triton_unavailable)才降级,
+    客户端的错误(如请求已超过截止时间, 输入与模型不一致)直接抛出。triton延迟按指数滑动平均统计。
+    """
+
+    def __init__(self, primary, fallback, mode="failover", latency_threshold_ms=100, retry_interval=5, alpha=0.2):
+        """
+        Args:
+            primary (TritonGrpcClient or TritonHttpClient): triton同步客户端.
+            fallback (OnnxRuntimeClient): CPU推理客户端.
+            mode (str, optional): failover或overflow. Defaults to "failover".
+            latency_threshold_ms (float, optional): triton平均延迟阈值(毫秒). Defaults to 100.
+            retry_interval (float, optional): 降级后重新尝试triton的间隔(秒). Defaults to 5.
+            alpha (float, optional): 延迟滑动平均的权重. Defaults to 0.2.
+        """
+        if mode not in ("failover", "overflow"):
+            raise ValueError("invalid fallback mode: {}, must be failover or overflow".format(mode))
+        self.primary = primary
+        self.fallback = fallback
+        self.mode = mode
+        self.transport = primary.transport
+        self.latency_threshold = latency_threshold_ms / 1000.0
+        self.retry_interval = retry_interval
+        self.alpha = alpha
+
+        self._latency = None
+        self._down_until = 0.0
+        self._cpu_inflight = 0
+        self._lock = threading.Lock()
+
+    def infer(self, model_name, input_dict, output_name_list, is_async=False, output_shm=None):
+        if output_shm:
+            raise ValueError("shared memory transport is not supported with the cpu fallback")
+        if self._route():
+            if is_async:
+                request = self.fallback.infer(model_name, input_dict, output_name_list, is_async=True)
+                return FallbackAsyncRequest(self, request, None, on_cpu=True)
+            try:
+                return self.fallback.infer(model_name, input_dict, output_name_list)
+            finally:
+                self._end_cpu()
+
+        if is_async:
+            # 调用返回后输入缓冲区即被归还, triton失败时重试需要保留一份拷贝
+            retry_inputs = {key: value.copy() for key, value in input_dict.items()}
+            retry_args = (model_name, retry_inputs, output_name_list)
+            try:
+                request = self.primary.infer(model_name, input_dict, output_name_list, is_async=True)
+            except Exception as e:
+                if not triton_unavailable(e):
+                    raise
+                self._fail(e)
+                self._begin_cpu()
+                request = self.fallback.infer(model_name, retry_inputs, output_name_list, is_async=True)
+                return FallbackAsyncRequest(self, request, None, on_cpu=True)
+            return FallbackAsyncRequest(self, request, retry_args, on_cpu=False)
+
+        t1 = time.perf_counter()
+        try:
+            result = self.primary.infer(model_name, input_dict, output_name_list)
+        except Exception as e:
+            if not triton_unavailable(e):
+                raise
+            self._fail(e)
+            self._begin_cpu()
+            try:
+                return self.fallback.infer(model_name, input_dict, output_name_list)
+            finally:
+                self._end_cpu()
+        self._record(time.perf_counter() - t1)
+        return result
+
+    def async_infer(self, model_name, input_dict, output_name_list, callback, output_shm=None):
+        if output_shm:
+            raise ValueError("shared memory transport is not supported with the cpu fallback")
+        if self._route():
+            self._fallback_async(model_name, input_dict, output_name_list, callback)
+            return
+
+        # 调用返回后输入缓冲区即被归还, triton失败时重试需要保留一份拷贝
+        retry_inputs = {key: value.copy() for key, value in input_dict.items()}
+        t1 = time.perf_counter()
+
+        def primary_callback(result, error):
+            if error is None:
+                self._record(time.perf_counter() - t1)
+                callback(result, None)
+                return
+            if not triton_unavailable(error):
+                callback(None, error)
+                return
+            self._fail(error)
+            self._begin_cpu()
+            self._fallback_async(model_name, retry_inputs, output_name_list, callback)
+
+        try:
+            self.primary.async_infer(model_name, input_dict, output_name_list, callback=primary_callback)
+        except Exception as e:
+            if not triton_unavailable(e):
+                raise
+            self._fail(e)
+            self._begin_cpu()
+            self._fallback_async(model_name, retry_inputs, output_name_list, callback)
+
+    def get_model_metadata(self, model_name, model_version=""):
+        """triton的模型元数据, 输入按triton格式构造, CPU后端推理时再转换为onnx模型的类型"""
+        return self.primary.get_model_metadata(model_name, model_version)
+
+    def get_model_config(self, model_name, model_version=""):
+        return self.primary.get_model_config(model_name, model_version)
+
+    def load_model(self, model_name, spec=None):
+        """按triton的模型元数据及配置构造请求模板, CPU后端推理时不使用"""
+        return self.primary.load_model(model_name, spec)
+
+    def close(self):
+        if hasattr(self.primary, "close"):
+            self.primary.close()
+        self.fallback.close()
+
+    def _fallback_async(self, model_name, input_dict, output_name_list, callback):
+        # 调用前已计入_cpu_inflight
+        def cpu_callback(result, error):
+            self._end_cpu()
+            callback(result, error)
+
+        try:
+            self.fallback.async_infer(model_name, input_dict, output_name_list, callback=cpu_callback)
+        except Exception:
+            self._end_cpu()
+            raise
+
+    def _route(self):
+        """本次请求是否改走CPU, 返回True时已计入_cpu_inflight"""
+        with self._lock:
+            if time.time() < self._down_until:
+                use_cpu = True
+            elif self.mode == "overflow":
+                use_cpu = (self._latency is not None and self._latency > self.latency_threshold
+                           and self._cpu_inflight < self.fallback.workers)
+            else:
+                use_cpu = False
+            if use_cpu:
+                self._cpu_inflight += 1
+            return use_cpu
+
+    def _begin_cpu(self):
+        with self._lock:
+            self._cpu_inflight += 1
+
+    def _end_cpu(self):
+        with self._lock:
+            self._cpu_inflight -= 1
+
+    def _record(self, seconds):
+        with self._lock:
+            if self._latency is None:
+                self._latency = seconds
+            else:
+                self._latency = self.alpha * seconds + (1 - self.alpha) * self._latency
+            if self.mode == "failover" and self._latency > self.latency_threshold:
+                self._trip("latency {:.1f}ms over threshold".format(self._latency * 1000))
+
+    def _fail(self, error):
+        with self._lock:
+            self._trip("inference failed: {}".format(error))
+
+    def _trip(self, reason):
+        # 调用方持有_lock
+        if time.time() >= self._down_until:
+            print("triton {}, fallback to cpu for {}s".format(reason, self.retry_interval))
+        self._down_until = time.time() + self.retry_interval
+        self._latency = None
+
+
+def triton_unavailable(error):
+    """triton调用错误是否为triton不可用(连接失败, 超时或服务端错误), 只有这类错误降级到CPU;
+    客户端的错误(请求已超过截止时间, 请求模板校验失败等)直接抛给调用方, 不影响其他请求"""
+    if isinstance(error, admission.DeadlineExceeded):
+        return False
+    if isinstance(error, InferenceServerException):
+        return error.status() in _FAILOVER_STATUSES
+    return isinstance(error, (ConnectionError, TimeoutError, OSError))
@@ -9,13 +9,13 @@
 '''
 
 
-import time
 import requests
 import cv2
 import base64
 import json
 from common_data_type.request import Request,MultiRequest
 from common_data_type.response import Response, ResponseItem, ExtraInfo, MultiResponse
+from binary_request import encode_multipart
 
 # 本地测试
 url = "http://127.0.0.1:8080/v1/models/facequality:predict"
@@ -32,15 +32,21 @@ headers = {
 print("url:", url)
 img = cv2.imread("data/1-Harry_Belafonte_1.jpg")
 _, buffer = cv2.imencode(".png", img)
-b64code = base64.b64encode(buffer)
+b64code = base64.b64encode(buffer).decode()
 
 # 是否启动批量数据发送
 mutlti_request = False
 mutlti_request = True
 
-count = 2
+# 是否以multipart上传原始图片字节(不经过base64及json)
+binary_request = False
+
 batch = 16
-if mutlti_request:
+if binary_request:
+    body, content_type = encode_multipart([buffer.tobytes()] * batch)
+    result = requests.post(headers=dict(headers, **{"Content-Type": content_type}), url=url, data=body)
+
+elif mutlti_request:
     b64code = f"data:image/jpeg;base64,{b64code}"
     
     multi_req = []
@@ -48,43 +54,19 @@ if mutlti_request:
         request = Request(**{"data": {"item": b64code}})
         multi_req.append(request)
     multirequest = MultiRequest(multi_data=multi_req)
-    
-    for i in range(count):
-        if i==1:
-            t1 = time.time()
-        result = requests.post(headers=headers, url=url, json=multirequest.dict())
-        if i%10 ==0:
-            print(i, result)
-    t2 = time.time() 
+    result = requests.post(headers=headers, url=url, json=multirequest.dict())
     
 else:
     b64code = f"data:image/jpeg;base64,{b64code}"
     request = Request(**{"data": {"item": b64code},
                     "extra_info": {"type": "subtitle-only"}})
-                    
-    for i in range(count):
-        if i==1:
-            t1 = time.time()
-        result = requests.post(headers=headers, url=url, json=request.dict())
-        print(i, result)
-    t2 = time.time() 
+    result = requests.post(headers=headers, url=url, json=request.dict())
 
-count = count-1
-print("total time cost:", t2-t1, "average time cost:",(t2-t1)/count)
-# print("total time cost:", t2-t1, "average time cost:",(t2-t1)/count)
-print("| ", batch, "|" ,t2-t1," | ",(t2-t1)/count,"s")
+print(result)
 response = MultiResponse(**json.loads(result.text))
 
 print("-"*20)
 print(response.multi_data)
 
-# 压力测试
-from locust import HttpUser, task
-# locust -f locust_stress_test.py
-class TransformerTestCase(HttpUser):
-    
-    @task
-    def stress_test(self):
-        self.client.headers["Host"] = headers["Host"]
-        self.client.post(url=url, json=request.dict())
-
+# 性能压测见benchmark.py:
+# python -m facequality_transformer.benchmark --target transformer --url <url> --host <Host header>
@@ -0,0 +1,230 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : metrics.py
+@Time    : 2026/10/18 18:32:16
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 各处理阶段耗时统计, 以prometheus直方图暴露, 可选输出OpenTelemetry span
+
+阶段: decode(请求解析及图片解码), preprocess(resize及归一化), request_build(构造triton请求),
+triton_rpc(triton调用), cpu_infer(CPU后端推理), postprocess(组装返回结果), serialize(返回结果转dict)。
+标签: stage, req_type(Request/MultiRequest), batch_size(按2的幂分桶), transport(grpc/http/cpu)。
+被拒绝(overload)及因超过截止时间而取消(deadline_<阶段>)的请求数以facequality_requests_shed_total计数。
+开启分数缓存时另有facequality_cache_*指标: 查询命中/未命中数, 淘汰数, 当前条目数及估算内存。
+开启自动调优时另有facequality_tuner_*指标: 当前选定的batch上限及在途请求数, 以及启动探测各组合的p95延迟及吞吐。
+启动各阶段(import, clients, model_config, setup, warmup)的耗时以facequality_startup_seconds记录。
+多进程(kserve --workers)时各worker进程的指标写入PROMETHEUS_MULTIPROC_DIR下的文件, 由主进程的指标端口汇总:
+计数, 直方图及缓存占用按进程求和, 启动耗时取各进程最大值, 自动调优的选定值按pid分别给出。
+prometheus_client及opentelemetry均为可选依赖, 未安装时对应功能不生效。
+'''
+
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, start_http_server
+    from prometheus_client import multiprocess
+except ImportError:
+    CollectorRegistry = None
+    REGISTRY = None
+    multiprocess = None
+    Counter = None
+    Gauge = None
+    Histogram = None
+    start_http_server = None
+
+try:
+    from opentelemetry import trace, context as otel_context
+except ImportError:
+    trace = None
+    otel_context = None
+
+
+STAGE_LATENCY = None
+if Histogram is not None:
+    STAGE_LATENCY = Histogram(
+        "facequality_stage_latency_seconds",
+        "Latency of each transformer pipeline stage.",
+        ["stage", "req_type", "batch_size", "transport"],
+        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+REQUESTS_SHED = None
+if Counter is not None:
+    REQUESTS_SHED = Counter(
+        "facequality_requests_shed_total", "Requests rejected on overload or cancelled after their deadline.", ["reason"])
+
+TUNER_BATCH_SIZE = None
+TUNER_CONCURRENCY = None
+TUNER_PROBE_P95 = None
+TUNER_PROBE_THROUGHPUT = None
+if Gauge is not None:
+    TUNER_BATCH_SIZE = Gauge("facequality_tuner_batch_size", "Batch size cap selected by the auto tuner.")
+    TUNER_CONCURRENCY = Gauge("facequality_tuner_concurrency", "In-flight request limit selected by the auto tuner.")
+    TUNER_PROBE_P95 = Gauge(
+        "facequality_tuner_probe_p95_seconds", "p95 latency measured by the auto tuner probe.",
+        ["batch_size", "concurrency"])
+    TUNER_PROBE_THROUGHPUT = Gauge(
+        "facequality_tuner_probe_images_per_second", "Throughput measured by the auto tuner probe.",
+        ["batch_size", "concurrency"])
+
+CACHE_LOOKUPS = None
+CACHE_EVICTIONS = None
+CACHE_ENTRIES = None
+CACHE_BYTES = None
+if Counter is not None:
+    CACHE_LOOKUPS = Counter("facequality_cache_lookups_total", "Score cache lookups by result.", ["result"])
+    CACHE_EVICTIONS = Counter("facequality_cache_evictions_total", "Score cache entries evicted by the size limits.")
+    CACHE_ENTRIES = Gauge("facequality_cache_entries", "Entries held in the score cache.", multiprocess_mode="livesum")
+    CACHE_BYTES = Gauge("facequality_cache_bytes", "Estimated memory held by the score cache.",
+                        multiprocess_mode="livesum")
+
+STARTUP_SECONDS = None
+if Gauge is not None:
+    STARTUP_SECONDS = Gauge("facequality_startup_seconds", "Duration of each transformer startup phase.", ["phase"],
+                            multiprocess_mode="max")
+
+# 当前请求的标签, 在Transformer.preprocess中设置, 同一请求的后续阶段共用
+request_labels = contextvars.ContextVar(
+    "facequality_request_labels", default={"req_type": "unknown", "transport": "unknown"})
+
+_tracer = None
+_request_span = contextvars.ContextVar("facequality_request_span", default=None)
+
+
+def enable_tracing():
+    """开启OpenTelemetry span, 需另行配置opentelemetry sdk及exporter"""
+    global _tracer
+    if trace is None:
+        print("opentelemetry is not installed, tracing disabled")
+        return
+    _tracer = trace.get_tracer("facequality_transformer")
+
+
+def start_metrics_server(port):
+    """在独立端口上暴露prometheus指标(/metrics)"""
+    if start_http_server is None:
+        print("prometheus_client is not installed, metrics endpoint disabled")
+        return False
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # 多进程: 汇总各worker进程的指标文件
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
+    print("metrics endpoint: http://0.0.0.0:{}/metrics".format(port))
+    return True
+
+
+def set_request_labels(req_type, transport):
+    request_labels.set({"req_type": req_type, "transport": transport})
+
+
+def labels_for(transport):
+    """当前请求的标签, transport替换为实际调用triton的协议"""
+    labels = request_labels.get()
+    if labels["transport"] == transport:
+        return labels
+    return dict(labels, transport=transport)
+
+
+def batch_bucket(batch_size):
+    """batch大小向上取整到2的幂, 控制标签基数"""
+    if batch_size > 64:
+        return "64+"
+    bucket = 1
+    while bucket < batch_size:
+        bucket *= 2
+    return str(bucket)
+
+
+def observe(stage, seconds, batch_size, labels=None):
+    """记录一次阶段耗时, labels为None时使用当前请求的标签"""
+    if STAGE_LATENCY is None:
+        return
+    if labels is None:
+        labels = request_labels.get()
+    STAGE_LATENCY.labels(stage, labels["req_type"], batch_bucket(batch_size), labels["transport"]).observe(seconds)
+
+
+@contextmanager
+def timed(stage, batch_size, labels=None):
+    """统计with代码块的耗时, 开启tracing时同时生成一个span"""
+    t1 = time.perf_counter()
+    if _tracer is None:
+        yield
+    else:
+        with _tracer.start_as_current_span(stage) as span:
+            span.set_attribute("facequality.batch_size", batch_size)
+            yield
+    observe(stage, time.perf_counter() - t1, batch_size, labels)
+
+
+def begin_request_span(req_type):
+    """开始一个请求级span, 之后各阶段的span作为其子span"""
+    if _tracer is None:
+        return
+    span = _tracer.start_span("facequality.request", attributes={"facequality.req_type": req_type})
+    token = otel_context.attach(trace.set_span_in_context(span))
+    _request_span.set((span, token))
+
+
+def end_request_span():
+    if _tracer is None:
+        return
+    current = _request_span.get()
+    if current is None:
+        return
+    span, token = current
+    _request_span.set(None)
+    otel_context.detach(token)
+    span.end()
+
+
+def observe_shed(reason):
+    """记录一个被拒绝或因超时取消的请求"""
+    if Counter is None:
+        return
+    REQUESTS_SHED.labels(reason).inc()
+
+
+def observe_tuner_decision(batch_size, concurrency):
+    """记录自动调优当前选定的batch上限及在途请求数"""
+    if Gauge is None:
+        return
+    TUNER_BATCH_SIZE.set(batch_size)
+    TUNER_CONCURRENCY.set(concurrency)
+
+
+def observe_tuner_probe(batch_size, concurrency, p95, throughput):
+    """记录自动调优探测一个组合的结果"""
+    if Gauge is None:
+        return
+    TUNER_PROBE_P95.labels(batch_size, concurrency).set(p95)
+    TUNER_PROBE_THROUGHPUT.labels(batch_size, concurrency).set(throughput)
+
+
+def observe_cache_lookup(hit):
+    """记录一次分数缓存查询"""
+    if Counter is None:
+        return
+    CACHE_LOOKUPS.labels("hit" if hit else "miss").inc()
+
+
+def observe_cache_size(entries, size, evictions=0):
+    """记录分数缓存的条目数, 估算内存及本次写入淘汰的条目数"""
+    if Counter is None:
+        return
+    if evictions:
+        CACHE_EVICTIONS.inc(evictions)
+    CACHE_ENTRIES.set(entries)
+    CACHE_BYTES.set(size)
+
+
+def observe_startup(phase, seconds):
+    """记录一个启动阶段的耗时"""
+    if STARTUP_SECONDS is None:
+        return
+    STARTUP_SECONDS.labels(phase).set(seconds)
@@ -0,0 +1,675 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : mock_triton.py
+@Time    : 2026/10/18 19:26:40
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 模拟triton推理服务, 实现KServe v2 HTTP及gRPC推理接口, 用于无GPU环境下的联调, 测试及压测
+
+模拟服务提供face_quality_trt_fp16模型(输入input.1: [-1, 3, 112, 112] FP32, 输出1346: [-1, 1] FP32),
+分数由输入张量确定性计算得到。支持注入固定延迟, 随机抖动, 按图片数增加的延迟及随机错误,
+支持系统共享内存输入输出, TritonHttpClient, TritonGrpcClient及Transformer无需修改即可连接。
+
+使用示例:
+    # 独立进程
+    python -m facequality_transformer.mock_triton --http_port 8000 --grpc_port 8001 --latency_ms 2 --jitter_ms 0.5
+
+    # 进程内, 端口为0时自动分配
+    server = MockTritonServer(latency_ms=2).start()
+    client = TritonGrpcClient(server.grpc_url)
+    ...
+    server.stop()
+'''
+
+import os
+import re
+import json
+import mmap
+import time
+import queue
+import random
+import argparse
+import threading
+from collections import Counter
+from concurrent import futures
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import grpc
+from tritonclient.utils import triton_to_np_dtype, np_to_triton_dtype
+from tritonclient.grpc import service_pb2, service_pb2_grpc, model_config_pb2, MAX_GRPC_MESSAGE_SIZE
+
+
+class MockError(Exception):
+    """模拟服务返回的错误, status对应KServe v2错误类型"""
+
+    HTTP_STATUS = {"INVALID_ARG": 400, "NOT_FOUND": 404, "UNAVAILABLE": 503, "INTERNAL": 500}
+    GRPC_STATUS = {
+        "INVALID_ARG": grpc.StatusCode.INVALID_ARGUMENT,
+        "NOT_FOUND": grpc.StatusCode.NOT_FOUND,
+        "UNAVAILABLE": grpc.StatusCode.UNAVAILABLE,
+        "INTERNAL": grpc.StatusCode.INTERNAL,
+    }
+
+    def __init__(self, message, status="INVALID_ARG"):
+        super().__init__(message)
+        self.status = status
+
+
+class MockFaceQualityModel():
+    """模拟的人脸质量模型, 名称及输入输出与线上tensorrt模型一致"""
+
+    def __init__(self, name="face_quality_trt_fp16", input_name="input.1", output_name="1346",
+                 input_shape=(3, 112, 112), datatype="FP32", max_batch_size=64, output_datatype=None,
+                 preferred_batch_sizes=None):
+        """
+        Args:
+            name (str, optional): 模型名称. Defaults to "face_quality_trt_fp16".
+            input_name (str, optional): 输入张量名称. Defaults to "input.1".
+            output_name (str, optional): 输出张量名称. Defaults to "1346".
+            input_shape (tuple, optional): 不含batch维的输入形状. Defaults to (3, 112, 112).
+            datatype (str, optional): 输入数据类型, UINT8时模拟ensemble中的归一化预处理. Defaults to "FP32".
+            max_batch_size (int, optional): 单次请求最大batch. Defaults to 64.
+            output_datatype (str, optional): 输出数据类型, None时与输入相同(UINT8输入时为FP32). Defaults to None.
+            preferred_batch_sizes (list, optional): 配置中dynamic_batching的preferred_batch_size. Defaults to None.
+        """
+        self.name = name
+        self.version = "1"
+        self.input_name = input_name
+        self.output_name = output_name
+        self.input_shape = tuple(input_shape)
+        self.datatype = datatype
+        if output_datatype is None:
+            output_datatype = "FP32" if datatype == "UINT8" else datatype
+        self.output_datatype = output_datatype
+        self.max_batch_size = max_batch_size
+        self.preferred_batch_sizes = list(preferred_batch_sizes or [])
+
+    def metadata(self):
+        return {
+            "name": self.name,
+            "versions": [self.version],
+            "platform": "tensorrt_plan",
+            "inputs": [{"name": self.input_name, "datatype": self.datatype,
+                        "shape": [-1] + list(self.input_shape)}],
+            "outputs": [{"name": self.output_name, "datatype": self.output_datatype, "shape": [-1, 1]}],
+        }
+
+    def config(self):
+        return {
+            "name": self.name,
+            "platform": "tensorrt_plan",
+            "max_batch_size": self.max_batch_size,
+            "input": [{"name": self.input_name, "data_type": "TYPE_" + self.datatype, "dims": list(self.input_shape)}],
+            "output": [{"name": self.output_name, "data_type": "TYPE_" + self.output_datatype, "dims": [1]}],
+            "dynamic_batching": {"preferred_batch_size": self.preferred_batch_sizes},
+        }
+
+    def check_input(self, name, datatype, shape):
+        if name != self.input_name:
+            raise MockError("unexpected inference input '{}' for model '{}'".format(name, self.name))
+        if datatype != self.datatype:
+            raise MockError("inference input '{}' data-type is '{}', but model '{}' expects '{}'".format(
+                name, datatype, self.name, self.datatype))
+        if len(shape) != len(self.input_shape) + 1 or tuple(shape[1:]) != self.input_shape:
+            raise MockError("unexpected shape for input '{}' for model '{}'. Expected {}, got {}".format(
+                name, self.name, [-1] + list(self.input_shape), list(shape)))
+        if shape[0] > self.max_batch_size:
+            raise MockError("inference request batch-size must be <= {} for '{}'".format(
+                self.max_batch_size, self.name))
+
+    def compute(self, inputs):
+        """分数为每张图片输入均值的sigmoid, 相同输入得到相同分数"""
+        array = inputs[self.input_name]
+        mean = array.reshape(array.shape[0], -1).astype(np.float32).mean(axis=1, keepdims=True)
+        if self.datatype == "UINT8":
+            # 与transformer端的归一化相同
+            mean = (mean - 127.5) / 128.0
+        scores = 1.0 / (1.0 + np.exp(-mean))
+        return {self.output_name: scores.astype(triton_to_np_dtype(self.output_datatype))}
+
+
+class MockTritonBackend():
+    """HTTP及gRPC前端共用的模型执行, 延迟/错误注入及共享内存管理"""
+
+    def __init__(self, model=None, latency_ms=0.0, jitter_ms=0.0, per_image_ms=0.0,
+                 error_rate=0.0, error_status="INTERNAL", seed=None):
+        """
+        Args:
+            model (MockFaceQualityModel, optional): 模拟模型, 为None时使用默认配置. Defaults to None.
+            latency_ms (float, optional): 每次推理的固定延迟(毫秒). Defaults to 0.0.
+            jitter_ms (float, optional): 延迟抖动的标准差(毫秒). Defaults to 0.0.
+            per_image_ms (float, optional): 每张图片增加的延迟(毫秒), 模拟batch越大耗时越长. Defaults to 0.0.
+            error_rate (float, optional): 推理请求随机失败的概率. Defaults to 0.0.
+            error_status (str, optional): 注入错误的类型, INTERNAL或UNAVAILABLE. Defaults to "INTERNAL".
+            seed (int, optional): 随机数种子. Defaults to None.
+        """
+        self.model = model or MockFaceQualityModel()
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.per_image = per_image_ms / 1000.0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.ready = True
+
+        self._random = random.Random(seed)
+        self._regions = {}
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._request_bytes = 0
+        self._batch_sizes = Counter()
+
+    def stats(self):
+        """推理请求数, 错误数, 收到的推理请求总字节数及各batch大小出现的次数"""
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "errors": self._errors,
+                "request_bytes": self._request_bytes,
+                "images": sum(size * count for size, count in self._batch_sizes.items()),
+                "batch_sizes": dict(self._batch_sizes),
+            }
+
+    def get_model(self, name, version=""):
+        if name != self.model.name or version not in ("", self.model.version):
+            raise MockError("Request for unknown model: '{}' version {} is not found".format(
+                name, version or "-1"), "NOT_FOUND")
+        return self.model
+
+    def infer(self, name, version, inputs, request_bytes=0):
+        """执行一次推理
+
+        Args:
+            name (str): 模型名称
+            version (str): 模型版本, 空字符串表示最新版本
+            inputs (dict): 输入名称到numpy数组的映射
+            request_bytes (int, optional): 前端收到的请求字节数, 计入统计. Defaults to 0.
+
+        Returns:
+            dict: 输出名称到numpy数组的映射
+        """
+        with self._lock:
+            self._request_bytes += request_bytes
+        model = self.get_model(name, version)
+        if not self.ready:
+            raise MockError("Server not ready", "UNAVAILABLE")
+        for input_name, array in inputs.items():
+            model.check_input(input_name, np_to_triton_dtype(array.dtype), array.shape)
+        if model.input_name not in inputs:
+            raise MockError("expected 1 inputs but got {} inputs for model '{}'".format(len(inputs), name))
+
+        batch_size = inputs[model.input_name].shape[0]
+        delay = self.latency + self.per_image * batch_size
+        if self.jitter > 0:
+            delay += self._random.gauss(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        with self._lock:
+            self._requests += 1
+            self._batch_sizes[batch_size] += 1
+            if failed:
+                self._errors += 1
+        if failed:
+            raise MockError("mock injected error", self.error_status)
+        return model.compute(inputs)
+
+    def register_shm(self, name, key, offset, byte_size):
+        with self._lock:
+            if name in self._regions:
+                raise MockError("shared memory region '{}' already in manager".format(name), "INTERNAL")
+        path = "/dev/shm/" + key.lstrip("/")
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except OSError as e:
+            raise MockError("Unable to open shared memory region: '{}': {}".format(key, e), "INTERNAL")
+        try:
+            buffer = mmap.mmap(fd, offset + byte_size)
+        except (OSError, ValueError) as e:
+            raise MockError("Unable to map shared memory region: '{}': {}".format(key, e), "INTERNAL")
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._regions[name] = (buffer, offset, byte_size)
+
+    def unregister_shm(self, name=""):
+        """注销共享内存区域, name为空时注销全部区域"""
+        with self._lock:
+            if name:
+                regions = [self._regions.pop(name)] if name in self._regions else []
+            else:
+                regions, self._regions = list(self._regions.values()), {}
+        for buffer, _, _ in regions:
+            buffer.close()
+
+    def shm_status(self, name=""):
+        with self._lock:
+            return {region_name: {"name": region_name, "offset": offset, "byte_size": byte_size}
+                    for region_name, (_, offset, byte_size) in self._regions.items()
+                    if not name or region_name == name}
+
+    def read_shm(self, name, offset, byte_size, datatype, shape):
+        buffer = self._region(name, offset, byte_size)
+        array = np.frombuffer(buffer, dtype=triton_to_np_dtype(datatype), count=int(np.prod(shape)), offset=offset)
+        return array.reshape(shape)
+
+    def write_shm(self, name, offset, byte_size, array):
+        buffer = self._region(name, offset, byte_size)
+        data = np.ascontiguousarray(array).tobytes()
+        if len(data) > byte_size:
+            raise MockError("shared memory size specified with the request for output '{}' should be at least {} "
+                            "bytes to hold the results".format(name, len(data)))
+        buffer[offset: offset + len(data)] = data
+
+    def _region(self, name, offset, byte_size):
+        with self._lock:
+            region = self._regions.get(name)
+        if region is None:
+            raise MockError("Unable to find system shared memory region: '{}'".format(name))
+        buffer, region_offset, region_size = region
+        if offset + byte_size > region_offset + region_size:
+            raise MockError("shared memory region '{}' is too small for the request".format(name))
+        return buffer
+
+    def close(self):
+        self.unregister_shm()
+
+
+class MockHttpHandler(BaseHTTPRequestHandler):
+    """KServe v2 HTTP/REST接口, 支持binary tensor扩展"""
+
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分两次写入, 不关闭Nagle时与客户端的延迟ACK叠加, 每次调用多出约40ms
+    disable_nagle_algorithm = True
+    backend = None
+
+    MODEL_PATH = re.compile(r"^/v2/models/([^/]+)(?:/versions/([^/]+))?(?:/(ready|config|infer))?$")
+    SHM_PATH = re.compile(r"^/v2/systemsharedmemory(?:/region/([^/]+))?/(status|register|unregister)$")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        try:
+            if path in ("/v2/health/live", "/v2/health/ready"):
+                ready = path.endswith("live") or self.backend.ready
+                return self._send_json({} if ready else {"error": "Server not ready"}, 200 if ready else 400)
+            if path == "/v2":
+                return self._send_json({"name": "triton", "version": "mock", "extensions": [
+                    "classification", "binary_tensor_data", "system_shared_memory"]})
+            match = self.SHM_PATH.match(path)
+            if match and match.group(2) == "status":
+                return self._send_json(list(self.backend.shm_status(match.group(1) or "").values()))
+            match = self.MODEL_PATH.match(path)
+            if match is None or match.group(3) == "infer":
+                raise MockError("Not Found", "NOT_FOUND")
+            model = self.backend.get_model(match.group(1), match.group(2) or "")
+            if match.group(3) == "ready":
+                ready = self.backend.ready
+                return self._send_json({} if ready else {"error": "model not ready"}, 200 if ready else 400)
+            if match.group(3) == "config":
+                return self._send_json(model.config())
+            return self._send_json(model.metadata())
+        except MockError as e:
+            self._send_error(e)
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            match = self.SHM_PATH.match(path)
+            if match:
+                return self._shared_memory(match.group(1) or "", match.group(2), body)
+            match = self.MODEL_PATH.match(path)
+            if match is None or match.group(3) != "infer":
+                raise MockError("Not Found", "NOT_FOUND")
+            self._infer(match.group(1), match.group(2) or "", body)
+        except MockError as e:
+            self._send_error(e)
+        except Exception as e:
+            self._send_error(MockError(str(e), "INTERNAL"))
+
+    def _shared_memory(self, name, action, body):
+        if action == "register":
+            request = json.loads(body or b"{}")
+            self.backend.register_shm(name, request["key"], request.get("offset", 0), request["byte_size"])
+        elif action == "unregister":
+            self.backend.unregister_shm(name)
+        else:
+            return self._send_json(list(self.backend.shm_status(name).values()))
+        self._send_json({})
+
+    def _infer(self, name, version, body):
+        header_length = self.headers.get("Inference-Header-Content-Length")
+        header_length = int(header_length) if header_length is not None else len(body)
+        try:
+            request = json.loads(body[:header_length])
+        except ValueError as e:
+            raise MockError("failed to parse the request JSON buffer: {}".format(e))
+
+        # 解析输入: binary tensor数据按输入顺序紧跟在json之后
+        inputs = {}
+        offset = header_length
+        for tensor in request.get("inputs", []):
+            parameters = tensor.get("parameters", {})
+            datatype, shape = tensor["datatype"], tensor["shape"]
+            if "shared_memory_region" in parameters:
+                inputs[tensor["name"]] = self.backend.read_shm(
+                    parameters["shared_memory_region"], parameters.get("shared_memory_offset", 0),
+                    parameters["shared_memory_byte_size"], datatype, shape)
+            elif "binary_data_size" in parameters:
+                size = parameters["binary_data_size"]
+                inputs[tensor["name"]] = np.frombuffer(
+                    body, dtype=triton_to_np_dtype(datatype), count=int(np.prod(shape)), offset=offset).reshape(shape)
+                offset += size
+            else:
+                inputs[tensor["name"]] = np.array(tensor["data"], dtype=triton_to_np_dtype(datatype)).reshape(shape)
+
+        # 请求行, 请求头及请求体(json头部+binary tensor数据)
+        request_bytes = len(self.raw_requestline) + len(self.headers.as_bytes()) + len(body)
+        results = self.backend.infer(name, version, inputs, request_bytes)
+        model = self.backend.model
+
+        binary_default = request.get("parameters", {}).get("binary_data_output", False)
+        requested = request.get("outputs") or [{"name": output_name} for output_name in results]
+        outputs, chunks = [], []
+        for output in requested:
+            if output["name"] not in results:
+                raise MockError("unexpected inference output '{}' for model '{}'".format(output["name"], name))
+            array = results[output["name"]]
+            parameters = output.get("parameters", {})
+            tensor = {"name": output["name"], "datatype": np_to_triton_dtype(array.dtype), "shape": list(array.shape)}
+            if "shared_memory_region" in parameters:
+                self.backend.write_shm(parameters["shared_memory_region"], parameters.get("shared_memory_offset", 0),
+                                       parameters["shared_memory_byte_size"], array)
+                tensor["parameters"] = {"shared_memory_region": parameters["shared_memory_region"],
+                                        "shared_memory_byte_size": parameters["shared_memory_byte_size"]}
+            elif parameters.get("binary_data", binary_default):
+                data = array.tobytes()
+                tensor["parameters"] = {"binary_data_size": len(data)}
+                chunks.append(data)
+            else:
+                tensor["data"] = array.flatten().tolist()
+            outputs.append(tensor)
+
+        response = {"model_name": model.name, "model_version": model.version, "outputs": outputs}
+        if "id" in request:
+            response["id"] = request["id"]
+        header = json.dumps(response).encode()
+        if not chunks:
+            return self._send(header, "application/json")
+        self._send(b"".join([header] + chunks), "application/octet-stream",
+                   {"Inference-Header-Content-Length": str(len(header))})
+
+    def _send_json(self, data, status=200):
+        self._send(json.dumps(data).encode(), "application/json", status=status)
+
+    def _send_error(self, error):
+        self._send_json({"error": str(error)}, MockError.HTTP_STATUS.get(error.status, 500))
+
+    def _send(self, body, content_type, headers=None, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockGrpcServicer(service_pb2_grpc.GRPCInferenceServiceServicer):
+    """KServe v2 gRPC接口(GRPCInferenceService)"""
+
+    def __init__(self, backend, stream_workers=16):
+        self.backend = backend
+        self.executor = futures.ThreadPoolExecutor(max_workers=stream_workers, thread_name_prefix="mock-triton-stream")
+
+    def ServerLive(self, request, context):
+        return service_pb2.ServerLiveResponse(live=True)
+
+    def ServerReady(self, request, context):
+        return service_pb2.ServerReadyResponse(ready=self.backend.ready)
+
+    def ServerMetadata(self, request, context):
+        return service_pb2.ServerMetadataResponse(
+            name="triton", version="mock",
+            extensions=["classification", "binary_tensor_data", "system_shared_memory"])
+
+    def ModelReady(self, request, context):
+        try:
+            self.backend.get_model(request.name, request.version)
+        except MockError:
+            return service_pb2.ModelReadyResponse(ready=False)
+        return service_pb2.ModelReadyResponse(ready=self.backend.ready)
+
+    def ModelMetadata(self, request, context):
+        model = self._call(context, self.backend.get_model, request.name, request.version)
+        metadata = model.metadata()
+        return service_pb2.ModelMetadataResponse(
+            name=metadata["name"], versions=metadata["versions"], platform=metadata["platform"],
+            inputs=[service_pb2.ModelMetadataResponse.TensorMetadata(**tensor) for tensor in metadata["inputs"]],
+            outputs=[service_pb2.ModelMetadataResponse.TensorMetadata(**tensor) for tensor in metadata["outputs"]])
+
+    def ModelConfig(self, request, context):
+        model = self._call(context, self.backend.get_model, request.name, request.version)
+        config = model.config()
+        data_type = model_config_pb2.DataType.Value
+        return service_pb2.ModelConfigResponse(config=model_config_pb2.ModelConfig(
+            name=config["name"], platform=config["platform"], max_batch_size=config["max_batch_size"],
+            input=[model_config_pb2.ModelInput(name=tensor["name"], data_type=data_type(tensor["data_type"]),
+                                               dims=tensor["dims"]) for tensor in config["input"]],
+            output=[model_config_pb2.ModelOutput(name=tensor["name"], data_type=data_type(tensor["data_type"]),
+                                                 dims=tensor["dims"]) for tensor in config["output"]],
+            dynamic_batching=model_config_pb2.ModelDynamicBatching(
+                preferred_batch_size=config["dynamic_batching"]["preferred_batch_size"])))
+
+    def ModelInfer(self, request, context):
+        return self._call(context, self._infer, request)
+
+    def ModelStreamInfer(self, request_iterator, context):
+        # 与triton一致, 同一个流上的请求并发处理, 结果按完成顺序返回; 错误通过error_message返回而不中断流
+        responses = queue.Queue()
+
+        def infer(request):
+            try:
+                responses.put(service_pb2.ModelStreamInferResponse(infer_response=self._infer(request)))
+            except MockError as e:
+                responses.put(service_pb2.ModelStreamInferResponse(error_message=str(e)))
+
+        def read():
+            tasks = []
+            try:
+                for request in request_iterator:
+                    tasks.append(self.executor.submit(infer, request))
+            except grpc.RpcError:
+                # 客户端取消了流
+                pass
+            futures.wait(tasks)
+            responses.put(None)
+
+        threading.Thread(target=read, name="mock-triton-stream", daemon=True).start()
+        while True:
+            response = responses.get()
+            if response is None:
+                break
+            yield response
+
+    def SystemSharedMemoryStatus(self, request, context):
+        regions = {
+            name: service_pb2.SystemSharedMemoryStatusResponse.RegionStatus(
+                name=name, key="", offset=status["offset"], byte_size=status["byte_size"])
+            for name, status in self.backend.shm_status(request.name).items()}
+        return service_pb2.SystemSharedMemoryStatusResponse(regions=regions)
+
+    def SystemSharedMemoryRegister(self, request, context):
+        self._call(context, self.backend.register_shm, request.name, request.key, request.offset, request.byte_size)
+        return service_pb2.SystemSharedMemoryRegisterResponse()
+
+    def SystemSharedMemoryUnregister(self, request, context):
+        self.backend.unregister_shm(request.name)
+        return service_pb2.SystemSharedMemoryUnregisterResponse()
+
+    def _call(self, context, func, *args):
+        try:
+            return func(*args)
+        except MockError as e:
+            context.abort(MockError.GRPC_STATUS.get(e.status, grpc.StatusCode.INTERNAL), str(e))
+
+    def _infer(self, request):
+        inputs = {}
+        raw_index = 0
+        for tensor in request.inputs:
+            shape = list(tensor.shape)
+            parameters = tensor.parameters
+            if "shared_memory_region" in parameters:
+                inputs[tensor.name] = self.backend.read_shm(
+                    parameters["shared_memory_region"].string_param,
+                    parameters["shared_memory_offset"].int64_param if "shared_memory_offset" in parameters else 0,
+                    parameters["shared_memory_byte_size"].int64_param, tensor.datatype, shape)
+            elif raw_index < len(request.raw_input_contents):
+                inputs[tensor.name] = np.frombuffer(
+                    request.raw_input_contents[raw_index], dtype=triton_to_np_dtype(tensor.datatype)).reshape(shape)
+                raw_index += 1
+            elif tensor.datatype in ("FP32", "FP16"):
+                # fp16在contents中没有对应字段, 这里只兼容fp32
+                inputs[tensor.name] = np.array(tensor.contents.fp32_contents, dtype=np.float32).reshape(shape)
+            else:
+                raise MockError("unsupported contents for input '{}'".format(tensor.name))
+
+        # 序列化的ModelInferRequest及gRPC消息的5字节前缀, 不含HTTP/2帧头及压缩的请求头
+        results = self.backend.infer(request.model_name, request.model_version, inputs, request.ByteSize() + 5)
+        model = self.backend.model
+
+        response = service_pb2.ModelInferResponse(model_name=model.name, model_version=model.version, id=request.id)
+        requested = list(request.outputs) or [service_pb2.ModelInferRequest.InferRequestedOutputTensor(name=name)
+                                              for name in results]
+        for output in requested:
+            if output.name not in results:
+                raise MockError("unexpected inference output '{}' for model '{}'".format(
+                    output.name, request.model_name))
+            array = results[output.name]
+            tensor = response.outputs.add(name=output.name, datatype=np_to_triton_dtype(array.dtype),
+                                          shape=list(array.shape))
+            parameters = output.parameters
+            if "shared_memory_region" in parameters:
+                region = parameters["shared_memory_region"].string_param
+                byte_size = parameters["shared_memory_byte_size"].int64_param
+                offset = parameters["shared_memory_offset"].int64_param if "shared_memory_offset" in parameters else 0
+                self.backend.write_shm(region, offset, byte_size, array)
+                tensor.parameters["shared_memory_region"].string_param = region
+                tensor.parameters["shared_memory_byte_size"].int64_param = byte_size
+            else:
+                response.raw_output_contents.append(array.tobytes())
+        return response
+
+
+class MockTritonServer():
+    """同时启动HTTP及gRPC前端的模拟triton服务"""
+
+    def __init__(self, http_port=0, grpc_port=0, host="127.0.0.1", workers=64, **backend_kwargs):
+        """
+        Args:
+            http_port (int, optional): HTTP端口, 0表示自动分配, None表示不启动. Defaults to 0.
+            grpc_port (int, optional): gRPC端口, 0表示自动分配, None表示不启动. Defaults to 0.
+            host (str, optional): 监听地址. Defaults to "127.0.0.1".
+            workers (int, optional): gRPC服务线程数, 即可同时处理的请求数. Defaults to 64.
+            **backend_kwargs: 传给MockTritonBackend的参数, 如latency_ms, jitter_ms, error_rate.
+        """
+        self.host = host
+        self.http_port = http_port
+        self.grpc_port = grpc_port
+        self.workers = workers
+        self.backend = MockTritonBackend(**backend_kwargs)
+
+        self._http_server = None
+        self._http_thread = None
+        self._grpc_server = None
+
+    @property
+    def http_url(self):
+        return "{}:{}".format(self.host, self.http_port)
+
+    @property
+    def grpc_url(self):
+        return "{}:{}".format(self.host, self.grpc_port)
+
+    def start(self):
+        if self.http_port is not None:
+            handler = type("Handler", (MockHttpHandler,), {"backend": self.backend})
+            self._http_server = ThreadingHTTPServer((self.host, self.http_port), handler)
+            self._http_server.daemon_threads = True
+            self.http_port = self._http_server.server_address[1]
+            self._http_thread = threading.Thread(
+                target=self._http_server.serve_forever, name="mock-triton-http", daemon=True)
+            self._http_thread.start()
+
+        if self.grpc_port is not None:
+            self._grpc_server = grpc.server(
+                futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mock-triton-grpc"),
+                options=[("grpc.max_send_message_length", MAX_GRPC_MESSAGE_SIZE),
+                         ("grpc.max_receive_message_length", MAX_GRPC_MESSAGE_SIZE)])
+            service_pb2_grpc.add_GRPCInferenceServiceServicer_to_server(MockGrpcServicer(self.backend), self._grpc_server)
+            self.grpc_port = self._grpc_server.add_insecure_port("{}:{}".format(self.host, self.grpc_port))
+            self._grpc_server.start()
+        return self
+
+    def stop(self):
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+            self._http_server = None
+        if self._grpc_server is not None:
+            self._grpc_server.stop(grace=None)
+            self._grpc_server = None
+        self.backend.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="mock triton inference server")
+    parser.add_argument('--host', default='0.0.0.0', help='Listen address.')
+    parser.add_argument('--http_port', type=int, default=8000, help='HTTP port.')
+    parser.add_argument('--grpc_port', type=int, default=8001, help='gRPC port.')
+    parser.add_argument('--workers', type=int, default=64, help='gRPC worker threads.')
+    parser.add_argument('--model_name', default='face_quality_trt_fp16', help='Name of the mock model.')
+    parser.add_argument('--max_batch_size', type=int, default=64, help='Max batch size of the mock model.')
+    parser.add_argument('--preferred_batch_sizes', type=int, nargs='*', default=[],
+                        help='Preferred batch sizes in the dynamic batching config of the mock model.')
+    parser.add_argument('--datatype', default='FP32', choices=['FP32', 'FP16', 'UINT8'],
+                        help='Input datatype of the mock model, UINT8 emulates an ensemble with server-side normalization.')
+    parser.add_argument('--latency_ms', type=float, default=2.0, help='Fixed latency of each inference.')
+    parser.add_argument('--jitter_ms', type=float, default=0.0, help='Standard deviation of the latency.')
+    parser.add_argument('--per_image_ms', type=float, default=0.0, help='Extra latency per image in the batch.')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Probability of a failed inference.')
+    parser.add_argument('--error_status', default='INTERNAL', choices=['INTERNAL', 'UNAVAILABLE'],
+                        help='Status of the injected errors.')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed of jitter and errors.')
+    args = parser.parse_args(argv)
+
+    model = MockFaceQualityModel(name=args.model_name, max_batch_size=args.max_batch_size, datatype=args.datatype,
+                                 preferred_batch_sizes=args.preferred_batch_sizes)
+    server = MockTritonServer(
+        http_port=args.http_port, grpc_port=args.grpc_port, host=args.host, workers=args.workers,
+        model=model, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, per_image_ms=args.per_image_ms,
+        error_rate=args.error_rate, error_status=args.error_status, seed=args.seed).start()
+    print("mock triton serving '{}': http {}, grpc {}".format(model.name, server.http_url, server.grpc_url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
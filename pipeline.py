@@ -0,0 +1,274 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : pipeline.py
+@Time    : 2026/10/18 23:05:37
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 多模型组合流水线, 以声明式的阶段(Stage)描述各triton模型调用及其依赖, 按DAG并发执行
+
+每个阶段声明调用的triton模型, 输入输出张量与上下文键的对应关系及可选的pre/post钩子。
+一次运行共用一个上下文(dict): 外部输入(如images)及各阶段的输出都写入上下文, 阶段依赖的键全部就绪后立即发送,
+互不依赖的阶段同时在途, 整体耗时接近关键路径上各阶段耗时之和。
+阶段输出为指向响应数据的numpy数组, 原样写入上下文并作为后续阶段的输入, 进程内不做拷贝和类型转换。
+调用通过triton客户端的async_infer回调驱动, 需配合TritonGrpcClient(多连接共享)或CPU后端使用。
+
+配置文件(json)示例:
+    {
+        "name": "face_detect_quality",
+        "output": "face_quality_score",
+        "stages": [
+            {"name": "detect", "model": "face_detection", "requires": ["images"],
+             "pre": "my_hooks:detect_pre", "outputs": {"boxes": "boxes"}},
+            {"name": "quality", "type": "face_quality", "images": "faces"},
+            {"name": "crop", "model": "face_align", "inputs": {"boxes": "boxes"}, "requires": ["images", "boxes"],
+             "pre": "my_hooks:align_pre", "post": "my_hooks:align_post", "outputs": {"aligned": "aligned"},
+             "provides": ["faces"]}
+        ]
+    }
+pre/post为"模块:函数"形式的钩子, type为通过factories注册的内置阶段(如人脸质量模型)。
+'''
+
+import json
+import threading
+import importlib
+import contextvars
+from concurrent.futures import Future
+
+
+class Stage():
+    """流水线中的一个阶段, 调用一个triton模型"""
+
+    def __init__(self, name, model_name, inputs=None, outputs=None, pre=None, post=None, requires=None, provides=None):
+        """
+        Args:
+            name (str): 阶段名称, 在流水线中唯一.
+            model_name (str): triton模型名称.
+            inputs (dict, optional): {输入张量名: 上下文键}, 上下文中的数组直接作为输入. Defaults to None.
+            outputs (dict, optional): {输出张量名: 上下文键}, 输出数组写入上下文. Defaults to None.
+            pre (function, optional): pre(context)返回{输入张量名: 数组}, 与inputs合并. Defaults to None.
+            post (function, optional): post(outputs, context)返回{上下文键: 值}写入上下文, outputs为{上下文键: 数组},
+                None时直接写入outputs. Defaults to None.
+            requires (list, optional): 依赖的上下文键, None时为inputs中的上下文键, 使用pre时需列出pre读取的键. Defaults to None.
+            provides (list, optional): 写入的上下文键, None时为outputs中的上下文键. Defaults to None.
+        """
+        self.name = name
+        self.model_name = model_name
+        self.inputs = dict(inputs or {})
+        self.outputs = dict(outputs or {})
+        self.pre = pre
+        self.post = post
+        self.requires = list(requires) if requires is not None else list(self.inputs.values())
+        self.provides = list(provides) if provides is not None else list(self.outputs.values())
+
+
+class Pipeline():
+    """多模型组合流水线
+
+    构造时检查阶段依赖(每个键只能由一个阶段写入, 不能有环), 没有阶段写入的依赖键为外部输入。
+    run返回Future, 结果为运行结束后的上下文; 任一阶段失败时Future以RuntimeError结束, 其余在途阶段的结果被丢弃。
+    """
+
+    def __init__(self, client, stages, name="pipeline", output=None, executor=None):
+        """
+        Args:
+            client (TritonGrpcClient or OnnxRuntimeClient): 提供async_infer的triton客户端, 各阶段共用.
+            stages (list): Stage列表.
+            name (str, optional): 流水线名称. Defaults to "pipeline".
+            output (str, optional): 作为结果的上下文键, 如每张图片的分数列表. Defaults to None.
+            executor (concurrent.futures.Executor, optional): 执行pre钩子的线程池, None时在grpc回调线程中执行. Defaults to None.
+        """
+        if getattr(client, "transport", None) not in ("grpc", "cpu") or not hasattr(client, "async_infer"):
+            raise ValueError("pipeline requires the grpc or cpu client with async_infer")
+
+        self.client = client
+        self.name = name
+        self.output = output
+        self.executor = executor
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError("duplicate pipeline stage: {}".format(stage.name))
+            self.stages[stage.name] = stage
+
+        producers = {}
+        for stage in stages:
+            for key in stage.provides:
+                if key in producers:
+                    raise ValueError("context key {} is provided by both stage {} and {}".format(
+                        key, producers[key], stage.name))
+                producers[key] = stage.name
+
+        # dependencies: 阶段依赖的上游阶段; dependents: 阶段完成后需检查的下游阶段
+        self.dependencies = {name: set() for name in self.stages}
+        self.dependents = {name: set() for name in self.stages}
+        self.inputs = set()
+        for stage in stages:
+            for key in stage.requires:
+                if key in producers:
+                    self.dependencies[stage.name].add(producers[key])
+                    self.dependents[producers[key]].add(stage.name)
+                else:
+                    self.inputs.add(key)
+        if output is not None and output not in producers and output not in self.inputs:
+            raise ValueError("pipeline output {} is not provided by any stage".format(output))
+        self.order = self._topological_order()
+
+    @classmethod
+    def from_config(cls, client, config, factories=None, executor=None):
+        """从配置构造流水线
+
+        Args:
+            client (TritonGrpcClient or OnnxRuntimeClient): triton客户端.
+            config (dict or str): 配置或json配置文件路径, 格式见模块说明.
+            factories (dict, optional): {阶段type: 构造函数}, 构造函数以阶段配置中的其余字段为参数返回Stage. Defaults to None.
+            executor (concurrent.futures.Executor, optional): 执行pre钩子的线程池. Defaults to None.
+
+        Returns:
+            Pipeline: 流水线
+        """
+        if isinstance(config, str):
+            with open(config) as f:
+                config = json.load(f)
+
+        stages = []
+        for spec in config["stages"]:
+            spec = dict(spec)
+            stage_type = spec.pop("type", None)
+            if stage_type is not None:
+                factory = (factories or {}).get(stage_type)
+                if factory is None:
+                    raise ValueError("unknown pipeline stage type: {}".format(stage_type))
+                stages.append(factory(**spec))
+                continue
+            for hook in ("pre", "post"):
+                if isinstance(spec.get(hook), str):
+                    spec[hook] = load_hook(spec[hook])
+            spec["model_name"] = spec.pop("model")
+            stages.append(Stage(**spec))
+        return cls(client, stages, name=config.get("name", "pipeline"), output=config.get("output"), executor=executor)
+
+    def run(self, context):
+        """运行一次流水线
+
+        Args:
+            context (dict): 外部输入, 如{"images": 图片列表}
+
+        Returns:
+            concurrent.futures.Future: 结果为运行结束后的上下文
+        """
+        return PipelineRun(self, context).start()
+
+    def infer(self, context):
+        """同步接口, 阻塞直到流水线运行结束, 返回上下文"""
+        return self.run(context).result()
+
+    def _topological_order(self):
+        waiting = {name: len(deps) for name, deps in self.dependencies.items()}
+        ready = [name for name, count in waiting.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for dependent in sorted(self.dependents[name], key=list(self.stages).index):
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) != len(self.stages):
+            cycle = sorted(name for name, count in waiting.items() if count > 0)
+            raise ValueError("pipeline stages have a dependency cycle: {}".format(", ".join(cycle)))
+        return order
+
+
+class PipelineRun():
+    """流水线的一次运行, 由各阶段的回调推进"""
+
+    def __init__(self, pipeline, context):
+        self.pipeline = pipeline
+        self.context = dict(context)
+        self.future = Future()
+        self.waiting = {name: len(deps) for name, deps in pipeline.dependencies.items()}
+        self.remaining = len(pipeline.stages)
+        self.failed = False
+        self._lock = threading.Lock()
+        # 钩子及回调在其他线程中执行, 沿用调用方的指标标签
+        self._ctx = contextvars.copy_context()
+
+    def start(self):
+        missing = sorted(self.pipeline.inputs - set(self.context))
+        if missing:
+            self.future.set_exception(KeyError("missing pipeline inputs: {}".format(", ".join(missing))))
+            return self.future
+        if self.remaining == 0:
+            self.future.set_result(self.context)
+            return self.future
+        for name in self.pipeline.order:
+            if self.waiting[name] == 0:
+                self._launch(self.pipeline.stages[name])
+        return self.future
+
+    def _launch(self, stage):
+        if self.pipeline.executor is None:
+            self._ctx.copy().run(self._send, stage)
+        else:
+            self.pipeline.executor.submit(self._ctx.copy().run, self._send, stage)
+
+    def _send(self, stage):
+        if self.failed:
+            return
+        try:
+            input_dict = {tensor: self.context[key] for tensor, key in stage.inputs.items()}
+            if stage.pre is not None:
+                input_dict.update(stage.pre(self.context))
+
+            def callback(result, error):
+                self._ctx.copy().run(self._done, stage, result, error)
+
+            self.pipeline.client.async_infer(stage.model_name, input_dict, list(stage.outputs), callback=callback)
+        except Exception as e:
+            self._fail(stage, e)
+
+    def _done(self, stage, result, error):
+        if error is not None:
+            self._fail(stage, error)
+            return
+        try:
+            outputs = {key: result.as_numpy(tensor) for tensor, key in stage.outputs.items()}
+            values = stage.post(outputs, self.context) if stage.post is not None else outputs
+        except Exception as e:
+            self._fail(stage, e)
+            return
+
+        ready = []
+        with self._lock:
+            if self.failed:
+                return
+            self.context.update(values)
+            self.remaining -= 1
+            for name in self.pipeline.dependents[stage.name]:
+                self.waiting[name] -= 1
+                if self.waiting[name] == 0:
+                    ready.append(name)
+            finished = self.remaining == 0
+        for name in ready:
+            self._launch(self.pipeline.stages[name])
+        if finished:
+            self.future.set_result(self.context)
+
+    def _fail(self, stage, error):
+        with self._lock:
+            if self.failed:
+                return
+            self.failed = True
+        failure = RuntimeError("pipeline {} stage {} ({}) failed: {}".format(
+            self.pipeline.name, stage.name, stage.model_name, error))
+        failure.__cause__ = error
+        self.future.set_exception(failure)
+
+
+def load_hook(path):
+    """按"模块:函数"加载钩子函数"""
+    module_name, _, attr = path.partition(":")
+    if not attr:
+        raise ValueError("invalid hook {}, expected module:function".format(path))
+    return getattr(importlib.import_module(module_name), attr)
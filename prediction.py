@@ -1,44 +1,231 @@
 # -*- encoding: utf-8 -*-
 import cv2
+import time
+import queue
+import asyncio
+import threading
+import contextvars
 import numpy as np
-from queue import Queue
-from functools import partial
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .utils import read_video_frames
+from .pipeline import Stage
+from . import admission
+from . import metrics
+
+
+# 支持的输入张量类型: FP32/FP16为归一化后的张量, UINT8为resize后的RGB像素, 由triton端的预处理模型(ensemble)归一化
+INPUT_DTYPES = {"FP32": np.float32, "FP16": np.float16, "UINT8": np.uint8}
+
+
+class BufferPool():
+    """按batch大小复用的预分配输入缓冲区
+
+    acquire取出一个(N, *shape)的缓冲区, 数据发送(序列化)完成后通过release归还,
+    相同batch大小的后续请求直接复用, 不再分配内存。未归还的缓冲区由gc回收, 不影响正确性。
+    """
+
+    def __init__(self, shape=(3, 112, 112), dtype=np.float32, max_per_size=4):
+        """
+        Args:
+            shape (tuple, optional): 单张图片的张量形状. Defaults to (3, 112, 112).
+            dtype (numpy.dtype, optional): 张量数据类型. Defaults to np.float32.
+            max_per_size (int, optional): 每个batch大小最多缓存的缓冲区个数. Defaults to 4.
+        """
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.max_per_size = max_per_size
+        self._free = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, batch_size):
+        with self._lock:
+            free = self._free.get(batch_size)
+            if free:
+                return free.pop()
+        return np.empty((batch_size,) + self.shape, dtype=self.dtype)
+
+    def release(self, buffer):
+        if buffer.shape[1:] != self.shape or buffer.dtype != self.dtype:
+            return
+        with self._lock:
+            free = self._free.setdefault(buffer.shape[0], [])
+            if len(free) < self.max_per_size:
+                free.append(buffer)
 
 
 class FaceQualityPrediction():
 
-    def __init__(self, tritonclient):
+    def __init__(self, tritonclient, executor=None, shm_pool=None, chunk_size=64, max_chunks_inflight=4,
+                 max_chunked_requests=8, model_name="face_quality_trt_fp16", input_name="input.1", output_name="1346",
+                 input_dtype="FP32"):
+        """
+        Args:
+            tritonclient: triton客户端对象.
+            executor (concurrent.futures.Executor, optional): 批量图片并行resize的线程池, None时串行处理. Defaults to None.
+            shm_pool (SharedMemoryPool, optional): 共享内存区域池, 同步及grpc异步调用时输入输出经共享内存传输. Defaults to None.
+            chunk_size (int, optional): 单次triton调用的最大图片数(模型的max_batch_size), 图片更多时分块流水线调用,
+                0表示不分块. Defaults to 64.
+            max_chunks_inflight (int, optional): 分块调用时同时在途的块数. Defaults to 4.
+            max_chunked_requests (int, optional): grpc异步调用时同时分块处理的请求数(分块线程池大小), 每个请求占用一个线程,
+                triton端的在途块数最多为max_chunked_requests * max_chunks_inflight, 超出的请求在线程池中排队;
+                Transformer中取max_inflight, 与在途请求数上限一致. Defaults to 8.
+            model_name (str, optional): triton模型名称. Defaults to "face_quality_trt_fp16".
+            input_name (str, optional): 模型输入张量名称. Defaults to "input.1".
+            output_name (str, optional): 模型输出张量名称. Defaults to "1346".
+            input_dtype (str, optional): 输入张量类型, FP32, FP16或UINT8, 可通过configure按模型元数据确定.
+                Defaults to "FP32".
+        """
         self.tritonclient = tritonclient
-        self.model_name = "face_quality_trt_fp16"
-        self.input_names = ['input.1']
-        self.output_names = ['1346']
+        self.executor = executor
+        self.shm_pool = shm_pool
+        self.chunk_size = chunk_size
+        self.max_chunks_inflight = max_chunks_inflight
+        self.max_chunked_requests = max_chunked_requests
+        # grpc异步调用分块时, 在该线程池中发送各块并等待结果, 不阻塞调用方
+        self._chunk_executor = None
+        self._chunk_lock = threading.Lock()
+        self.model_name = model_name
+        self.model_version = ""
+        self.input_names = [input_name]
+        self.output_names = [output_name]
+        self.input_size = (112, 112)
+
+        # 以下由configure按模型元数据及配置更新, max_batch_size为0表示不限制
+        self.output_dtype = "FP32"
+        self.output_shape = (1,)
+        self.max_batch_size = 0
+        self.preferred_batch_sizes = []
+
+        # 输入张量缓冲区池, 以及每个线程私有的resize中间结果
+        self._local = threading.local()
+        self.set_input_dtype(input_dtype)
+
+    def set_input_dtype(self, input_dtype):
+        """设置输入张量类型, 按新类型重建缓冲区池"""
+        if input_dtype not in INPUT_DTYPES:
+            raise ValueError("invalid input dtype: {}, must be one of {}".format(input_dtype, ", ".join(INPUT_DTYPES)))
+        self.input_dtype = input_dtype
+        self.buffer_pool = BufferPool(shape=(3,) + self.input_size[::-1], dtype=INPUT_DTYPES[input_dtype])
+
+    def configure(self, spec, input_dtype="auto"):
+        """按启动时获取的模型元数据及配置确定输入尺寸, 输入输出类型, 模型版本及batch上限
+
+        tensorrt fp16模型的输入可以声明为FP16, 直接发送FP16张量时序列化及传输的数据量减半;
+        声明为UINT8时(ensemble中包含归一化的预处理模型)只发送resize后的像素, 数据量为FP32的1/4。
+        分块大小不超过模型的max_batch_size。
+
+        Args:
+            spec (ModelSpec): 模型元数据及配置.
+            input_dtype (str, optional): auto(使用模型声明的类型), FP32, FP16或UINT8. Defaults to "auto".
 
-    def preprocess(self, images):
+        Returns:
+            str: 确定的输入张量类型
+
+        Raises:
+            ValueError: 模型没有该输入输出, 输入形状不是(3, H, W), 声明的类型不支持或与指定的类型不一致
+        """
+        input_name, output_name = self.input_names[0], self.output_names[0]
+        if input_name not in spec.inputs:
+            raise ValueError("model {} has no input {}, inputs: {}".format(
+                spec.name, input_name, ", ".join(spec.inputs)))
+        if output_name not in spec.outputs:
+            raise ValueError("model {} has no output {}, outputs: {}".format(
+                spec.name, output_name, ", ".join(spec.outputs)))
+        if not spec.batched:
+            raise ValueError("model {} does not accept batched input".format(spec.name))
+
+        datatype, dims = spec.inputs[input_name]
+        if len(dims) != 3 or dims[0] != 3:
+            raise ValueError("model {} input {} has shape {}, expected [3, H, W]".format(
+                spec.name, input_name, list(dims)))
+        if input_dtype != "auto" and input_dtype != datatype:
+            raise ValueError("model {} input {} is {}, but input dtype {} is requested".format(
+                spec.name, input_name, datatype, input_dtype))
+        if datatype not in INPUT_DTYPES:
+            raise ValueError("model {} input {} has unsupported datatype {}".format(spec.name, input_name, datatype))
+
+        # 动态的高宽沿用默认的112x112
+        height, width = dims[1:]
+        self.input_size = (width if width > 0 else self.input_size[0], height if height > 0 else self.input_size[1])
+        self._local = threading.local()
+        output_datatype, output_dims = spec.outputs[output_name]
+        self.output_dtype = output_datatype
+        if output_dims and all(d > 0 for d in output_dims):
+            self.output_shape = tuple(output_dims)
+        self.model_version = spec.version
+        self.max_batch_size = spec.max_batch_size
+        self.preferred_batch_sizes = spec.preferred_batch_sizes
+        if spec.max_batch_size > 0 and (self.chunk_size <= 0 or self.chunk_size > spec.max_batch_size):
+            self.chunk_size = spec.max_batch_size
+        self.set_input_dtype(datatype)
+        return datatype
+
+    def preprocess(self, images, out=None):
         """图片数据前置处理流程
 
         Args:
             images (list): 图片数据列表
+            out (numpy.ndarray, optional): 写入结果的(N, 3, 112, 112)缓冲区(如共享内存视图), None时取自buffer_pool. Defaults to None.
 
         Returns:
-            numpy.ndarray: 4维Numpy数组
+            numpy.ndarray: 4维Numpy数组, 未指定out时取自buffer_pool, 数据发送后可通过buffer_pool.release归还复用
         """
 
-        batch_img = []
-        if len(images) > 0:
-            for image in images:
-                resized = cv2.resize(image, (112, 112))
-                resized = resized[..., ::-1]    # BGR to RGB
-                resized = resized.swapaxes(1, 2).swapaxes(0, 1)
-                batch_img.append(resized)
-        else:
-            raise("Input data error, images.shape:", image.shape)
+        if len(images) == 0:
+            raise ValueError("Input data error, images is empty")
+        # 已超过截止时间的请求不再前置处理及发送
+        admission.check_deadline("preprocess")
 
-        batch_img = np.array(batch_img, dtype=np.float32)
-        # normalization
-        batch_img = (batch_img - 127.5) / 128.0
+        with metrics.timed("preprocess", len(images)):
+            return self._preprocess(images, out)
+
+    def _preprocess(self, images, out):
+        batch_img = self.buffer_pool.acquire(len(images)) if out is None else out
+        if self.executor is None or len(images) <= 1:
+            for i, image in enumerate(images):
+                self._preprocess_one(image, batch_img[i])
+        else:
+            # cv2.resize释放GIL, 多张图片并行写入batch缓冲区的不同位置
+            list(self.executor.map(self._preprocess_one, images, batch_img))
+        if batch_img.dtype == np.float32:
+            # normalization, 原地缩放
+            np.multiply(batch_img, 1.0 / 128.0, out=batch_img)
 
         return batch_img
 
+    def _preprocess_one(self, image, out):
+        # resize直接写入复用的uint8缓冲区, 通道数不是3时cv2会另行分配并在下面报错
+        resized = cv2.resize(image, self.input_size, dst=self._resize_buffer())
+        # BGR to RGB, HWC to CHW 及减均值在一次拷贝中完成, 直接写入batch缓冲区
+        rgb = resized[..., ::-1].transpose(2, 0, 1)
+        if out.dtype == np.float32:
+            np.subtract(rgb, 127.5, out=out, dtype=np.float32)
+        elif out.dtype == np.uint8:
+            # 归一化由triton端的预处理模型完成
+            np.copyto(out, rgb)
+        else:
+            # FP16: numpy的float32到float16转换很慢, 由cv2一次完成归一化及转换(内部按float32计算后舍入一次,
+            # 与FP32张量转换为FP16的结果相同), 再做通道转换
+            normalized = cv2.addWeighted(resized, 1.0 / 128.0, resized, 0.0, -127.5 / 128.0,
+                                         dst=self._normalize_buffer(), dtype=cv2.CV_16F)
+            np.copyto(out, normalized[..., ::-1].transpose(2, 0, 1))
+
+    def _normalize_buffer(self):
+        normalized = getattr(self._local, "normalized", None)
+        if normalized is None:
+            normalized = np.empty(self.input_size[::-1] + (3,), dtype=np.float16)
+            self._local.normalized = normalized
+        return normalized
+
+    def _resize_buffer(self):
+        resized = getattr(self._local, "resized", None)
+        if resized is None:
+            resized = np.empty(self.input_size[::-1] + (3,), dtype=np.uint8)
+            self._local.resized = resized
+        return resized
+
     def infer(self, images):
         """人脸质量检测主流程
 
@@ -48,64 +235,102 @@ class FaceQualityPrediction():
         Returns:
             list: 人脸质量分数列表
         """
+        if self.oversized(images):
+            return self.chunked_infer(images)
+
+        region = self.shm_pool.acquire(len(images)) if self.shm_pool is not None else None
+        if region is not None:
+            return self.shm_infer(images, region)
+
         # 数据前置处理逻辑
-        # t1 = time.time()
         input_data = self.preprocess(images)
-        # t2 = time.time()
 
-        input_dict = {"input.1": input_data}
-        output_names = ['1346']
+        input_dict = {self.input_names[0]: input_data}
+        output_names = self.output_names
 
-        results = self.tritonclient.infer(self.model_name, input_dict, output_names)
-        # t3 = time.time()
-        # print("predictor time cost total:{}, preprocess:{}, triton call:{}".format(
-        #     t3-t1, t2-t1, t3-t2))
+        try:
+            results = self.tritonclient.infer(self.model_name, input_dict, output_names)
+        finally:
+            # 请求数据已序列化, 归还缓冲区
+            self.buffer_pool.release(input_data)
 
         return self.postprocess(results)
 
-    def async_infer(self, images):
-        """人脸质量检测主流程
+    def shm_infer(self, images, region):
+        """经共享内存区域传输的同步调用流程, 前置处理结果直接写入共享内存, 分数从共享内存读取
 
         Args:
             images (list): 图片数据列表
+            region (ShmRegion): 从shm_pool取出的区域, 调用结束后归还
 
         Returns:
             list: 人脸质量分数列表
         """
+        try:
+            self.preprocess(images, out=region.input_array(len(images)))
+            self.tritonclient.infer(
+                self.model_name, {self.input_names[0]: region.input_tensor()}, self.output_names,
+                output_shm={self.output_names[0]: region.output_tensor()})
+            return self.output_scores(region.output_array())
+        finally:
+            self.shm_pool.release(region)
+
+    def async_infer(self, images):
+        """人脸质量检测http异步调用流程, 不分块, 图片数超过chunk_size时应使用infer
+
+        Args:
+            images (list): 图片数据列表
+
+        Returns:
+            tritonclient.http.InferAsyncRequest: 异步请求句柄, 需在发送的线程中调用get_result()等待结果,
+                再按postprocess解析为人脸质量分数列表
+        """
         # 数据前置处理逻辑
-        # t1 = time.time()
         input_data = self.preprocess(images)
-        # t2 = time.time()
 
-        input_dict = {"input.1": input_data}
-        output_names = ['1346']
+        input_dict = {self.input_names[0]: input_data}
+        output_names = self.output_names
 
-        results = self.tritonclient.infer(self.model_name, input_dict, output_names, is_async=True)
-        # t3 = time.time()
+        try:
+            results = self.tritonclient.infer(self.model_name, input_dict, output_names, is_async=True)
+        finally:
+            self.buffer_pool.release(input_data)
 
-        # print("predictor time cost total:{}, preprocess:{}, triton call:{}".format(
-        #     t3-t1, t2-t1, t3-t2))
 
         return results
 
-    def grpc_async_infer(self, images:list, result_queue:Queue):
-        """人脸质量检测主流程
+    def grpc_async_infer(self, images: list):
+        """人脸质量检测grpc异步调用流程
 
         Args:
             images (list): 图片数据列表
 
         Returns:
-            list: 人脸质量分数列表
+            concurrent.futures.Future: 推理结果句柄, 结果为人脸质量分数列表, 调用失败时为对应异常
         """
+        if self.oversized(images):
+            return self._chunk_pool().submit(contextvars.copy_context().run, self.chunked_infer, images)
+
+        region = self.shm_pool.acquire(len(images)) if self.shm_pool is not None else None
+
         # 数据前置处理逻辑
-        # t1 = time.time()
-        input_data = self.preprocess(images)
-        # t2 = time.time()
+        if region is not None:
+            try:
+                self.preprocess(images, out=region.input_array(len(images)))
+            except Exception:
+                self.shm_pool.release(region)
+                raise
+            input_dict = {self.input_names[0]: region.input_tensor()}
+            output_shm = {self.output_names[0]: region.output_tensor()}
+        else:
+            input_data = self.preprocess(images)
+            input_dict = {self.input_names[0]: input_data}
+            output_shm = None
+        output_names = self.output_names
 
-        input_dict = {"input.1": input_data}
-        output_names = ['1346']
+        future = Future()
 
-        def asyn_callback(user_queue, result, error):
+        def asyn_callback(result, error):
             """
                 Define the callback function. Note the last two parameters should be
                 result and error. InferenceServerClient would povide the results of an
@@ -113,88 +338,246 @@ class FaceQualityPrediction():
                 inference, error will be None, otherwise it will be an object of
                 tritonclientutils.InferenceServerException holding the error details
             """
-            if error:
-                print("asyn_callback error >> ", result, error)
-                user_queue.put((None, error))
+            try:
+                if error:
+                    future.set_exception(error)
+                elif region is not None:
+                    future.set_result(self.output_scores(region.output_array()))
+                else:
+                    future.set_result(self.postprocess(result))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                if region is not None:
+                    self.shm_pool.release(region)
+
+        try:
+            self.tritonclient.async_infer(
+                self.model_name, input_dict, output_names, callback=asyn_callback, output_shm=output_shm)
+        except Exception:
+            if region is not None:
+                self.shm_pool.release(region)
+            raise
+        finally:
+            if region is None:
+                self.buffer_pool.release(input_data)
+        return future
+
+    async def aio_infer(self, images, executor=None):
+        """人脸质量检测asyncio调用流程, 需配合AsyncTritonHttpClient/AsyncTritonGrpcClient使用
+
+        Args:
+            images (list): 图片数据列表
+            executor (concurrent.futures.Executor, optional): 执行cv2前置处理的线程池, None时使用事件循环默认线程池.
+
+        Returns:
+            list: 人脸质量分数列表
+        """
+        if self.oversized(images):
+            # 每块先获得在途名额再前置处理, 块k+1的前置处理与块k的推理重叠, 内存中最多max_chunks_inflight块
+            window = asyncio.Semaphore(self.max_chunks_inflight)
+
+            async def run(chunk):
+                async with window:
+                    return await self._aio_infer(chunk, executor)
+            chunks = await asyncio.gather(*[run(chunk) for chunk in self.split_chunks(images)])
+            return [score for scores in chunks for score in scores]
+        return await self._aio_infer(images, executor)
+
+    async def _aio_infer(self, images, executor=None):
+        # cv2前置处理放到线程池, 不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        input_data = await loop.run_in_executor(executor, ctx.run, self.preprocess, images)
+
+        input_dict = {self.input_names[0]: input_data}
+        output_names = self.output_names
+
+        try:
+            results = await self.tritonclient.infer(self.model_name, input_dict, output_names)
+        finally:
+            self.buffer_pool.release(input_data)
+        return self.postprocess(results)
+
+    def chunked_infer(self, images):
+        """图片数超过chunk_size时的分块流水线调用
+
+        按chunk_size分块, 每块前置处理后异步发送并立即归还输入缓冲区, 接着前置处理下一块, 与在途块的推理重叠;
+        在途块数达到max_chunks_inflight时先等待最早的块返回。分数按块顺序拼接,
+        内存中最多一块前置处理结果及max_chunks_inflight个在途请求, 不随图片数增长。
+
+        Args:
+            images (list): 图片数据列表
+
+        Returns:
+            list: 人脸质量分数列表
+        """
+        # http客户端通过async_infer句柄在当前线程等待结果, grpc及CPU后端通过回调写回Future
+        use_handle = self.tritonclient.transport == "http"
+        pending = deque()
+        scores = []
+        for chunk in self.split_chunks(images):
+            if len(pending) >= self.max_chunks_inflight:
+                scores.extend(self._chunk_scores(pending.popleft(), use_handle))
+            if use_handle:
+                pending.append((self.async_infer(chunk), len(chunk), time.perf_counter()))
             else:
-                scores = self.postprocess(result)
-                user_queue.put((scores, error))
-        
-        self.tritonclient.async_infer(
-            self.model_name, input_dict, output_names, callback=partial(asyn_callback, result_queue))
-        # t3 = time.time()
-        # print("predictor time cost total:{}, preprocess:{}, triton call:{}".format(
-        #     t3-t1, t2-t1, t3-t2))
-
-
-    def grpc_async_stream_infer():
-        pass
-    
+                pending.append(self.grpc_async_infer(chunk))
+        while pending:
+            scores.extend(self._chunk_scores(pending.popleft(), use_handle))
+        return scores
+
+    def split_chunks(self, images):
+        return [images[i: i + self.chunk_size] for i in range(0, len(images), self.chunk_size)]
+
+    def _chunk_scores(self, pending, use_handle):
+        if not use_handle:
+            return pending.result()
+        handle, count, t1 = pending
+        results = handle.get_result()
+        metrics.observe("triton_rpc", time.perf_counter() - t1, count)
+        return self.postprocess(results)
+
+    def oversized(self, images):
+        """图片数是否超过chunk_size, 需要分块调用"""
+        return self.chunk_size > 0 and len(images) > self.chunk_size
+
+    def _chunk_pool(self):
+        with self._chunk_lock:
+            if self._chunk_executor is None:
+                self._chunk_executor = ThreadPoolExecutor(
+                    max_workers=self.max_chunked_requests, thread_name_prefix="chunked-infer")
+            return self._chunk_executor
+
+    def grpc_async_stream_infer(self, frames, batch_size=8, max_inflight=4, stream_timeout=None):
+        """视频帧序列的流式人脸质量检测, 需配合TritonGrpcClient使用
+
+        整个序列只建立一个双向grpc流: 后台线程读取帧, 每batch_size帧前置处理后在流上发送一个请求,
+        在途请求数达到max_inflight时读取线程阻塞等待(背压), 内存中最多保留max_inflight + 1个batch;
+        分数按帧顺序逐个返回, 不必等待整个序列处理完。
+
+        Args:
+            frames (iterable or str): 帧(BGR图片数据)的迭代器, 或视频文件路径
+            batch_size (int, optional): 每个请求的帧数. Defaults to 8.
+            max_inflight (int, optional): 流上同时在途的请求数. Defaults to 4.
+            stream_timeout (float, optional): 整个流的超时时间(秒). Defaults to None.
+
+        Yields:
+            tuple: (帧序号, 人脸质量分数), 帧序号从0开始, 为frames中的序号
+
+        Raises:
+            InferenceServerException: 流中任一请求失败时终止并抛出
+        """
+        if isinstance(frames, str):
+            frames = read_video_frames(frames)
+
+        events = queue.Queue()
+        window = threading.Semaphore(max_inflight)
+        stop = threading.Event()
+        labels = metrics.labels_for(self.tritonclient.transport)
+
+        def callback(result, error):
+            events.put(("result", result, error))
+            window.release()
+
+        def send(stream, batch, start, request_id):
+            # 先前置处理再等待窗口, 与在途请求的推理重叠
+            input_data = self.preprocess(batch)
+            try:
+                while not window.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return False
+                events.put(("sent", request_id, (start, len(batch), time.perf_counter())))
+                stream.async_stream_infer(
+                    self.model_name, {self.input_names[0]: input_data}, self.output_names, str(request_id))
+            finally:
+                # 请求数据已序列化, 归还缓冲区
+                self.buffer_pool.release(input_data)
+            return True
+
+        def produce(stream):
+            try:
+                batch, start, request_id = [], 0, 0
+                for frame in frames:
+                    if stop.is_set():
+                        return
+                    batch.append(frame)
+                    if len(batch) < batch_size:
+                        continue
+                    if not send(stream, batch, start, request_id):
+                        return
+                    start, request_id, batch = start + len(batch), request_id + 1, []
+                if batch:
+                    if not send(stream, batch, start, request_id):
+                        return
+                    request_id += 1
+                events.put(("end", request_id, None))
+            except Exception as e:
+                events.put(("error", None, e))
+
+        stream = self.tritonclient.open_stream(callback, stream_timeout=stream_timeout)
+        producer = threading.Thread(
+            target=contextvars.copy_context().run, args=(produce, stream), name="stream-producer", daemon=True)
+        producer.start()
+
+        # sent: 已发送请求的(起始帧序号, 帧数, 发送时间); done: 已返回但还未按顺序输出的结果
+        sent, done = {}, {}
+        next_id, total = 0, None
+        finished = False
+        try:
+            while total is None or next_id < total:
+                kind, value, extra = events.get()
+                if kind == "sent":
+                    sent[value] = extra
+                elif kind == "result":
+                    if extra is not None:
+                        raise extra
+                    request_id = int(value.get_response().id)
+                    start, count, t1 = sent.pop(request_id)
+                    metrics.observe("triton_rpc", time.perf_counter() - t1, count, labels)
+                    done[request_id] = (start, self.postprocess(value))
+                elif kind == "end":
+                    total = value
+                else:
+                    raise extra
+
+                while next_id in done:
+                    start, scores = done.pop(next_id)
+                    for i, score in enumerate(scores):
+                        yield start + i, score
+                    next_id += 1
+            finished = True
+        finally:
+            stop.set()
+            stream.close(cancel_requests=not finished)
+            producer.join()
+
+    def as_stage(self, name="face_quality", images="images", scores="face_quality_score"):
+        """作为流水线(pipeline.Pipeline)中的一个阶段: 对上下文中的图片列表做前置处理, 调用人脸质量模型
+
+        Args:
+            name (str, optional): 阶段名称. Defaults to "face_quality".
+            images (str, optional): 输入图片列表的上下文键. Defaults to "images".
+            scores (str, optional): 写入分数列表的上下文键. Defaults to "face_quality_score".
+
+        Returns:
+            Stage: 流水线阶段
+        """
+        def pre(context):
+            return {self.input_names[0]: self.preprocess(context[images])}
+
+        def post(outputs, context):
+            return {scores: self.output_scores(outputs[scores])}
+
+        return Stage(name, self.model_name, outputs={self.output_names[0]: scores},
+                     pre=pre, post=post, requires=[images])
+
+    def postprocess(self, results):
+        output0 = results.as_numpy(self.output_names[0])
+        return self.output_scores(output0)
+
     @staticmethod
-    def postprocess(results):
-        output0 = results.as_numpy('1346')
+    def output_scores(output0):
         quality_score = np.squeeze(output0, axis=-1)
         return quality_score.tolist()
 
-
-if __name__ == "__main__":
-    # 启动triton服务
-    # tritonserver --model-repository={models} --http-port=8000 --grpc-port=8001
-    # tritonserver --model-repository=triton-test --http-port=8000 --grpc-port=8001
-    
-    from triton_client import TritonHttpClient, TritonGrpcClient
-    import time
-
-    # echo "10.100.196.70 audioevent-predictor-default.mgtv" >> /etc/hosts
-    # echo "10.100.196.70 face-quality-new-predictor-default.mgtv" >> /etc/hosts
-    
-    # predictor_host = "face-quality-new-predictor-default.mgtv"
-
-    infer_type = 0
-    
-    if infer_type == 0:
-        predictor_host = "localhost:8000"
-        tritonclient = TritonHttpClient(predictor_host, concurrency=50)
-    elif infer_type == 1:
-        predictor_host = "localhost:8001"
-        tritonclient = TritonGrpcClient(predictor_host, concurrency=50)
-    elif infer_type == 2:
-        # http直通triton
-        predictor_host = "10.244.20.200:8080"
-        tritonclient = TritonHttpClient(predictor_host, concurrency=50)
-    elif infer_type == 3:
-        # grpc直通triton
-        predictor_host = "10.244.22.85:9000"
-        predictor_host = "10.244.20.200:9000"
-        tritonclient = TritonGrpcClient(predictor_host, concurrency=50)
-
-    print(predictor_host)
-    predictor = FaceQualityPrediction(tritonclient)
-
-    images = []
-    img = cv2.imread("data/1-Harry_Belafonte_1.jpg")
-    batch_size = 1
-    for i in range(batch_size):
-        images.append(img)
-
-    cnt = 11
-    for i in range(cnt):
-        if i==1:
-            t1 = time.time()
-        res = predictor.infer(images)
-        if i % 10 == 0:
-            print(">>", i, res)
-    t2 = time.time()
-    print("total time cost:", t2-t1, "average time cost:", (t2-t1)/cnt)
-    print("| ", batch_size, "|", t2-t1, " | ", (t2-t1)/cnt, "s")
-
-    # import concurrent
-    # future_to_url = {}
-    # with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-    #     for idx in range(cnt):
-    #         future_to_url.update({executor.submit(predictor.infer, images): idx})    
-    #     total_num = len(future_to_url.keys())    
-    #     for future in concurrent.futures.as_completed(future_to_url):
-    #         idx = future_to_url[future]
-    #         res = future.result()   
-    #         print(res)
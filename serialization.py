@@ -0,0 +1,132 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : serialization.py
+@Time    : 2026/10/19 00:12:05
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 请求解析及返回结果构造的快速路径, 不构造Request/Response等pydantic对象, 输出与pydantic路径一致
+
+返回结果: 按MultiResponse(...).dict(exclude_unset=True)的结构直接由分数数组生成dict, 分数一次性转换为python float,
+extra_info等固定部分预先构造好后逐条复制; 每张图片省去三个pydantic对象的校验及dict转换。
+请求解析: 直接从dict中取出各item, 请求带extra_info时仍走pydantic路径, 保持附加字段的解析方式不变;
+请求体为json字节时优先使用orjson解析。
+两条路径的一致性由tests/test_serialization.py对照检查, 压测工具的serialize目标对比两者开销。
+'''
+
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .common_data_type.request import Request, MultiRequest
+from .common_data_type.response import Response, ResponseItem, ExtraInfo, MultiResponse
+
+
+SCORE_SOURCE = "face_quality_score"
+
+
+def loads(body):
+    """解析json请求体, 安装了orjson时使用orjson"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def dumps(obj):
+    """序列化为json字节, 安装了orjson时使用orjson(numpy数组直接序列化)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj).encode()
+
+
+def build_response(scores):
+    """由分数构造返回结果, 与pydantic路径的MultiResponse(...).dict(exclude_unset=True)相同
+
+    Args:
+        scores (list or numpy.ndarray): 每张图片的分数
+
+    Returns:
+        dict: {"multi_data": [{"data": [{"score": 分数}], "extra_info": {"source": "face_quality_score"}}, ...]}
+    """
+    # pydantic的float字段对numpy标量及python数值都转换为python float
+    values = np.asarray(scores, dtype=np.float64).tolist() if len(scores) > 0 else []
+    return {
+        "multi_data": [{"data": [{"score": value}], "extra_info": {"source": SCORE_SOURCE}} for value in values]
+    }
+
+
+def build_multi_response(scores):
+    """pydantic路径, 按common_data_type规范构造MultiResponse对象"""
+    content = []
+    for score in scores:
+        content.append(
+            Response(
+                data=[ResponseItem(score=score)],
+                extra_info=ExtraInfo(source=SCORE_SOURCE)
+            )
+        )
+    return MultiResponse(multi_data=content)
+
+
+def build_response_pydantic(scores):
+    """pydantic路径的返回结果dict"""
+    return build_multi_response(scores).dict(exclude_unset=True)
+
+
+def parse_items(request):
+    """从请求dict中取出图片item
+
+    Args:
+        request (dict): Request或MultiRequest格式的请求
+
+    Returns:
+        tuple: (item列表, 附加字段dict, 请求类型), 不能走快速路径(带extra_info)时返回None
+    """
+    if request.get("extra_info") is not None:
+        return None
+    if "multi_data" in request:
+        multi_data = request["multi_data"]
+        if not isinstance(multi_data, list):
+            raise ValueError("invalid MultiRequest: multi_data must be a list")
+        items = []
+        for req in multi_data:
+            if not isinstance(req, dict) or req.get("extra_info") is not None:
+                return None
+            item = _item(req)
+            if item is not None:
+                items.append(item)
+        return items, {}, "MultiRequest"
+    item = _item(request)
+    return ([item] if item is not None else []), {}, "Request"
+
+
+def parse_items_pydantic(request):
+    """pydantic路径, 按common_data_type规范解析请求, 返回值同parse_items"""
+    others = {}
+    if "multi_data" in request:
+        req = MultiRequest(**request)
+        items = [r.data.item for r in req.multi_data if r.data.item is not None]
+        req_type = "MultiRequest"
+    else:
+        req = Request(**request)
+        items = [req.data.item] if req.data.item is not None else []
+        req_type = "Request"
+    if req.extra_info is not None and req.extra_info.others is not None:
+        for key, value in req.extra_info.others:
+            others[key[1]] = value[1]
+    return items, others, req_type
+
+
+def _item(request):
+    data = request.get("data")
+    if not isinstance(data, dict):
+        raise ValueError("invalid request: data must be an object with an item field")
+    item = data.get("item")
+    if item is not None and not isinstance(item, str):
+        raise ValueError("invalid request: item must be a string")
+    return item
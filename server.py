@@ -0,0 +1,68 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : server.py
+@Time    : 2026/10/19 10:12:36
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : kserve ModelServer的predict路由, 请求体及请求头原样交给Transformer
+
+kserve的PredictHandler对请求体做json.loads, 非json的请求体直接返回400, 也不把请求头传给模型。
+这里在同一个predict地址上注册自己的handler(优先于kserve的路由):
+    1. 二进制请求(multipart/form-data, KServe v2 binary tensor, image/*或application/octet-stream):
+       请求体bytes及请求头交给Transformer.preprocess, 由binary_request解析
+    2. json请求: Content-Type为json时请求体bytes原样交给Transformer解析(可走fast_json),
+       否则按json解析后传入; 请求头(如X-Request-Timeout-Ms)同样传给preprocess
+    3. CloudEvent请求沿用kserve的处理
+'''
+
+import json
+from http import HTTPStatus
+
+import kserve
+import tornado.web
+from kserve.handlers import PredictHandler
+from cloudevents.sdk.converters.util import has_binary_headers
+
+from .binary_request import get_header, is_binary_request
+
+
+class TransformerPredictHandler(PredictHandler):
+    """predict地址的handler, 请求体及请求头原样交给模型"""
+
+    async def post(self, name: str):
+        headers = dict(self.request.headers.get_all())
+        if has_binary_headers(headers):
+            return await super().post(name)
+
+        body = self.request.body
+        if not is_binary_request(headers) and "json" not in (get_header(headers, "content-type") or ""):
+            try:
+                body = json.loads(body)
+            except json.decoder.JSONDecodeError as e:
+                raise tornado.web.HTTPError(
+                    status_code=HTTPStatus.BAD_REQUEST, reason="Unrecognized request format: %s" % e)
+
+        model = self.get_model(name)
+        try:
+            request = await model.preprocess(body, headers)
+        except ValueError as e:
+            # 请求体格式错误(如multipart没有图片, json中的字段不合法)
+            raise tornado.web.HTTPError(status_code=HTTPStatus.BAD_REQUEST, reason=str(e))
+        request = model.validate(request)
+        response = await model.predict(request)
+        response = model.postprocess(response)
+        self.write(response)
+
+
+class ModelServer(kserve.ModelServer):
+    """在kserve的路由之前注册TransformerPredictHandler"""
+
+    def create_application(self):
+        app = super().create_application()
+        # add_handlers添加的规则优先于构造时的路由
+        app.add_handlers(r".*", [
+            (r"/v1/models/([a-zA-Z0-9_-]+):predict",
+             TransformerPredictHandler, dict(models=self.registered_models)),
+        ])
+        return app
@@ -0,0 +1,171 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : shm_pool.py
+@Time    : 2026/10/18 15:41:08
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 与同节点triton之间的系统共享内存传输, 输入输出张量不再经过protobuf/http序列化
+'''
+
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+import tritonclient.utils.shared_memory as shm
+
+
+# 共享内存中的张量描述, 作为input_dict/output_shm的值传给TritonHttpClient/TritonGrpcClient
+ShmTensor = namedtuple("ShmTensor", ["region_name", "byte_size", "shape", "dtype"])
+
+
+class ShmRegion():
+    """一对已注册的输入/输出共享内存区域, 容量为capacity张图片"""
+
+    def __init__(self, pool, capacity, index):
+        self.pool = pool
+        self.capacity = capacity
+        prefix = "{}_{}_{}".format(pool.name_prefix, capacity, index)
+
+        self.input_name = prefix + "_input"
+        self.output_name = prefix + "_output"
+        self.input_size = capacity * pool.input_item_bytes
+        self.output_size = capacity * pool.output_item_bytes
+
+        self.input_handle = shm.create_shared_memory_region(
+            self.input_name, "/" + self.input_name, self.input_size)
+        self.output_handle = shm.create_shared_memory_region(
+            self.output_name, "/" + self.output_name, self.output_size)
+        self.batch_size = 0
+
+    def input_array(self, batch_size):
+        """输入区域的numpy视图, 直接写入即写入共享内存"""
+        self.batch_size = batch_size
+        return shm.get_contents_as_numpy(
+            self.input_handle, self.pool.input_dtype, (batch_size,) + self.pool.input_shape)
+
+    def output_array(self):
+        """输出区域的numpy视图, 需在release之前读取"""
+        return shm.get_contents_as_numpy(
+            self.output_handle, self.pool.output_dtype, (self.batch_size,) + self.pool.output_shape)
+
+    def input_tensor(self):
+        return ShmTensor(self.input_name, self.batch_size * self.pool.input_item_bytes,
+                         (self.batch_size,) + self.pool.input_shape, self.pool.input_dtype)
+
+    def output_tensor(self):
+        return ShmTensor(self.output_name, self.batch_size * self.pool.output_item_bytes,
+                         (self.batch_size,) + self.pool.output_shape, self.pool.output_dtype)
+
+    def destroy(self):
+        shm.destroy_shared_memory_region(self.input_handle)
+        shm.destroy_shared_memory_region(self.output_handle)
+
+
+class SharedMemoryPool():
+    """预注册的共享内存区域池
+
+    区域按batch大小向上取整到2的幂分桶, 每个桶在第一次使用时创建并向triton注册,
+    用完通过release归还复用, close时向triton注销并释放全部区域。
+
+    Note:
+    -----
+    只适用于transformer与triton部署在同一节点(共享/dev/shm)的场景。区域只依赖tritonclient
+    的register_system_shared_memory/unregister_system_shared_memory接口, 测试时可用读取
+    共享内存的本地替身客户端代替triton。
+    """
+
+    def __init__(self, tritonclient, input_shape=(3, 112, 112), input_dtype=np.float32,
+                 output_shape=(1,), output_dtype=np.float32, max_batch_size=64, regions_per_size=4):
+        """
+        Args:
+            tritonclient (TritonHttpClient or TritonGrpcClient): 用于注册/注销共享内存的同步客户端.
+            input_shape (tuple, optional): 单张图片的输入张量形状. Defaults to (3, 112, 112).
+            input_dtype (numpy.dtype, optional): 输入张量数据类型. Defaults to np.float32.
+            output_shape (tuple, optional): 单张图片的输出张量形状. Defaults to (1,).
+            output_dtype (numpy.dtype, optional): 输出张量数据类型. Defaults to np.float32.
+            max_batch_size (int, optional): 单个区域最大容纳的图片数. Defaults to 64.
+            regions_per_size (int, optional): 每个桶最多创建的区域数, 超出时退回普通传输. Defaults to 4.
+        """
+        self.tritonclient = tritonclient
+        self.input_shape = tuple(input_shape)
+        self.input_dtype = np.dtype(input_dtype)
+        self.output_shape = tuple(output_shape)
+        self.output_dtype = np.dtype(output_dtype)
+        self.input_item_bytes = int(np.prod(self.input_shape)) * self.input_dtype.itemsize
+        self.output_item_bytes = int(np.prod(self.output_shape)) * self.output_dtype.itemsize
+        self.max_batch_size = max_batch_size
+        self.regions_per_size = regions_per_size
+        self.name_prefix = "fq_{}_{}".format(os.getpid(), id(self))
+
+        self._free = {}
+        self._count = {}
+        self._regions = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self, batch_size):
+        """取出一个可容纳batch_size张图片的区域, 没有可用区域时返回None(调用方退回普通传输)"""
+        if batch_size > self.max_batch_size:
+            return None
+        capacity = 1
+        while capacity < batch_size:
+            capacity *= 2
+
+        with self._lock:
+            if self._closed:
+                return None
+            free = self._free.setdefault(capacity, [])
+            if free:
+                return free.pop()
+            index = self._count.get(capacity, 0)
+            if index >= self.regions_per_size:
+                return None
+            self._count[capacity] = index + 1
+
+        region = ShmRegion(self, capacity, index)
+        registered = False
+        try:
+            self.tritonclient.register_system_shared_memory(
+                region.input_name, "/" + region.input_name, region.input_size)
+            registered = True
+            self.tritonclient.register_system_shared_memory(
+                region.output_name, "/" + region.output_name, region.output_size)
+        except Exception:
+            # 输出区域注册失败时注销已注册的输入区域, triton上不留下指向已释放区域的注册
+            if registered:
+                try:
+                    self.tritonclient.unregister_system_shared_memory(region.input_name)
+                except Exception as e:
+                    print("unregister shared memory {} failed: {}".format(region.input_name, e))
+            region.destroy()
+            with self._lock:
+                self._count[capacity] -= 1
+            raise
+        with self._lock:
+            self._regions.append(region)
+        return region
+
+    def release(self, region):
+        with self._lock:
+            if not self._closed:
+                self._free[region.capacity].append(region)
+
+    def close(self):
+        """向triton注销并释放全部区域"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            regions, self._regions = self._regions, []
+            self._free.clear()
+
+        for region in regions:
+            for name in (region.input_name, region.output_name):
+                try:
+                    self.tritonclient.unregister_system_shared_memory(name)
+                except Exception as e:
+                    print("unregister shared memory {} failed: {}".format(name, e))
+            region.destroy()
+
@@ -0,0 +1,43 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : conftest.py
+@Time    : 2026/10/19 10:40:12
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 测试公共配置, 包目录名不固定(部署时为<your_model_transformer_dir>), 按所在目录名导入
+
+在包目录的上一级目录运行: python -m pytest <your_model_transformer_dir>/tests
+依赖(kserve, tritonclient, common_data_type等)缺失时对应测试跳过。
+'''
+
+import os
+import sys
+
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(PACKAGE_DIR)
+DATA_DIR = os.path.join(PACKAGE_DIR, "data")
+if os.path.dirname(PACKAGE_DIR) not in sys.path:
+    sys.path.insert(0, os.path.dirname(PACKAGE_DIR))
+
+
+def import_module(name):
+    """导入包内模块, 模块或其依赖不可用时跳过测试"""
+    return pytest.importorskip("%s.%s" % (PACKAGE, name))
+
+
+@pytest.fixture(scope="session")
+def image_bytes():
+    with open(os.path.join(DATA_DIR, "1-Harry_Belafonte_1.jpg"), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def mock_triton():
+    """进程内模拟triton服务, 端口自动分配"""
+    mock = import_module("mock_triton")
+    server = mock.MockTritonServer().start()
+    yield server
+    server.stop()
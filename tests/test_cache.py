@@ -0,0 +1,69 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : test_cache.py
+@Time    : 2026/10/19 11:48:30
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 分数缓存测试
+'''
+
+import pytest
+
+from conftest import import_module
+
+cache = import_module("cache")
+
+
+def test_only_base64_items_cacheable():
+    assert cache.cacheable_item("data:image/jpeg;base64,/9j/")
+    assert not cache.cacheable_item("path:data/1.jpg")
+    assert not cache.cacheable_item("http://127.0.0.1/1.jpg")
+
+
+def test_lru_eviction():
+    score_cache = cache.ScoreCache("m", max_entries=2)
+    keys = [cache.hash_buffer(bytes([i])) for i in range(3)]
+    score_cache.put(keys[0], 0.1)
+    score_cache.put(keys[1], 0.2)
+    assert score_cache.get(keys[0]) == 0.1
+    score_cache.put(keys[2], 0.3)
+    # keys[1]最久未使用, 被淘汰
+    assert score_cache.get(keys[1]) is None
+    assert score_cache.get(keys[2]) == 0.3
+    assert score_cache.stats() == dict(hits=2, misses=1, evictions=1, entries=2, bytes=score_cache.stats()["bytes"])
+
+
+def test_ttl_expire(monkeypatch):
+    score_cache = cache.ScoreCache("m", ttl=10)
+    key = cache.hash_item("data:image/jpeg;base64,/9j/")
+    score_cache.put(key, 0.5)
+    now = cache.time.time()
+    monkeypatch.setattr(cache.time, "time", lambda: now + 11)
+    assert score_cache.get(key) is None
+    assert score_cache.stats()["entries"] == 0
+
+
+
+def test_prometheus_metrics():
+    registry = pytest.importorskip("prometheus_client").REGISTRY
+
+    def value(name, labels=None):
+        return registry.get_sample_value(name, labels or {}) or 0
+
+    hits, misses = value("facequality_cache_lookups_total", {"result": "hit"}), \
+        value("facequality_cache_lookups_total", {"result": "miss"})
+    evictions = value("facequality_cache_evictions_total")
+
+    score_cache = cache.ScoreCache("m", max_entries=1)
+    keys = [cache.hash_buffer(bytes([i])) for i in range(2)]
+    score_cache.get(keys[0])
+    score_cache.put(keys[0], 0.1)
+    score_cache.get(keys[0])
+    score_cache.put(keys[1], 0.2)
+
+    assert value("facequality_cache_lookups_total", {"result": "hit"}) == hits + 1
+    assert value("facequality_cache_lookups_total", {"result": "miss"}) == misses + 1
+    assert value("facequality_cache_evictions_total") == evictions + 1
+    assert value("facequality_cache_entries") == 1
+    assert value("facequality_cache_bytes") == score_cache.stats()["bytes"]
@@ -0,0 +1,159 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : test_mock_triton.py
+@Time    : 2026/10/19 15:02:33
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 模拟triton服务测试, TritonHttpClient/TritonGrpcClient及FaceQualityPrediction不做修改直接连接
+'''
+
+import time
+
+import numpy as np
+import pytest
+
+from conftest import import_module
+
+mock = import_module("mock_triton")
+triton_client = import_module("triton_client")
+prediction = import_module("prediction")
+
+from tritonclient.utils import InferenceServerException
+
+MODEL = "face_quality_trt_fp16"
+
+
+def create_client(server, transport):
+    if transport == "grpc":
+        return triton_client.TritonGrpcClient(server.grpc_url)
+    return triton_client.TritonHttpClient(server.http_url)
+
+
+def input_dict(batch_size, value=0.5):
+    return {"input.1": np.full((batch_size, 3, 112, 112), value, dtype=np.float32)}
+
+
+@pytest.fixture(params=["grpc", "http"])
+def client(request, mock_triton):
+    client = create_client(mock_triton, request.param)
+    yield client
+    client.close()
+
+
+def test_model_spec(client):
+    spec = client.load_model(MODEL)
+    assert spec.max_batch_size == 64
+    assert spec.inputs["input.1"] == ("FP32", (3, 112, 112))
+    assert spec.outputs["1346"][0] == "FP32"
+
+
+def test_infer_deterministic(client, mock_triton):
+    result = client.infer(MODEL, input_dict(2), ["1346"])
+    scores = result.as_numpy("1346")
+    assert scores.shape == (2, 1)
+    np.testing.assert_allclose(scores, 1.0 / (1.0 + np.exp(-0.5)), rtol=1e-6)
+    assert mock_triton.backend.stats()["batch_sizes"] == {2: 1}
+
+
+def test_request_bytes(client, mock_triton):
+    client.infer(MODEL, input_dict(2), ["1346"])
+    # 输入张量之外为请求头, json头部或protobuf字段的开销
+    tensor_bytes = 2 * 3 * 112 * 112 * 4
+    assert tensor_bytes < mock_triton.backend.stats()["request_bytes"] < tensor_bytes + 1024
+
+
+def test_prediction_same_scores_over_both_transports(mock_triton):
+    images = [np.full((90, 80, 3), i * 50, dtype=np.uint8) for i in range(4)]
+    scores = []
+    for transport in ("grpc", "http"):
+        client = create_client(mock_triton, transport)
+        try:
+            scores.append(prediction.FaceQualityPrediction(client).infer(images))
+        finally:
+            client.close()
+    assert len(scores[0]) == 4
+    assert scores[0] == scores[1]
+    assert len(set(scores[0])) == 4
+
+
+def test_chunked_grpc_async(mock_triton):
+    client = create_client(mock_triton, "grpc")
+    try:
+        images = [np.full((90, 80, 3), i * 30, dtype=np.uint8) for i in range(5)]
+        expected = prediction.FaceQualityPrediction(client).infer(images)
+        predictor = prediction.FaceQualityPrediction(client, chunk_size=2, max_chunked_requests=3)
+        futures = [predictor.grpc_async_infer(images) for _ in range(4)]
+        assert [future.result(timeout=10) for future in futures] == [expected] * 4
+        # 分块线程池按max_chunked_requests创建
+        assert predictor._chunk_executor._max_workers == 3
+        assert mock_triton.backend.stats()["batch_sizes"] == {5: 1, 2: 8, 1: 4}
+    finally:
+        client.close()
+
+
+def test_invalid_requests(client):
+    with pytest.raises(InferenceServerException):
+        client.infer("unknown_model", input_dict(1), ["1346"])
+    # 超过模型的max_batch_size
+    with pytest.raises(InferenceServerException):
+        client.infer(MODEL, input_dict(65), ["1346"])
+
+
+@pytest.mark.parametrize("transport", ["grpc", "http"])
+def test_latency_injection(transport):
+    with mock.MockTritonServer(latency_ms=100, per_image_ms=10) as server:
+        client = create_client(server, transport)
+        try:
+            t1 = time.perf_counter()
+            client.infer(MODEL, input_dict(4), ["1346"])
+            assert time.perf_counter() - t1 >= 0.14
+        finally:
+            client.close()
+
+
+@pytest.mark.parametrize("transport", ["grpc", "http"])
+def test_no_added_latency(mock_triton, transport):
+    # 不注入延迟时单张图片的调用应在毫秒级, 不受Nagle及延迟ACK影响(约40ms)
+    client = create_client(mock_triton, transport)
+    try:
+        predictor = prediction.FaceQualityPrediction(client)
+        images = [np.zeros((112, 112, 3), dtype=np.uint8)]
+        predictor.infer(images)
+        t1 = time.perf_counter()
+        for _ in range(10):
+            predictor.infer(images)
+        assert (time.perf_counter() - t1) / 10 < 0.02
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize("transport", ["grpc", "http"])
+def test_error_injection(transport):
+    with mock.MockTritonServer(error_rate=1.0, error_status="UNAVAILABLE") as server:
+        client = create_client(server, transport)
+        try:
+            with pytest.raises(InferenceServerException, match="mock injected error") as e:
+                client.infer(MODEL, input_dict(1), ["1346"])
+            if transport == "http":
+                # tritonclient 2.14的http客户端错误不带状态码
+                assert e.value.status() in (None, "503")
+            else:
+                assert e.value.status() == "StatusCode.UNAVAILABLE"
+        finally:
+            client.close()
+        assert server.backend.stats()["errors"] == 1
+
+
+def test_uint8_model():
+    model = mock.MockFaceQualityModel(datatype="UINT8", max_batch_size=8)
+    with mock.MockTritonServer(model=model) as server:
+        client = create_client(server, "grpc")
+        try:
+            spec = client.load_model(MODEL)
+            predictor = prediction.FaceQualityPrediction(client)
+            assert predictor.configure(spec) == "UINT8"
+            assert predictor.chunk_size == 8
+            assert len(predictor.infer([np.zeros((112, 112, 3), dtype=np.uint8)] * 3)) == 3
+        finally:
+            client.close()
@@ -0,0 +1,48 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : test_serialization.py
+@Time    : 2026/10/19 11:20:44
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 快速路径与pydantic路径的一致性检查, common_data_type升级后字段默认值或类型转换可能变化, 升级后需重新运行
+'''
+
+import json
+
+import numpy as np
+import pytest
+
+from conftest import import_module
+
+serialization = import_module("serialization")
+
+ITEM = "data:image/jpeg;base64,/9j/"
+
+
+@pytest.mark.parametrize("scores", [
+    [],
+    [0.5],
+    np.array([0.0, 0.123456789, 1.0], dtype=np.float32),
+    [np.float32(0.25), 0.75, 1],
+])
+def test_response_conformance(scores):
+    fast, slow = serialization.build_response(scores), serialization.build_response_pydantic(scores)
+    assert fast == slow
+    assert json.dumps(fast) == json.dumps(slow)
+    assert serialization.dumps(fast) == serialization.dumps(slow)
+
+
+@pytest.mark.parametrize("request_body", [
+    {"data": {"item": ITEM}},
+    {"data": {}},
+    {"multi_data": [{"data": {"item": ITEM}}, {"data": {"item": "path:data/1.jpg"}}]},
+    {"multi_data": []},
+])
+def test_request_conformance(request_body):
+    assert serialization.parse_items(request_body) == serialization.parse_items_pydantic(request_body)
+
+
+def test_loads_json_bytes():
+    body = json.dumps({"multi_data": [{"data": {"item": ITEM}}]}).encode()
+    assert serialization.loads(body) == json.loads(body)
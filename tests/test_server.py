@@ -0,0 +1,126 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : test_server.py
+@Time    : 2026/10/19 10:52:08
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : predict路由测试, 经过真实的tornado服务发送json及二进制请求
+'''
+
+import json
+import asyncio
+
+from conftest import import_module
+
+server = import_module("server")
+binary_request = import_module("binary_request")
+
+import kserve
+from kserve.model_repository import ModelRepository
+from tornado.httpserver import HTTPServer
+from tornado.httpclient import AsyncHTTPClient
+from tornado.testing import bind_unused_port
+
+
+class EchoModel(kserve.Model):
+    """返回preprocess收到的请求体类型及请求头"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.ready = True
+
+    async def preprocess(self, request, headers=None):
+        if request == b"bad":
+            raise ValueError("invalid body")
+        return {
+            "type": type(request).__name__,
+            "size": len(request),
+            "content_type": binary_request.get_header(headers, "content-type"),
+            "timeout": binary_request.get_header(headers, "x-request-timeout-ms"),
+        }
+
+    async def predict(self, request):
+        return request
+
+    def postprocess(self, request):
+        return request
+
+
+async def fetch(model, body, headers=None):
+    """启动ModelServer的http应用, 向predict地址发送一个请求, 返回状态码及json结果"""
+    model_server = server.ModelServer(registered_models=ModelRepository())
+    model_server.register_model(model)
+    sock, port = bind_unused_port()
+    http_server = HTTPServer(model_server.create_application())
+    http_server.add_sockets([sock])
+    try:
+        response = await AsyncHTTPClient().fetch(
+            "http://127.0.0.1:%d/v1/models/%s:predict" % (port, model.name),
+            method="POST", body=body, headers=headers, raise_error=False)
+    finally:
+        http_server.stop()
+    return response.code, json.loads(response.body)
+
+
+def post(model, body, headers=None):
+    return asyncio.run(fetch(model, body, headers))
+
+
+def test_multipart_body_passed_raw(image_bytes):
+    body, content_type = binary_request.encode_multipart([image_bytes, image_bytes])
+    code, result = post(EchoModel("echo"), body, {"Content-Type": content_type, "X-Request-Timeout-Ms": "500"})
+    assert code == 200
+    assert result == {"type": "bytes", "size": len(body), "content_type": content_type, "timeout": "500"}
+
+
+def test_v2_binary_body_passed_raw(image_bytes):
+    body, headers = binary_request.encode_v2_binary([image_bytes])
+    code, result = post(EchoModel("echo"), body, headers)
+    assert code == 200
+    assert result["type"] == "bytes" and result["size"] == len(body)
+
+
+def test_image_body_passed_raw(image_bytes):
+    code, result = post(EchoModel("echo"), image_bytes, {"Content-Type": "image/jpeg"})
+    assert code == 200
+    assert result["type"] == "bytes" and result["size"] == len(image_bytes)
+
+
+def test_json_body():
+    body = json.dumps({"multi_data": []})
+    # json请求体原样传入, 由Transformer解析(fast_json)
+    code, result = post(EchoModel("echo"), body, {"Content-Type": "application/json"})
+    assert code == 200 and result["type"] == "bytes"
+    # 没有Content-Type时按json解析后传入
+    code, result = post(EchoModel("echo"), body)
+    assert code == 200 and result["type"] == "dict"
+
+
+def test_bad_request():
+    code, result = post(EchoModel("echo"), b"not json", {"Content-Type": "text/plain"})
+    assert code == 400 and "error" in result
+    code, result = post(EchoModel("echo"), b"bad", {"Content-Type": "application/octet-stream"})
+    assert code == 400 and result["error"] == "invalid body"
+
+
+def test_transformer_binary_requests(mock_triton, image_bytes):
+    transformer = import_module("transformer")
+    model = transformer.Transformer("facequality", mock_triton.grpc_url)
+    assert model.ready
+
+    multipart, content_type = binary_request.encode_multipart([image_bytes, image_bytes])
+    v2_binary, v2_headers = binary_request.encode_v2_binary([image_bytes])
+    requests = [
+        (multipart, {"Content-Type": content_type}, 2),
+        (v2_binary, v2_headers, 1),
+        (image_bytes, {"Content-Type": "image/jpeg"}, 1),
+    ]
+
+    async def run():
+        for body, headers, count in requests:
+            code, result = await fetch(model, body, headers)
+            assert code == 200, result
+            assert len(result["multi_data"]) == count
+
+    asyncio.run(run())
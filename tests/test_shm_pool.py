@@ -0,0 +1,165 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : test_shm_pool.py
+@Time    : 2026/10/19 14:38:52
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : 共享内存传输测试, 以读取共享内存的本地替身客户端及模拟triton服务代替真实triton
+'''
+
+import os
+import mmap
+
+import numpy as np
+import pytest
+
+from conftest import import_module
+
+if not os.path.isdir("/dev/shm"):
+    pytest.skip("system shared memory (/dev/shm) is not available", allow_module_level=True)
+
+shm_pool = import_module("shm_pool")
+
+
+class ShmStandIn():
+    """替身客户端, 记录注册/注销并按注册的key直接读取共享内存"""
+
+    def __init__(self, fail_on=None):
+        self.regions = {}
+        self.registered = []
+        self.fail_on = fail_on
+
+    def register_system_shared_memory(self, name, key, byte_size):
+        if self.fail_on is not None and name.endswith(self.fail_on):
+            raise RuntimeError("register {} failed".format(name))
+        self.regions[name] = (key, byte_size)
+        self.registered.append(name)
+
+    def unregister_system_shared_memory(self, name):
+        self.regions.pop(name)
+
+    def read(self, tensor):
+        key, byte_size = self.regions[tensor.region_name]
+        with open("/dev/shm" + key, "rb") as f, mmap.mmap(f.fileno(), byte_size, access=mmap.ACCESS_READ) as buffer:
+            return np.frombuffer(buffer[:tensor.byte_size], dtype=tensor.dtype).reshape(tensor.shape)
+
+
+@pytest.fixture
+def stand_in():
+    return ShmStandIn()
+
+
+def test_input_written_in_place(stand_in):
+    pool = shm_pool.SharedMemoryPool(stand_in, max_batch_size=8)
+    try:
+        region = pool.acquire(3)
+        assert region.capacity == 4
+        data = np.random.rand(3, 3, 112, 112).astype(np.float32)
+        region.input_array(3)[:] = data
+        tensor = region.input_tensor()
+        assert tensor.shape == (3, 3, 112, 112) and tensor.byte_size == data.nbytes
+        assert (stand_in.read(tensor) == data).all()
+    finally:
+        pool.close()
+
+
+def test_region_reuse(stand_in):
+    pool = shm_pool.SharedMemoryPool(stand_in, max_batch_size=8, regions_per_size=1)
+    try:
+        region = pool.acquire(2)
+        # 每个桶只允许一个区域, 在用时退回普通传输
+        assert pool.acquire(2) is None
+        pool.release(region)
+        assert pool.acquire(1) is not region
+        assert pool.acquire(2) is region
+        # 超过max_batch_size的batch不使用共享内存
+        assert pool.acquire(9) is None
+        assert len(stand_in.registered) == 4
+    finally:
+        pool.close()
+
+
+def test_failed_output_registration_rolls_back():
+    stand_in = ShmStandIn(fail_on="_output")
+    pool = shm_pool.SharedMemoryPool(stand_in, max_batch_size=8, regions_per_size=1)
+    try:
+        with pytest.raises(RuntimeError):
+            pool.acquire(2)
+        # 已注册的输入区域被注销, 本地区域释放, 名额归还
+        assert stand_in.regions == {}
+        assert not [name for name in os.listdir("/dev/shm") if name.startswith(pool.name_prefix)]
+        stand_in.fail_on = None
+        assert pool.acquire(2) is not None
+    finally:
+        pool.close()
+
+
+def test_close_unregisters_and_destroys(stand_in):
+    pool = shm_pool.SharedMemoryPool(stand_in, max_batch_size=8)
+    region = pool.acquire(4)
+    pool.release(region)
+    pool.close()
+    assert stand_in.regions == {}
+    assert not os.path.exists("/dev/shm/" + region.input_name)
+    assert not os.path.exists("/dev/shm/" + region.output_name)
+    assert pool.acquire(4) is None
+
+
+@pytest.mark.parametrize("transport", ["grpc", "http"])
+def test_infer_through_shared_memory(mock_triton, transport):
+    triton_client = import_module("triton_client")
+    prediction = import_module("prediction")
+    if transport == "grpc":
+        client = triton_client.TritonGrpcClient(mock_triton.grpc_url)
+    else:
+        client = triton_client.TritonHttpClient(mock_triton.http_url)
+    pool = shm_pool.SharedMemoryPool(client, max_batch_size=8)
+    try:
+        images = [np.full((160, 120, 3), i * 40, dtype=np.uint8) for i in range(5)]
+        expected = prediction.FaceQualityPrediction(client).infer(images)
+        predictor = prediction.FaceQualityPrediction(client, shm_pool=pool)
+        assert predictor.infer(images) == expected
+        assert predictor.infer(images) == expected
+        # 两次调用复用同一对区域
+        assert len(mock_triton.backend.shm_status()) == 2
+    finally:
+        pool.close()
+        client.close()
+    assert mock_triton.backend.shm_status() == {}
+
+
+def test_register_without_healthy_endpoint():
+    triton_client = import_module("triton_client")
+    client = triton_client.TritonGrpcClient("127.0.0.1:1", health_interval=0, require_ready=False, connect_timeout=0.5)
+    pool = shm_pool.SharedMemoryPool(client, max_batch_size=8)
+    try:
+        with pytest.raises(Exception, match="no healthy triton endpoint"):
+            pool.acquire(1)
+        assert client.shm_regions == {}
+    finally:
+        pool.close()
+        client.close()
+
+
+def test_reregister_after_triton_restart(mock_triton):
+    triton_client = import_module("triton_client")
+    prediction = import_module("prediction")
+    client = triton_client.TritonGrpcClient(mock_triton.grpc_url, health_interval=0)
+    pool = shm_pool.SharedMemoryPool(client, max_batch_size=8)
+    try:
+        predictor = prediction.FaceQualityPrediction(client, shm_pool=pool)
+        images = [np.zeros((112, 112, 3), dtype=np.uint8)] * 2
+        expected = predictor.infer(images)
+        # 模拟triton重启: 服务端的共享内存注册全部丢失
+        mock_triton.backend.unregister_shm()
+        with pytest.raises(Exception, match="shared memory region"):
+            predictor.infer(images)
+        # 出错的连接被剔除, 重连时补注册
+        assert client.triton_client is None
+        assert client.reconnect()
+        assert len(mock_triton.backend.shm_status()) == 2
+        assert predictor.infer(images) == expected
+    finally:
+        pool.close()
+        client.close()
@@ -0,0 +1,120 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : test_url_fetch.py
+@Time    : 2026/10/19 14:05:17
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : url图片下载测试, 对本地http.server stub服务下载图片
+'''
+
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from conftest import import_module
+
+pytest.importorskip("requests")
+utils = import_module("utils")
+
+SLOW_SECONDS = 0.2
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """/slow/*延迟返回, /flaky第一次返回503, /missing返回404, 其他路径返回测试图片"""
+
+    protocol_version = "HTTP/1.1"
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        super().handle()
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.paths.append(self.path)
+            attempts = self.server.paths.count(self.path)
+        if self.path.startswith("/slow"):
+            time.sleep(SLOW_SECONDS)
+        if self.path == "/missing" or (self.path == "/flaky" and attempts == 1):
+            self._send(b"", 404 if self.path == "/missing" else 503)
+            return
+        self._send(self.server.image)
+
+    def _send(self, body, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def image_server(image_bytes):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    server.daemon_threads = True
+    server.image = image_bytes
+    server.paths = []
+    server.connections = 0
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = "http://127.0.0.1:{}".format(server.server_address[1])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = utils.UrlImageFetcher(max_workers=8, pool_maxsize=8, timeout=(1, 2), retries=2, backoff_factor=0)
+    yield fetcher
+    fetcher.close()
+
+
+def test_fetch_decodes_image(image_server, fetcher, image_bytes):
+    image = fetcher.fetch(image_server.url + "/1.jpg")
+    expected = utils.BufferImageDecode(image_bytes)
+    assert image.shape == expected.shape
+    assert (image == expected).all()
+
+
+def test_fetch_concurrently(image_server, fetcher):
+    items = [image_server.url + "/slow/{}.jpg".format(i) for i in range(8)]
+    t1 = time.perf_counter()
+    images = utils.parse_item_images(items, fetcher=fetcher)
+    elapsed = time.perf_counter() - t1
+    assert len(images) == 8
+    # 串行下载需要8 * SLOW_SECONDS
+    assert elapsed < 4 * SLOW_SECONDS
+
+
+def test_keep_alive(image_server, fetcher):
+    for i in range(5):
+        fetcher.fetch(image_server.url + "/{}.jpg".format(i))
+    assert image_server.connections == 1
+
+
+def test_retry_on_5xx(image_server, fetcher):
+    assert fetcher.fetch(image_server.url + "/flaky") is not None
+    assert image_server.paths == ["/flaky", "/flaky"]
+
+
+def test_errors_listed_by_index(image_server, fetcher):
+    items = [image_server.url + "/1.jpg", image_server.url + "/missing"]
+    with pytest.raises(ValueError, match=r"item\[1\]: 404"):
+        utils.parse_item_images(items, fetcher=fetcher)
+
+
+def test_read_timeout(image_server):
+    fetcher = utils.UrlImageFetcher(timeout=(1, SLOW_SECONDS / 4), retries=0)
+    try:
+        with pytest.raises(Exception, match="timed out"):
+            fetcher.fetch(image_server.url + "/slow/1.jpg")
+    finally:
+        fetcher.close()
@@ -8,171 +8,755 @@
 @Desc    : None
 '''
 
+import os
 import time
+import json
+import atexit
+import asyncio
+import threading
+import contextvars
 import kserve
+import cv2
+from contextlib import contextmanager
 import numpy as np
-from queue import Queue
 from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
 
 
-from .utils import parse_item_image
-from .common_data_type.request import Request, MultiRequest
-from .common_data_type.response import Response, ResponseItem, ExtraInfo, MultiResponse
+from .utils import parse_item_images, decode_image_buffers, UrlImageFetcher
+from .binary_request import parse_binary_request, get_header
 
-from .prediction import FaceQualityPrediction
-from .triton_client import TritonHttpClient, TritonGrpcClient
+from .prediction import FaceQualityPrediction, INPUT_DTYPES
+from .batcher import DynamicBatcher
+from .cache import ScoreCache, hash_item, hash_buffer, cacheable_item
+from .shm_pool import SharedMemoryPool
+from .cpu_backend import OnnxRuntimeClient, FallbackClient
+from .tuner import AutoTuner, AsyncAdjustableSemaphore
+from .pipeline import Pipeline
+from . import serialization
+from .admission import (AdmissionController, TIMEOUT_HEADER, parse_deadline, set_deadline, request_deadline,
+                        remaining, check_deadline, http_error)
+from . import metrics
+from .triton_client import TritonHttpClient, TritonGrpcClient, AsyncTritonHttpClient, AsyncTritonGrpcClient
+from tritonclient.utils import triton_to_np_dtype, InferenceServerException
 
+# 预热时每个batch大小的调用次数
+WARMUP_ROUNDS = 2
+# triton不可用时启动, 等待triton的初始重试间隔及最大间隔(秒)
+STARTUP_RETRY_INTERVAL = 0.5
+STARTUP_MAX_BACKOFF = 10
 
 class Transformer(kserve.Model):
-    def __init__(self, name: str, predictor_host: str, use_grpc=True):
-        super().__init__(name)
+    def __init__(self, name: str, predictor_host: str, use_grpc=True,
+                 infer_mode="async", max_inflight=100, infer_timeout=30,
+                 max_batch_size=0, max_batch_wait_ms=5, decode_workers=4,
+                 url_timeout=10, url_retries=2,
+                 cache_size=0, cache_ttl=3600, cache_max_mb=64, use_shm=False,
+                 cpu_mode="off", cpu_model_path=None, cpu_threads=4, cpu_workers=1, cpu_latency_ms=100,
+                 auto_tune=False, latency_slo_ms=100, tune_interval=30, chunk_size=64, max_chunks_inflight=4,
+                 pipeline_config=None, request_timeout=None, max_pending=0, shed_status=429,
+                 fast_json=False, reduced_decode=False, input_dtype="auto",
+                 triton_model="face_quality_trt_fp16", input_name="input.1", output_name="1346", warmup=False,
+                 workers=1):
+        """
+        Args:
+            name (str): 服务名称.
+            predictor_host (str): triton服务地址.
+            use_grpc (bool, optional): 是否使用grpc调用triton. Defaults to True.
+            infer_mode (str, optional): triton调用方式, sync(同步), async(异步回调)或aio(asyncio). Defaults to "async".
+            max_inflight (int, optional): 异步调用时同时在途的triton请求上限. Defaults to 100.
+            infer_timeout (float, optional): 单次triton调用超时时间(秒). Defaults to 30.
+            max_batch_size (int, optional): 动态组batch的最大图片数, 0表示不开启. Defaults to 0.
+            max_batch_wait_ms (int, optional): 动态组batch的最大等待时间(毫秒). Defaults to 5.
+            decode_workers (int, optional): 批量图片并行解码及resize的线程数, 0表示串行处理. Defaults to 4.
+            url_timeout (float, optional): url图片下载的读取超时时间(秒). Defaults to 10.
+            url_retries (int, optional): url图片下载失败的重试次数. Defaults to 2.
+            cache_size (int, optional): 分数缓存最大条目数, 0表示不开启. Defaults to 0.
+            cache_ttl (float, optional): 分数缓存有效期(秒). Defaults to 3600.
+            cache_max_mb (int, optional): 分数缓存内存上限(MB). Defaults to 64.
+            use_shm (bool, optional): 与同节点triton之间通过系统共享内存传输输入输出张量. Defaults to False.
+            cpu_mode (str, optional): ONNX Runtime CPU后端的使用方式, off(不使用), only(只使用CPU, 不连接triton),
+                failover(triton失败或延迟超过阈值时全部降级到CPU)或overflow(triton延迟超过阈值时分流到CPU). Defaults to "off".
+            cpu_model_path (str, optional): CPU后端使用的onnx模型文件, cpu_mode不为off时必须指定. Defaults to None.
+            cpu_threads (int, optional): CPU后端单次推理使用的线程数. Defaults to 4.
+            cpu_workers (int, optional): CPU后端同时执行的推理数. Defaults to 1.
+            cpu_latency_ms (float, optional): failover/overflow模式下triton平均延迟的阈值(毫秒). Defaults to 100.
+            auto_tune (bool, optional): 是否自动调优在途请求数及动态组batch的batch上限,
+                以max_inflight及max_batch_size为上界. Defaults to False.
+            latency_slo_ms (float, optional): 自动调优的延迟SLO, 按推理阶段p95计算(毫秒). Defaults to 100.
+            tune_interval (float, optional): 自动调优按线上延迟调整的周期(秒). Defaults to 30.
+            chunk_size (int, optional): 单次triton调用的最大图片数, 不超过模型的max_batch_size, 图片更多的请求
+                分块流水线调用, 0表示不分块. Defaults to 64.
+            max_chunks_inflight (int, optional): 分块调用时同一请求同时在途的块数. Defaults to 4.
+            pipeline_config (str, optional): 多模型组合流水线的json配置文件, 指定时请求图片以images键输入流水线,
+                返回结果取配置中output键的每张图片分数, 人脸质量模型可通过type为face_quality的阶段引用. Defaults to None.
+            request_timeout (float, optional): 请求没有X-Request-Timeout-Ms请求头时的默认超时(秒), 从preprocess开始计算,
+                None时与infer_timeout相同. Defaults to None.
+            max_pending (int, optional): 同时处理中的请求数上限, 超出时立即拒绝, 0表示不限制. Defaults to 0.
+            shed_status (int, optional): 拒绝请求时返回的HTTP状态码, 429或503. Defaults to 429.
+            fast_json (bool, optional): 请求解析及返回结果构造不经过pydantic对象, 输出与pydantic路径一致,
+                启动时对照检查. Defaults to False.
+            reduced_decode (bool, optional): jpeg图片按模型输入尺寸直接缩小解码(1/2, 1/4, 1/8), 大图省去全尺寸解码. Defaults to False.
+            input_dtype (str, optional): 输入张量类型, auto(启动时按模型元数据确定), FP32, FP16或UINT8(由triton端的
+                预处理模型归一化). Defaults to "auto".
+            triton_model (str, optional): triton中人脸质量模型的名称, 输入尺寸, 类型及batch上限启动时从其元数据及配置获取.
+                Defaults to "face_quality_trt_fp16".
+            input_name (str, optional): 模型输入张量名称. Defaults to "input.1".
+            output_name (str, optional): 模型输出张量名称. Defaults to "1346".
+            warmup (bool, optional): 就绪前按模型的preferred batch大小发送纯灰图片预热. Defaults to False.
+            workers (int, optional): kserve ModelServer fork的worker进程数, 与其workers参数一致; 大于1时本进程只检查参数,
+                triton客户端, 线程池及后台线程在每个worker进程中构造. Defaults to 1.
+        """
+        # 构造参数, 多进程模式下worker进程以同样的参数重新构造
+        init_args = dict(locals())
+        init_args.pop("self")
+        init_args.pop("__class__", None)
+        # worker进程中重新构造时保留kserve在fork前对模型对象的设置
+        if not hasattr(self, "name"):
+            super().__init__(name)
+
+        if infer_mode not in ("sync", "async", "aio"):
+            raise ValueError("invalid infer_mode: {}, must be one of sync, async, aio".format(infer_mode))
+        if infer_mode == "aio" and max_batch_size > 0:
+            raise ValueError("dynamic batching is not supported with infer_mode aio")
+        if infer_mode == "aio" and use_shm:
+            raise ValueError("shared memory transport is not supported with infer_mode aio")
+        if cpu_mode not in ("off", "only", "failover", "overflow"):
+            raise ValueError("invalid cpu_mode: {}, must be one of off, only, failover, overflow".format(cpu_mode))
+        if cpu_mode != "off":
+            if infer_mode == "aio":
+                raise ValueError("cpu backend is not supported with infer_mode aio")
+            if use_shm:
+                raise ValueError("shared memory transport is not supported with the cpu backend")
+            if not cpu_model_path:
+                raise ValueError("cpu_model_path is required when cpu_mode is {}".format(cpu_mode))
+        if pipeline_config:
+            if infer_mode != "async" or (not use_grpc and cpu_mode != "only"):
+                raise ValueError("pipeline requires infer_mode async with the grpc or cpu backend")
+            if max_batch_size > 0 or use_shm:
+                raise ValueError("dynamic batching and shared memory transport are not supported with a pipeline")
+            if reduced_decode:
+                raise ValueError("reduced_decode is not supported with a pipeline, stages may need the full resolution")
+        if auto_tune and infer_mode == "sync" and max_batch_size == 0:
+            raise ValueError("auto_tune requires infer_mode async/aio or dynamic batching")
+        if workers < 1:
+            raise ValueError("invalid workers: {}, must be at least 1".format(workers))
+
+        # 请求解析及返回结果构造的快速路径, 与pydantic路径的一致性由tests/test_serialization.py检查
+        self.fast_json = fast_json
+
+        # 多进程: grpc通道, http连接池, 线程池及后台线程都不能跨fork使用, kserve在fork前构造模型对象,
+        # 这里只检查参数, fork之后由_start_worker在每个worker进程中以workers=1完整构造
+        self.ready = False
+        self.startup_error = None
+        if workers > 1:
+            self._worker_args = dict(init_args, workers=1)
+            os.register_at_fork(after_in_child=self._start_worker)
+            print("transformer will start in each of {} worker processes".format(workers))
+            return
+
+        # 准入控制: 过载时尽早拒绝; 请求截止时间之后的解码, 前置处理及triton调用直接取消
+        self.admission = AdmissionController(max_pending=max_pending, reject_status=shed_status)
+        self.request_timeout = request_timeout if request_timeout is not None else infer_timeout
 
         self.predictor_host = predictor_host
-        if use_grpc:
+        self.use_grpc = use_grpc
+        self.transport = "grpc" if use_grpc else "http"
+        self.infer_mode = infer_mode
+        self.infer_timeout = infer_timeout
+        self.cpu_mode = cpu_mode
+        # 启动各阶段耗时, 就绪时输出
+        self._startup_start = time.perf_counter()
+        self.startup_timings = []
+        t_clients = time.perf_counter()
+        if cpu_mode == "only":
+            self.transport = "cpu"
+            self.tritonclient = OnnxRuntimeClient(cpu_model_path, threads=cpu_threads, workers=cpu_workers)
+        elif infer_mode == "aio":
+            # asyncio客户端在第一次调用时才建立连接
+            if use_grpc:
+                self.tritonclient = AsyncTritonGrpcClient(
+                    predictor_host, concurrency=max_inflight, timeout=infer_timeout)
+            else:
+                self.tritonclient = AsyncTritonHttpClient(
+                    predictor_host, concurrency=max_inflight)
+        elif use_grpc:
+            # triton不可用时也能启动, 由后台线程按指数退避继续重连, 连上之前服务不就绪
             self.tritonclient = TritonGrpcClient(
-                predictor_host, concurrency=100)
+                predictor_host, concurrency=max_inflight, timeout=infer_timeout, require_ready=False)
         else:
             self.tritonclient = TritonHttpClient(
-                predictor_host, concurrency=100)
-        print("triton server predictor host: ", predictor_host)
-        self.predictor = FaceQualityPrediction(self.tritonclient)
-
-    def preprocess(self, request: Dict):
-        t1 = time.time()
-        request_info = {}
-        images = []
-        req_type = "Request"
-        if "multi_data" in request:
-            # batch
-            multi_req = MultiRequest(**request)
-            for req in multi_req.multi_data:
-                if req.data.item is not None:
-                    img = parse_item_image(req.data.item)
-                    images.append(img)
-            request_info["images"] = images
-            req_type = "MultiRequest"
-            if multi_req.extra_info is not None and multi_req.extra_info.others is not None:
-                for key, value in multi_req.extra_info.others:
-                    request_info[key[1]] = value[1]
+                predictor_host, concurrency=max_inflight)
+        if cpu_mode in ("failover", "overflow"):
+            self.tritonclient = FallbackClient(
+                self.tritonclient, OnnxRuntimeClient(cpu_model_path, threads=cpu_threads, workers=cpu_workers),
+                mode=cpu_mode, latency_threshold_ms=cpu_latency_ms)
+        if cpu_mode != "only":
+            print("triton server predictor host: ", predictor_host)
+
+        # MultiRequest图片并行解码及resize线程池
+        self.executor = None
+        if decode_workers > 0:
+            self.executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+
+        # http异步调用: http客户端(gevent)在当前线程等待结果, 调用放到线程池中同步进行, 不阻塞事件循环,
+        # 每个线程使用各自的连接, 同时在途的请求数由max_inflight限制
+        self.http_executor = None
+        if self.transport == "http" and infer_mode == "async":
+            self.http_executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="triton-http")
+
+        self.predictor = FaceQualityPrediction(
+            self.tritonclient, executor=self.executor,
+            chunk_size=chunk_size, max_chunks_inflight=max_chunks_inflight, max_chunked_requests=max_inflight,
+            model_name=triton_model, input_name=input_name, output_name=output_name)
+        self._startup_phase("clients", t_clients)
+
+        # 多模型组合流水线: 各阶段共用triton客户端, pre钩子在独立线程池中执行(可能调用前置处理的resize线程池)
+        self.pipeline = None
+        if pipeline_config:
+            self.pipeline = Pipeline.from_config(
+                self.tritonclient, pipeline_config, factories={"face_quality": self.predictor.as_stage},
+                executor=ThreadPoolExecutor(max_workers=max(decode_workers, 1), thread_name_prefix="pipeline"))
+            if self.pipeline.output is None:
+                raise ValueError("pipeline config must specify the output context key")
+            print("pipeline {}: {}".format(self.pipeline.name, " -> ".join(self.pipeline.order)))
+
+        # url图片下载器: 共享连接池, 同一请求中的url并发下载
+        self.url_fetcher = UrlImageFetcher(timeout=(3, url_timeout), retries=url_retries)
+
+        # 依赖模型配置的部分(共享内存, 缩小解码尺寸, 分数缓存)由setup_model在获取模型配置后构造
+        self.use_shm = use_shm
+        self.reduced_decode = reduced_decode
+        self.shm_pool = None
+        self.decode_min_size = None
+        self.cache = None
+        self._cache_args = dict(max_entries=cache_size, max_bytes=cache_max_mb << 20, ttl=cache_ttl)
+        self._shm_max_batch_size = max(max_batch_size, 64)
+
+        # 异步调用的在途请求数上限, 可由自动调优在运行中调整
+        self.max_inflight = max_inflight
+        self._inflight = AsyncAdjustableSemaphore(max_inflight)
+
+        # 自动调优: 就绪(预热完成)后在后台线程中探测triton, 之后按线上推理延迟调整在途请求数, 以及动态组batch的batch上限或分块大小
+        # 不开启自动调优时动态组batch同一时间只有一个batch在途, 推理期间到达的请求合并到下一个batch;
+        # http动态组batch只有一个batch在途, 只探测batch大小; asyncio客户端绑定在服务的事件循环上, 不做启动探测
+        batch_inflight = max_inflight if auto_tune and self.transport != "http" else 1
+        self.tuner = None
+        if auto_tune:
+            self.tuner = AutoTuner(
+                self.predictor, self.apply_tuning, slo_ms=latency_slo_ms,
+                max_batch_size=max_batch_size if max_batch_size > 0 else max(chunk_size, 1),
+                max_concurrency=batch_inflight if max_batch_size > 0 else max_inflight,
+                probe=infer_mode != "aio", interval=tune_interval)
+
+        # 动态组batch: 合并同时到达的请求, 一次调用triton
+        self.batcher = None
+        if max_batch_size > 0:
+            self.batcher = DynamicBatcher(
+                self.predictor, max_batch_size=max_batch_size, max_wait_ms=max_batch_wait_ms,
+                max_inflight=batch_inflight, observer=self.tuner.record if self.tuner is not None else None)
+
+        # 就绪: 获取模型配置, setup_model及预热完成后才就绪(kserve的readiness探针), 之前的请求以503拒绝。
+        # triton已可用时在这里获取模型配置, 与模型不一致时直接启动失败; 不可用时由后台线程按指数退避等待,
+        # 服务照常启动, 不因triton滚动发布而反复重启。预热在后台线程中进行。
+        self.warmup = warmup
+        self.input_dtype = input_dtype
+        self.model_spec = None
+        t_config = time.perf_counter()
+        if self.load_model_spec(input_dtype) or cpu_mode != "off":
+            self._startup_phase("model_config", t_config)
+            self.setup_model()
+            target = self._finish_startup
+        else:
+            target = self._wait_and_start
+        self._startup_thread = threading.Thread(target=target, name="transformer-startup", daemon=True)
+        self._startup_thread.start()
+
+    def _start_worker(self):
+        """kserve fork出worker进程后在子进程中调用, 构造本进程的triton客户端及后台线程; 启动失败时worker退出"""
+        if getattr(self, "_worker_args", None) is None:
+            # 已构造的worker再fork的子进程
+            return
+        args, self._worker_args = self._worker_args, None
+        try:
+            self.__init__(**args)
+        except Exception as e:
+            print("worker {} failed to start: {}".format(os.getpid(), e))
+            os._exit(1)
+
+    async def preprocess(self, request: Dict, headers: Dict[str, str] = None):
+        if not self.ready:
+            metrics.observe_shed("not_ready")
+            raise http_error(503, "model {} is not ready{}".format(
+                self.name, ": {}".format(self.startup_error) if self.startup_error is not None else ""))
+        # 准入名额在postprocess或出错时归还; 截止时间记入当前请求的上下文, 后续阶段共用
+        self.admission.admit()
+        with self._release_on_error():
+            set_deadline(parse_deadline(get_header(headers, TIMEOUT_HEADER), self.request_timeout))
+            return await self.parse(request, headers)
+
+    async def parse(self, request, headers=None):
+        # 请求体bytes由server.TransformerPredictHandler原样传入: json请求体在这里解析, 其他为二进制请求
+        binary = isinstance(request, (bytes, bytearray, memoryview))
+        if binary and "json" in (get_header(headers, "content-type") or ""):
+            request, binary = (serialization.loads(request) if self.fast_json else json.loads(request)), False
+
+        # 当前请求的指标标签及span, 后续predict/postprocess阶段共用
+        if binary:
+            req_type = "BinaryRequest"
         else:
-            req = Request(**request)
-            if req.data.item is not None:
-                img = parse_item_image(req.data.item)
-                images.append(img)
-            request_info["images"] = images
-            req_type = "Request"
-            if req.extra_info is not None and req.extra_info.others is not None:
-                for key, value in req.extra_info.others:
-                    request_info[key[1]] = value[1]
+            req_type = "MultiRequest" if "multi_data" in request else "Request"
+        metrics.set_request_labels(req_type, self.transport)
+        metrics.begin_request_span(req_type)
+
+        # 请求解析及图片解码放到线程池, 不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        if binary:
+            return await loop.run_in_executor(None, ctx.run, self.parse_binary_request, request, headers)
+        return await loop.run_in_executor(None, ctx.run, self.parse_request, request)
+
+    def parse_request(self, request: Dict):
+        # 在线程池中排队期间已超时的请求不再解码
+        check_deadline("decode")
+        t1 = time.perf_counter()
+        parsed = serialization.parse_items(request) if self.fast_json else None
+        if parsed is None:
+            parsed = serialization.parse_items_pydantic(request)
+        items, others, req_type = parsed
+        request_info = self.parse_items(items)
+        request_info.update(others)
 
         request_info['req_type'] = req_type
-        print("transformer time cost: preprocessing", time.time() - t1)
+        metrics.observe("decode", time.perf_counter() - t1, len(request_info["item_keys"]))
+
+        return request_info
 
+    def parse_binary_request(self, body, headers=None):
+        check_deadline("decode")
+        t1 = time.perf_counter()
+        buffers = parse_binary_request(body, headers)
+        request_info = self.parse_items(buffers, binary=True)
+        request_info['req_type'] = "BinaryRequest"
+        metrics.observe("decode", time.perf_counter() - t1, len(request_info["item_keys"]))
         return request_info
 
-    def predict(self, request: Dict):
-        images = request["images"]
-        batch = len(images)
-        req_type = request['req_type']
-
-        # 调用类型
-        # # http同步
-        # return self.http_infer(images)
-        
-        # # http异步
-        # return self.http_async_infer(images)
-        
-        # # grpc同步
-        # return self.grpc_infer(images)
-        
-        # # grpc异步
-        return self.grpc_async_infer(images)
+    def parse_items(self, items, binary=False):
+        """查询分数缓存并合并重复图片, 只解码未命中的图片
+
+        Args:
+            items (list): 图片item列表(path, url或base64编码), binary为True时为图片字节的memoryview列表
+            binary (bool, optional): items是否为二进制请求中的图片字节. Defaults to False.
+
+        Returns:
+            dict: images为待推理的去重图片列表, item_keys为每个item的内容hash,
+                cached_scores为每个item缓存命中的分数(未命中为None), infer_keys为images对应的hash,
+                cache_keys为infer_keys中推理后写入缓存的hash(url/path的item不缓存)
+        """
+        keys = [hash_buffer(item) if binary else hash_item(item) for item in items]
+        cached_scores = [None] * len(items)
+        infer_index = {}
+        infer_items, infer_indices, cache_keys = [], [], []
+        for i, key in enumerate(keys):
+            if key in infer_index:
+                continue
+            cacheable = binary or cacheable_item(items[i])
+            if self.cache is not None and cacheable:
+                score = self.cache.get(key)
+                if score is not None:
+                    cached_scores[i] = score
+                    continue
+            infer_index[key] = len(infer_items)
+            infer_items.append(items[i])
+            infer_indices.append(i)
+            if cacheable:
+                cache_keys.append(key)
+
+        if binary:
+            images = decode_image_buffers(
+                infer_items, executor=self.executor, indices=infer_indices, min_size=self.decode_min_size)
+        else:
+            images = parse_item_images(
+                infer_items, executor=self.executor, fetcher=self.url_fetcher, indices=infer_indices,
+                min_size=self.decode_min_size)
+        return {
+            "images": images,
+            "item_keys": keys,
+            "cached_scores": cached_scores,
+            "infer_keys": list(infer_index),
+            "cache_keys": cache_keys,
+        }
+
+    async def predict(self, request: Dict):
+        with self._release_on_error():
+            images = request["images"]
+            if len(images) == 0 and len(request["item_keys"]) > 0:
+                # 全部命中缓存
+                return self.merge_scores(request, [])
+
+            result = await self.infer_images(images)
+            return self.merge_scores(request, result["face_quality_score"])
+
+    def merge_scores(self, request: Dict, scores):
+        """写入缓存, 并按原始item顺序还原分数(包括缓存命中及重复图片)"""
+        score_map = dict(zip(request["infer_keys"], scores))
+        if self.cache is not None:
+            for key in request["cache_keys"]:
+                self.cache.put(key, score_map[key])
+
+        merged = []
+        for key, cached in zip(request["item_keys"], request["cached_scores"]):
+            merged.append(cached if cached is not None else score_map[key])
+        return {
+            "face_quality_score": merged,
+        }
+
+    async def infer_images(self, images):
+        # 多模型组合流水线
+        if self.pipeline is not None:
+            return await self.pipeline_infer(images)
+
+        # 动态组batch
+        if self.batcher is not None:
+            return await self.batch_infer(images)
+
+        # 调用类型由部署参数 use_grpc/infer_mode 决定
+        if self.infer_mode == "aio":
+            return await self.aio_infer(images)
+        if self.use_grpc:
+            if self.infer_mode == "async":
+                return await self.grpc_async_infer(images)
+            return self.grpc_infer(images)
+        else:
+            if self.infer_mode == "async":
+                return await self.http_async_infer(images)
+            return self.http_infer(images)
 
     def postprocess(self, request: Dict):
-        t1 = time.time()
-        content = []
-        if "face_quality_score" in request:
-            for score in request["face_quality_score"]:
-                content.append(
-                    Response(
-                        data=[ResponseItem(score=score)],
-                        extra_info=ExtraInfo(source="face_quality_score")
-                    )
-                )
-        multi_response = MultiResponse(multi_data=content)
-
-        print("transformer time cost: postprocessing", time.time() - t1)
-        return multi_response.dict(exclude_unset=True)
+        try:
+            scores = request.get("face_quality_score", [])
+            with metrics.timed("postprocess", len(scores)):
+                if self.fast_json:
+                    response = serialization.build_response(scores)
+                else:
+                    response = serialization.build_multi_response(scores)
+
+            with metrics.timed("serialize", len(scores)):
+                if not self.fast_json:
+                    response = response.dict(exclude_unset=True)
+        finally:
+            self.admission.release()
+        metrics.end_request_span()
+        return response
+
+    def load_model_spec(self, input_dtype):
+        """获取模型元数据及配置, 构造请求模板并确定输入尺寸及类型
+
+        连接不上triton时不使用请求模板, 输入沿用112x112及指定的类型(auto时为FP32);
+        triton可用但没有该模型, 或与算法调用不一致时(名称, 形状或类型)抛出异常。
+
+        Returns:
+            bool: 是否已按模型配置确定, 连接不上triton时为False
+        """
+        model_name = self.predictor.model_name
+        client = self._startup_client()
+        try:
+            spec = client.load_model(model_name)
+        except Exception as e:
+            # triton返回的错误(如模型不存在)直接抛出, 只有连接不上时才继续启动
+            if not _unavailable(e):
+                raise
+            fallback = "FP32" if input_dtype == "auto" else input_dtype
+            print("failed to load config of model {}, triton unavailable, input dtype {}: {}".format(
+                model_name, fallback, e))
+            self.predictor.set_input_dtype(fallback)
+            return False
+        finally:
+            if client is not self.tritonclient:
+                client.close()
+        if client is not self.tritonclient:
+            self.tritonclient.load_model(model_name, spec)
+        self.predictor.configure(spec, input_dtype)
+        self.model_spec = spec
+        print("model {} version {}: input {}x{} {}, max batch size {}, preferred batch sizes {}".format(
+            model_name, spec.version or "-", self.predictor.input_size[0], self.predictor.input_size[1],
+            self.predictor.input_dtype, spec.max_batch_size, spec.preferred_batch_sizes or "-"))
+        return True
+
+    def setup_model(self):
+        """按确定的模型输入构造共享内存池, 缩小解码尺寸及分数缓存, 加载流水线各阶段的模型配置"""
+        t1 = time.perf_counter()
+        if self.predictor.input_dtype == "UINT8" and self.cpu_mode in ("failover", "overflow"):
+            raise ValueError("UINT8 input is normalized by triton, the cpu backend can not serve it as a fallback")
+
+        # 共享内存传输: 区域按batch大小预注册复用, 进程退出时向triton注销
+        if self.use_shm:
+            self.shm_pool = SharedMemoryPool(
+                self.tritonclient, input_dtype=INPUT_DTYPES[self.predictor.input_dtype],
+                output_dtype=triton_to_np_dtype(self.predictor.output_dtype),
+                input_shape=(3,) + self.predictor.input_size[::-1], output_shape=self.predictor.output_shape,
+                max_batch_size=self._shm_max_batch_size)
+            atexit.register(self.shm_pool.close)
+            self.predictor.shm_pool = self.shm_pool
+
+        # 流水线各阶段的模型构造请求模板, 模型不存在或张量不一致时在发送前报错
+        if self.pipeline is not None:
+            for stage in self.pipeline.stages.values():
+                if stage.model_name == self.predictor.model_name:
+                    continue
+                try:
+                    self.tritonclient.load_model(stage.model_name)
+                except Exception as e:
+                    if not _unavailable(e):
+                        raise
+                    print("failed to load config of model {}: {}".format(stage.model_name, e))
+
+        # 自动调优的batch上限不超过模型的max_batch_size
+        if self.tuner is not None and self.predictor.max_batch_size > 0:
+            self.tuner.limit_batch_size(self.predictor.max_batch_size)
+
+        # jpeg缩小解码: 解码后的尺寸不小于模型输入尺寸
+        self.decode_min_size = self.predictor.input_size if self.reduced_decode else None
+
+        # 按图片内容hash缓存分数, 只在相同模型名称及版本之间命中
+        if self._cache_args["max_entries"] > 0:
+            self.cache = ScoreCache(
+                self.predictor.model_name if self.pipeline is None else "pipeline:" + self.pipeline.name,
+                self.predictor.model_version, **self._cache_args)
+        self._startup_phase("setup", t1)
+
+    def warm_up(self):
+        """按模型的preferred batch大小(没有配置时为1及分块大小)发送纯灰图片, 图片经过jpeg解码,
+        前置处理及triton调用的完整流程, 避免第一批线上请求承担连接, 线程池及triton端的初始化开销"""
+        sizes = self.predictor.preferred_batch_sizes or sorted({1, max(self.predictor.chunk_size, 1)})
+        if self.predictor.max_batch_size > 0:
+            sizes = sorted({min(size, self.predictor.max_batch_size) for size in sizes})
+        image = np.full(self.predictor.input_size[::-1] + (3,), 128, dtype=np.uint8)
+        buffer = cv2.imencode(".jpg", image)[1].tobytes()
+        images = decode_image_buffers([buffer] * sizes[-1], self.executor, min_size=self.decode_min_size)
+
+        client = self._startup_client()
+        try:
+            predictor = self.predictor
+            if client is not self.tritonclient:
+                predictor = FaceQualityPrediction(
+                    client, executor=self.executor, chunk_size=self.predictor.chunk_size,
+                    model_name=self.predictor.model_name, input_name=self.predictor.input_names[0],
+                    output_name=self.predictor.output_names[0], input_dtype=self.predictor.input_dtype)
+                if self.model_spec is not None:
+                    predictor.configure(client.load_model(predictor.model_name, self.model_spec), self.input_dtype)
+            metrics.set_request_labels("warmup", self.transport)
+            for size in sizes:
+                latencies = []
+                for _ in range(WARMUP_ROUNDS):
+                    t1 = time.perf_counter()
+                    predictor.infer(images[:size])
+                    latencies.append((time.perf_counter() - t1) * 1000)
+                print("warm-up batch size {}: {} ms".format(size, ", ".join("{:.1f}".format(t) for t in latencies)))
+        finally:
+            if client is not self.tritonclient:
+                client.close()
+
+    def load(self):
+        # kserve在模型未就绪时调用load, 就绪状态由启动线程在获取模型配置及预热完成后设置
+        return self.ready
+
+    def _startup_client(self):
+        """启动阶段(获取模型配置及预热)使用的同步客户端
+
+        asyncio客户端在事件循环中才建立连接, 使用临时的同步客户端, 用完由调用方关闭;
+        http客户端每个线程各自建立连接, 启动线程可以直接使用。
+        """
+        if self.infer_mode == "aio":
+            if self.use_grpc:
+                return TritonGrpcClient(self.predictor_host, health_interval=0, require_ready=False)
+            return TritonHttpClient(self.predictor_host)
+        return self.tritonclient
+
+    def _wait_and_start(self):
+        # triton不可用时启动: 按指数退避等待triton及模型就绪, 之后与正常启动相同
+        t1 = time.perf_counter()
+        delay = STARTUP_RETRY_INTERVAL
+        try:
+            while True:
+                print("waiting for triton, retry in {:.1f}s".format(delay))
+                time.sleep(delay)
+                delay = min(delay * 2, STARTUP_MAX_BACKOFF)
+                # grpc连接池的后台重连有自己的退避间隔, 启动时按这里的间隔立即重连
+                if isinstance(self.tritonclient, TritonGrpcClient) and not self.tritonclient.reconnect():
+                    continue
+                if self.load_model_spec(self.input_dtype):
+                    break
+            self._startup_phase("model_config", t1)
+            self.setup_model()
+        except Exception as e:
+            self.startup_error = e
+            print("transformer startup failed, keep not ready: {}".format(e))
+            return
+        self._finish_startup()
+
+    def _finish_startup(self):
+        if self.warmup:
+            t1 = time.perf_counter()
+            try:
+                self.warm_up()
+            except Exception as e:
+                print("warm-up failed: {}".format(e))
+            self._startup_phase("warmup", t1)
+        self.ready = True
+        print("transformer ready in {:.3f}s ({})".format(
+            time.perf_counter() - self._startup_start,
+            ", ".join("{} {:.3f}s".format(phase, seconds) for phase, seconds in self.startup_timings)))
+        # 探测与线上请求争用triton, 放在预热之后, 在调优线程中进行
+        if self.tuner is not None:
+            self.tuner.start()
+
+    def _startup_phase(self, phase, t1):
+        seconds = time.perf_counter() - t1
+        self.startup_timings.append((phase, seconds))
+        metrics.observe_startup(phase, seconds)
+
+    @contextmanager
+    def _release_on_error(self):
+        # 出错时归还准入名额, 超时以504返回
+        try:
+            yield
+        except TimeoutError as e:
+            self.admission.release()
+            raise http_error(504, str(e))
+        except BaseException:
+            self.admission.release()
+            raise
+
+    def apply_tuning(self, batch_size, concurrency):
+        """自动调优结果生效, 在调优线程中调用"""
+        if self.batcher is not None:
+            self.batcher.max_batch_size = batch_size
+            self.batcher.set_inflight(concurrency)
+        else:
+            if self.predictor.chunk_size > 0:
+                # 分块大小不超过模型的max_batch_size
+                if self.predictor.max_batch_size > 0:
+                    batch_size = min(batch_size, self.predictor.max_batch_size)
+                self.predictor.chunk_size = batch_size
+            self._inflight.set_limit(concurrency)
+
+    @contextmanager
+    def _observe_latency(self, batch_size):
+        # 获得在途名额之后的推理耗时, 提供给自动调优
+        t1 = time.perf_counter()
+        yield
+        if self.tuner is not None:
+            self.tuner.record(time.perf_counter() - t1, batch_size)
+
+    async def batch_infer(self, images):
+        # 提交到动态batch队列, 等待合并后的推理结果, 不阻塞事件循环
+        future = self.batcher.submit(images, deadline=request_deadline.get())
+        try:
+            scores = await asyncio.wait_for(asyncio.wrap_future(future), remaining())
+        except asyncio.TimeoutError:
+            raise TimeoutError("request deadline exceeded while waiting for the dynamic batcher")
+        result = {
+            "face_quality_score": scores,
+        }
+        return result
 
     def http_infer(self, images):
         # synchronous
-        t1 = time.time()
-        print(">> http synchronous")
         scores = self.predictor.infer(images)
         result = {
             "face_quality_score": scores,
         }
-
-        print("transformer time cost: predict", time.time() - t1)
         return result
 
-    def http_async_infer(self, images):
-        # asynchronous
-        t1 = time.time()
-        print(">> http asynchronous")
-        async_requests = []
-        sent_count = 500
-        for i in range(sent_count):
-            async_requests.append(self.predictor.async_infer(images))
-
-        result = {}
-        for j, async_request in enumerate(async_requests):
-            res = self.predictor.postprocess(async_request.get_result())
-            print("is_async", j, res)
-            result["face_quality_score"] = res
+    async def http_async_infer(self, images):
+        # asynchronous, 每个请求只发送一次, 在途请求数受max_inflight限制
+        # 注意: http异步请求基于gevent, 需在发送的线程中等待结果, 调用在http_executor线程池中进行, 不阻塞事件循环;
+        # 图片数超过chunk_size时在同一线程中分块流水线调用
+        async with self._inflight:
+            with self._observe_latency(len(images)):
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(
+                    self.http_executor, contextvars.copy_context().run, self.predictor.infer, images)
+                try:
+                    scores = await asyncio.wait_for(future, remaining(self.infer_timeout))
+                except asyncio.TimeoutError:
+                    raise TimeoutError(
+                        "http async inference timeout (deadline or {}s infer_timeout)".format(self.infer_timeout))
+        result = {
+            "face_quality_score": scores,
+        }
         return result
 
     def grpc_infer(self, images):
         # synchronous
-        t1 = time.time()
-        print(">> grpc synchronous")
         scores = self.predictor.infer(images)
         result = {
             "face_quality_score": scores,
         }
-        print("transformer time cost: predict", time.time() - t1)
         return result
 
-    def grpc_async_infer(self, images):
-        # 异步需要定义 timeout
-        t1 = time.time()
-        print(">> grpc asynchronous")
-        result_queue = Queue()
-        responses = []
-        sent_count = 500
+    async def grpc_async_infer(self, images):
+        # asynchronous, 每个请求只发送一次, 结果通过callback写回该请求自己的future
+        # 前置处理(cv2 resize/归一化)及发送在线程池中执行, 不阻塞事件循环
+        async with self._inflight:
+            with self._observe_latency(len(images)):
+                loop = asyncio.get_running_loop()
+                sent = loop.run_in_executor(
+                    None, contextvars.copy_context().run, self.predictor.grpc_async_infer, images)
+                try:
+                    scores = await asyncio.wait_for(_callback_result(sent), remaining(self.infer_timeout))
+                except asyncio.TimeoutError:
+                    raise TimeoutError(
+                        "grpc async inference timeout (deadline or {}s infer_timeout)".format(self.infer_timeout))
+        result = {
+            "face_quality_score": scores,
+        }
+        return result
 
-        for i in range(sent_count):
-            self.predictor.grpc_async_infer(images, result_queue)
+    async def pipeline_infer(self, images):
+        # 流水线各阶段由grpc回调推进, 一个请求计一个在途名额
+        async with self._inflight:
+            with self._observe_latency(len(images)):
+                future = self.pipeline.run({"images": images})
+                try:
+                    context = await asyncio.wait_for(asyncio.wrap_future(future), remaining(self.infer_timeout))
+                except asyncio.TimeoutError:
+                    raise TimeoutError(
+                        "pipeline inference timeout (deadline or {}s infer_timeout)".format(self.infer_timeout))
+        scores = context[self.pipeline.output]
+        if isinstance(scores, np.ndarray):
+            scores = scores.reshape(len(images), -1)[:, 0].tolist()
+        if len(scores) != len(images):
+            raise ValueError("pipeline output {} has {} scores for {} images".format(
+                self.pipeline.output, len(scores), len(images)))
+        result = {
+            "face_quality_score": scores,
+        }
+        return result
 
-        processed_count = 0
-        scores = []
-        try:
-            while processed_count < sent_count:
-                (results, error) = result_queue.get(timeout=2) #单位s
-                processed_count += 1
-                if error is not None:
-                    print("grpc asyn inference failed: " + str(error))
-                else:
-                    scores = results
-                responses.append(results)
-                    
-                if processed_count % 100 == 0:
-                    print("time cost:", processed_count, time.time() - t1, results)
-        except Exception as e:
-            print(e)
-            
+    async def aio_infer(self, images):
+        # asyncio, 前置处理在线程池执行, triton调用直接await, 不阻塞事件循环
+        async with self._inflight:
+            with self._observe_latency(len(images)):
+                try:
+                    scores = await asyncio.wait_for(self.predictor.aio_infer(images), remaining(self.infer_timeout))
+                except asyncio.TimeoutError:
+                    raise TimeoutError(
+                        "aio inference timeout (deadline or {}s infer_timeout)".format(self.infer_timeout))
         result = {
             "face_quality_score": scores,
         }
-        print("transformer time cost: predict", time.time() - t1)
-        return result
\ No newline at end of file
+        return result
+
+
+async def _callback_result(sent):
+    """等待线程池中的发送完成, 再等待grpc callback写回的结果"""
+    future = await sent
+    return await asyncio.wrap_future(future)
+
+
+def _unavailable(error):
+    """启动时获取模型配置的错误是否为连接不上triton(而不是triton返回的错误)"""
+    return not isinstance(error, InferenceServerException) or error.status() in (
+        None, "StatusCode.UNAVAILABLE", "StatusCode.DEADLINE_EXCEEDED")
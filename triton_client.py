@@ -8,20 +8,201 @@
 @Desc    : tritonserver服务调用相关接口封装
 '''
 
-from tritonclient.utils import np_to_triton_dtype, raise_error
-import tritonclient.http as httpclient
-import tritonclient.grpc as grpcclient
+import time
+import threading
+import importlib
+import numpy as np
+from tritonclient.utils import np_to_triton_dtype, triton_to_np_dtype, raise_error, InferenceServerException
+
+from .shm_pool import ShmTensor
+from . import admission
+from . import metrics
+
+
+class _LazyModule():
+    """第一次访问属性时才导入的模块
+
+    服务只使用一种传输方式, 其余tritonclient子模块(及其依赖的grpc, gevent, aiohttp)不在启动时导入。
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+httpclient = _LazyModule("tritonclient.http")
+grpcclient = _LazyModule("tritonclient.grpc")
+aiohttpclient = _LazyModule("tritonclient.http.aio")
+aiogrpcclient = _LazyModule("tritonclient.grpc.aio")
+
+
+def _batch_size(input_dict):
+    # 第一个输入的第0维为batch大小
+    for value in input_dict.values():
+        return value.shape[0]
+    return 0
+
+
+class ModelSpec():
+    """启动时从triton获取的模型元数据及配置
+
+    inputs/outputs为{名称: (datatype, dims)}, dims不含batch维, -1为动态维度;
+    max_batch_size为0时不限制batch大小(triton中不支持batch的模型, 第一维为动态维度时同样作为batch维)。
+    """
+
+    def __init__(self, name, version="", inputs=None, outputs=None, max_batch_size=0, preferred_batch_sizes=None,
+                 batched=True):
+        self.name = name
+        self.version = version
+        self.inputs = dict(inputs or {})
+        self.outputs = dict(outputs or {})
+        self.max_batch_size = max_batch_size
+        self.preferred_batch_sizes = list(preferred_batch_sizes or [])
+        self.batched = batched
+
+    @classmethod
+    def from_triton(cls, metadata, config):
+        """由get_model_metadata及get_model_config的结果构造, 兼容http(dict)及grpc(as_json, int64为字符串)的格式"""
+        config = config.get("config", config)
+        max_batch_size = int(config.get("max_batch_size", 0))
+        shapes = [[int(d) for d in tensor["shape"]] for tensor in metadata.get("inputs", [])]
+        # 不支持batch的模型第一维为动态维度时, 仍可按batch发送
+        batched = max_batch_size > 0 or all(shape and shape[0] == -1 for shape in shapes)
+
+        def tensors(items):
+            specs = {}
+            for tensor in items:
+                shape = tuple(int(d) for d in tensor["shape"])
+                specs[tensor["name"]] = (tensor["datatype"], shape[1:] if batched else shape)
+            return specs
+
+        versions = sorted(metadata.get("versions", []), key=lambda v: int(v) if str(v).isdigit() else 0)
+        preferred = config.get("dynamic_batching", {}).get("preferred_batch_size", [])
+        return cls(metadata.get("name", config.get("name")), version=str(versions[-1]) if versions else "",
+                   inputs=tensors(metadata.get("inputs", [])), outputs=tensors(metadata.get("outputs", [])),
+                   max_batch_size=max_batch_size, preferred_batch_sizes=[int(size) for size in preferred],
+                   batched=batched)
+
+
+class RequestTemplate():
+    """按ModelSpec预先构造的请求模板, 每次调用只需附加输入张量
+
+    输出列表(InferRequestedOutput)按输出名称构造一次后各请求共用, 序列化时只读取, 不会被修改;
+    输入的datatype取自模型元数据, 张量类型, 形状或batch大小与模型不一致时在发送前抛出ValueError。
+    """
+
+    def __init__(self, spec, module):
+        """
+        Args:
+            spec (ModelSpec): 模型元数据及配置.
+            module (module): tritonclient.http/grpc及其aio版本, 提供InferInput/InferRequestedOutput.
+        """
+        self.spec = spec
+        self.module = module
+        # {输入名称: (datatype, numpy dtype, 不含batch维的dims, dims中是否没有动态维度)}
+        self._inputs = {}
+        for name, (datatype, dims) in spec.inputs.items():
+            self._inputs[name] = (datatype, np.dtype(triton_to_np_dtype(datatype)), tuple(dims),
+                                  all(d != -1 for d in dims))
+        self._outputs = {}
+
+    def inputs(self, input_dict):
+        inputs = []
+        for name, value in input_dict.items():
+            check = self._inputs.get(name)
+            if check is None:
+                raise ValueError("model {} has no input {}, inputs: {}".format(
+                    self.spec.name, name, ", ".join(self.spec.inputs)))
+            datatype, dtype, dims, static = check
+            if value.dtype != dtype:
+                raise ValueError("input {} of model {} expects {}, got {}".format(
+                    name, self.spec.name, datatype, np_to_triton_dtype(value.dtype)))
+            shape = value.shape
+            item_shape = shape[1:] if self.spec.batched else shape
+            if not (item_shape == dims if static else _match_dims(item_shape, dims)) or (
+                    self.spec.batched and len(shape) == 0):
+                expected = (-1,) + dims if self.spec.batched else dims
+                raise ValueError("input {} of model {} expects shape {}, got {}".format(
+                    name, self.spec.name, list(expected), list(shape)))
+            if self.spec.max_batch_size > 0 and shape[0] > self.spec.max_batch_size:
+                raise ValueError("batch size {} of model {} exceeds max_batch_size {}".format(
+                    shape[0], self.spec.name, self.spec.max_batch_size))
+            inputs.append(_infer_input(self.module, name, shape, datatype, value))
+        return inputs
+
+    def outputs(self, output_list):
+        key = tuple(output_list)
+        outputs = self._outputs.get(key)
+        if outputs is None:
+            for name in output_list:
+                if name not in self.spec.outputs:
+                    raise ValueError("model {} has no output {}, outputs: {}".format(
+                        self.spec.name, name, ", ".join(self.spec.outputs)))
+            outputs = [self.module.InferRequestedOutput(name) for name in output_list]
+            self._outputs[key] = outputs
+        return outputs
+
+
+# triton找不到请求中的共享内存区域时的错误信息
+SHM_UNKNOWN_REGION = "Unable to find system shared memory region"
+
+
+def _with_client_timeout(func, timeout, *args, **kwargs):
+    # tritonclient 2.14(kserve 0.8依赖的版本)的grpc is_server_ready及模型元数据/配置接口不支持client_timeout
+    try:
+        return func(*args, client_timeout=timeout, **kwargs)
+    except TypeError:
+        return func(*args, **kwargs)
+
+
+def _match_dims(shape, dims):
+    return len(shape) == len(dims) and all(d == -1 or d == s for d, s in zip(dims, shape))
+
+
+def _infer_input(module, name, shape, datatype, value):
+    infer_input = module.InferInput(name, shape, datatype)
+    if isinstance(value, ShmTensor):
+        # 数据已在共享内存中, 请求中只携带区域名称
+        infer_input.set_shared_memory(value.region_name, value.byte_size)
+    else:
+        infer_input.set_data_from_numpy(value)
+    return infer_input
+
+
+def _build_request(module, input_dict, output_list, output_shm=None, template=None):
+    """构造InferInput/InferRequestedOutput列表, 有模板时按模板构造及校验"""
+    if template is not None:
+        inputs = template.inputs(input_dict)
+    else:
+        inputs = [_infer_input(module, name, value.shape, np_to_triton_dtype(value.dtype), value)
+                  for name, value in input_dict.items()]
+
+    if template is not None and not output_shm:
+        return inputs, template.outputs(output_list)
+    outputs = []
+    for name in output_list:
+        infer_output = module.InferRequestedOutput(name)
+        if output_shm is not None and name in output_shm:
+            infer_output.set_shared_memory(output_shm[name].region_name, output_shm[name].byte_size)
+        outputs.append(infer_output)
+    return inputs, outputs
 
 
 class TritonHttpClient():
     """ 
     Note:
     -----
-    None of the methods are thread safe. The object is intended to be 
-    used by a single thread and simultaneously calling different methods
-    with different threads is not supported and will cause undefined behavior.
+    tritonclient的http客户端(gevent)不是线程安全的, 这里每个线程使用各自的InferenceServerClient及连接池,
+    同一对象可在多个线程中同时调用; async_infer返回的句柄需在发送请求的线程中等待结果。
     """
 
+    transport = "http"
+
     def __init__(self, predictor_host, verbose=False, concurrency=1):
         """
         Args:
@@ -32,24 +213,51 @@ class TritonHttpClient():
         self.predictor_host = predictor_host
         self.verbose = verbose
         self.concurrency = concurrency
-        self.triton_client = None
+        # 各线程的InferenceServerClient, close时全部关闭
+        self._local = threading.local()
+        self._clients = []
+        self._lock = threading.Lock()
+        # 模型名称到请求模板, 由load_model构造
+        self.templates = {}
 
         self.init()
 
+    @property
+    def triton_client(self):
+        """当前线程的InferenceServerClient, 未建立时为None"""
+        return getattr(self._local, "triton_client", None)
+
     def init(self):
         try:
             if self.triton_client is not None:
-                self.triton_client.close()
+                self._close_client(self.triton_client)
+                self._local.triton_client = None
 
-            self.triton_client = httpclient.InferenceServerClient(url=self.predictor_host, verbose=self.verbose, concurrency=self.concurrency)
+            triton_client = httpclient.InferenceServerClient(url=self.predictor_host, verbose=self.verbose, concurrency=self.concurrency)
+            with self._lock:
+                self._clients.append(triton_client)
 
-            if not self.triton_client.is_server_ready():
-                self.triton_client = None
+            if not triton_client.is_server_ready():
+                self._close_client(triton_client)
                 raise_error("FAILED : is_server_ready")
+            self._local.triton_client = triton_client
         except Exception as e:
             print("triton channel creation failed: " + str(e))
 
-    def infer(self, model_name, input_dict, output_name_list, is_async=False):
+    def close(self):
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for triton_client in clients:
+            triton_client.close()
+        self._local = threading.local()
+
+    def _close_client(self, triton_client):
+        with self._lock:
+            if triton_client in self._clients:
+                self._clients.remove(triton_client)
+        triton_client.close()
+
+    def infer(self, model_name, input_dict, output_name_list, is_async=False, output_shm=None):
         """Call tritonclient synchronous or asynchronous inference.
 
         Args:
@@ -57,6 +265,7 @@ class TritonHttpClient():
             input_dict (dict): A dict of input objects, each describing data for a input numpy data required by the model.
             output_name_list (list): A list of output tensor name, each describing how the output data must be returned.
             async (bool, optional): Run tritonclient synchronous or asynchronous inference. Defaults to False.
+            output_shm (dict, optional): 输出名称到ShmTensor的映射, 指定的输出写入共享内存. Defaults to None.
 
         Returns:
             InferAsyncRequest or InferResult Object: Rreturn a InferAsyncRequest Object, if async is True ; otherwise return a InferResult Object.
@@ -70,96 +279,463 @@ class TritonHttpClient():
 
         if self.triton_client is None:
             self.init()
+        if self.triton_client is None:
+            raise_error("FAILED : is_server_ready")
 
+        # 已超过截止时间的请求不再发送; http客户端没有单次请求的超时, 由调用方等待结果时控制
+        admission.check_deadline("triton_rpc")
+        batch_size = _batch_size(input_dict)
+        labels = metrics.labels_for(self.transport)
         # construct InferInput/InferRequestedOutput object list
-        triton_inputs, triton_outputs = self._request_generator(input_dict, output_name_list)
+        with metrics.timed("request_build", batch_size, labels):
+            triton_inputs, triton_outputs = self._request_generator(
+                input_dict, output_name_list, output_shm, model_name)
         
         if is_async:
             # 一种异步的推理请求方法，客户端会发送推理请求但不会等待服务器返回结果，而是立即返回一个futrue对象。可以在后续代码中通过future对象来获取推理结果，而不会阻塞当前线程。
             return self.triton_client.async_infer(model_name, triton_inputs, outputs=triton_outputs)
         else:
             # 一种同步的推理请求方法，客户端会发送推理请求并等待服务器返回结果，然后才会继续执行后续代码。这意味着在收到推理结果之前，当前线程会被阻塞。
-            return self.triton_client.infer(model_name, triton_inputs, outputs=triton_outputs)
+            with metrics.timed("triton_rpc", batch_size, labels):
+                return self.triton_client.infer(model_name, triton_inputs, outputs=triton_outputs)
+
+    def get_model_metadata(self, model_name, model_version=""):
+        """模型元数据(dict), 包含输入输出的名称, datatype及shape"""
+        if self.triton_client is None:
+            self.init()
+        if self.triton_client is None:
+            raise_error("FAILED : is_server_ready")
+        return self.triton_client.get_model_metadata(model_name, model_version)
+
+    def get_model_config(self, model_name, model_version=""):
+        """模型配置(dict), 包含max_batch_size, 输入输出dims及dynamic_batching"""
+        if self.triton_client is None:
+            self.init()
+        if self.triton_client is None:
+            raise_error("FAILED : is_server_ready")
+        return self.triton_client.get_model_config(model_name, model_version)
+
+    def load_model(self, model_name, spec=None):
+        """获取模型元数据及配置, 构造请求模板, 之后该模型的请求按模板构造并在发送前校验
+
+        Args:
+            model_name (str): 模型名称.
+            spec (ModelSpec, optional): 已获取的模型元数据及配置, None时向triton查询. Defaults to None.
+
+        Returns:
+            ModelSpec: 模型元数据及配置
+        """
+        if spec is None:
+            spec = ModelSpec.from_triton(self.get_model_metadata(model_name), self.get_model_config(model_name))
+        self.templates[model_name] = RequestTemplate(spec, httpclient)
+        return spec
+
+    def register_system_shared_memory(self, name, key, byte_size):
+        if self.triton_client is None:
+            self.init()
+        self.triton_client.register_system_shared_memory(name, key, byte_size)
+
+    def unregister_system_shared_memory(self, name):
+        if self.triton_client is not None:
+            self.triton_client.unregister_system_shared_memory(name)
 
-    def _request_generator(self, input_dict, output_list):
-        inputs, outputs = [], []
+    def _request_generator(self, input_dict, output_list, output_shm=None, model_name=None):
+        return _build_request(httpclient, input_dict, output_list, output_shm, self.templates.get(model_name))
 
-        for key in input_dict:
-            value = input_dict[key]
-            infer_input = httpclient.InferInput(key, value.shape, np_to_triton_dtype(value.dtype))
-            infer_input.set_data_from_numpy(value)
-            inputs.append(infer_input)
+class GrpcChannel():
+    """TritonGrpcClient连接池中的一个grpc连接, 记录在途请求数及健康状态"""
 
-        for name in output_list:
-            outputs.append(httpclient.InferRequestedOutput(name))
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.triton_client = None
+        self.outstanding = 0
+        # 各InferenceServerClient的在途请求数, 重连替换下的旧客户端在其在途请求结束后关闭
+        self.inflight = {}
+        self.healthy = False
+        self.failures = 0
+        self.next_retry = 0.0
 
-        return inputs, outputs
 
 # 长连接
 class TritonGrpcClient():
-    def __init__(self, predictor_host, port="8001", verbose=False, concurrency=1, timeout=30):
+    """
+    grpc连接池, 支持多个triton endpoint
+
+    predictor_host可以是逗号分隔的多个地址, 每个地址建立channels_per_host个连接。
+    请求路由到在途请求数最少的健康连接; 后台线程定期检查连接健康状态,
+    不健康的连接被剔除, 并按指数退避重连, 单个triton副本变慢或重启不会阻塞整个服务。
+    """
+
+    # 单个http2连接上的默认最大并发stream数
+    STREAMS_PER_CHANNEL = 100
+
+    transport = "grpc"
+
+    def __init__(self, predictor_host, verbose=False, concurrency=1, timeout=30,
+                 channels_per_host=None, health_interval=5, max_backoff=30, require_ready=True, connect_timeout=5):
+        """
+        Args:
+            predictor_host (str): triton服务地址, 多个地址以逗号分隔.
+            concurrency (int, optional): 预期并发请求数, 未指定channels_per_host时按每个连接100个并发计算连接数. Defaults to 1.
+            timeout (float, optional): 单次请求超时时间(秒). Defaults to 30.
+            channels_per_host (int, optional): 每个地址的连接数. Defaults to None.
+            health_interval (float, optional): 健康检查间隔(秒), 0表示不做后台检查. Defaults to 5.
+            max_backoff (float, optional): 重连退避的最大间隔(秒). Defaults to 30.
+            require_ready (bool, optional): 启动时没有可用的triton连接是否抛出异常, 为False时由后台线程继续重连. Defaults to True.
+            connect_timeout (float, optional): 建立连接时检查triton就绪的超时时间(秒), 地址不可达时不会阻塞启动过久. Defaults to 5.
+        """
         self.predictor_host = predictor_host
         self.verbose = verbose
         self.concurrency = concurrency
-        self.triton_client = None
         self.client_timeout = timeout
         self.grpc_compression_algorithm = None
+        self.health_interval = health_interval
+        self.max_backoff = max_backoff
+        self.require_ready = require_ready
+        self.connect_timeout = connect_timeout
+
+        if channels_per_host is None:
+            channels_per_host = max(1, -(-concurrency // self.STREAMS_PER_CHANNEL))
+        self.channels_per_host = channels_per_host
+        self.endpoints = [host.strip() for host in predictor_host.split(",") if host.strip()]
+        self.channels = [GrpcChannel(endpoint) for endpoint in self.endpoints for _ in range(channels_per_host)]
+        # 模型名称到请求模板, 由load_model构造
+        self.templates = {}
+        # 已注册的共享内存区域(名称到(key, byte_size)), 重连时在新连接的triton上补注册
+        self.shm_regions = {}
+        self._lock = threading.Lock()
+        # 重连由健康检查线程及reconnect共用, 同一连接不会同时重连
+        self._connect_lock = threading.Lock()
+        self._closed = False
 
         self.init()
 
+        if health_interval > 0:
+            self._health_thread = threading.Thread(
+                target=self._health_loop, name="triton-grpc-health", daemon=True)
+            self._health_thread.start()
+
+    @property
+    def triton_client(self):
+        """任意一个健康连接, 没有健康连接时为None"""
+        for channel in self.channels:
+            if channel.healthy:
+                return channel.triton_client
+        return None
+
     def init(self):
+        for channel in self.channels:
+            self._connect(channel)
 
-        self.triton_client = grpcclient.InferenceServerClient(
-            url=self.predictor_host,
-            verbose=self.verbose)
-        
-        if not self.triton_client.is_server_ready():
-            self.triton_client = None
+        if self.triton_client is None and self.require_ready:
             raise_error("FAILED : is_server_ready")
 
-    def infer(self, model_name: str, input_dict: dict, output_name_list: list):
-        if self.triton_client is None:
-            self.init()
+    def close(self):
+        self._closed = True
+        for channel in self.channels:
+            with self._lock:
+                clients = set(channel.inflight)
+                if channel.triton_client is not None:
+                    clients.add(channel.triton_client)
+                channel.inflight.clear()
+                channel.triton_client = None
+                channel.healthy = False
+            for client in clients:
+                client.close()
+
+    def infer(self, model_name: str, input_dict: dict, output_name_list: list, output_shm=None):
+        # 已超过截止时间的请求不再发送, 剩余时间作为本次调用的超时
+        admission.check_deadline("triton_rpc")
+        batch_size = _batch_size(input_dict)
+        labels = metrics.labels_for(self.transport)
         # construct InferInput/InferRequestedOutput object list
-        triton_inputs, triton_outputs = self._request_generator(input_dict, output_name_list)
+        with metrics.timed("request_build", batch_size, labels):
+            triton_inputs, triton_outputs = self._request_generator(
+                input_dict, output_name_list, output_shm, model_name)
 
-        return self.triton_client.infer(
-            model_name=model_name,
-            inputs=triton_inputs,
-            outputs=triton_outputs,
-            client_timeout=self.client_timeout)
+        channel, client = self._acquire()
+        try:
+            with metrics.timed("triton_rpc", batch_size, labels):
+                return client.infer(
+                    model_name=model_name,
+                    inputs=triton_inputs,
+                    outputs=triton_outputs,
+                    client_timeout=admission.remaining(self.client_timeout))
+        except InferenceServerException as e:
+            self._check_error(channel, e)
+            if e.status() == "StatusCode.DEADLINE_EXCEEDED":
+                raise admission.DeadlineExceeded("triton rpc exceeded the request deadline: {}".format(e))
+            raise
+        finally:
+            self._release(channel, client)
+
+    def async_infer(self, model_name: str, input_dict: dict, output_name_list: list, callback, output_shm=None):
+        admission.check_deadline("triton_rpc")
+        batch_size = _batch_size(input_dict)
+        labels = metrics.labels_for(self.transport)
+        # construct InferInput/InferRequestedOutput object list
+        with metrics.timed("request_build", batch_size, labels):
+            triton_inputs, triton_outputs = self._request_generator(
+                input_dict, output_name_list, output_shm, model_name)
 
-        
-    def async_infer(self, model_name: str, input_dict: dict, output_name_list: list, callback):
-        if self.triton_client is None:
-            self.init()
+        channel, client = self._acquire()
+        t1 = time.perf_counter()
 
-        # construct InferInput/InferRequestedOutput object list
-        triton_inputs, triton_outputs = self._request_generator(
-            input_dict, output_name_list)
+        def channel_callback(result, error):
+            metrics.observe("triton_rpc", time.perf_counter() - t1, batch_size, labels)
+            self._release(channel, client)
+            if error is not None:
+                self._check_error(channel, error)
+            callback(result, error)
 
         # Inference call
-        self.triton_client.async_infer(model_name=model_name,
-                                       inputs=triton_inputs,
-                                       callback=callback,
-                                       outputs=triton_outputs,
-                                       client_timeout=self.client_timeout)
+        try:
+            client.async_infer(model_name=model_name,
+                                              inputs=triton_inputs,
+                                              callback=channel_callback,
+                                              outputs=triton_outputs,
+                                              client_timeout=admission.remaining(self.client_timeout))
+        except Exception:
+            self._release(channel, client)
+            raise
+
+    def open_stream(self, callback, stream_timeout=None):
+        """在在途请求最少的健康endpoint上建立一个双向grpc流
+
+        Args:
+            callback (function): 每个请求完成时调用callback(result, error).
+            stream_timeout (float, optional): 整个流的超时时间(秒). Defaults to None.
+
+        Returns:
+            TritonGrpcStream: 流对象, 用完需close
+        """
+        channel, client = self._acquire()
+        self._release(channel, client)
+        return TritonGrpcStream(self, channel.endpoint, callback, stream_timeout=stream_timeout)
+
+    def get_model_metadata(self, model_name, model_version=""):
+        """模型元数据(dict), 包含输入输出的名称, datatype及shape"""
+        client = self.triton_client
+        if client is None:
+            raise_error("FAILED : is_server_ready")
+        return _with_client_timeout(client.get_model_metadata, self.client_timeout,
+                                    model_name, model_version, as_json=True)
+
+    def get_model_config(self, model_name, model_version=""):
+        """模型配置(dict), 包含max_batch_size, 输入输出dims及dynamic_batching"""
+        client = self.triton_client
+        if client is None:
+            raise_error("FAILED : is_server_ready")
+        return _with_client_timeout(client.get_model_config, self.client_timeout,
+                                    model_name, model_version, as_json=True)
+
+    def load_model(self, model_name, spec=None):
+        """获取模型元数据及配置, 构造请求模板, 之后该模型的请求(包括grpc流)按模板构造并在发送前校验
+
+        Args:
+            model_name (str): 模型名称.
+            spec (ModelSpec, optional): 已获取的模型元数据及配置, None时向triton查询. Defaults to None.
+
+        Returns:
+            ModelSpec: 模型元数据及配置
+        """
+        if spec is None:
+            spec = ModelSpec.from_triton(self.get_model_metadata(model_name), self.get_model_config(model_name))
+        self.templates[model_name] = RequestTemplate(spec, grpcclient)
+        return spec
+
+    def register_system_shared_memory(self, name, key, byte_size):
+        """在每个健康地址的triton上注册共享内存区域, 不健康的地址在重连时补注册
+
+        Raises:
+            InferenceServerException: 没有健康的地址, 或triton注册失败
+        """
+        channels = self._endpoint_channels()
+        if not channels:
+            raise_error("FAILED : no healthy triton endpoint to register shared memory {}".format(name))
+        for channel in channels:
+            channel.triton_client.register_system_shared_memory(name, key, byte_size)
+        with self._lock:
+            self.shm_regions[name] = (key, byte_size)
+
+    def unregister_system_shared_memory(self, name):
+        with self._lock:
+            self.shm_regions.pop(name, None)
+        for channel in self._endpoint_channels():
+            channel.triton_client.unregister_system_shared_memory(name)
+
+    def _restore_shared_memory(self, triton_client):
+        # triton重启后共享内存注册丢失, 补注册triton上没有的区域
+        with self._lock:
+            regions = dict(self.shm_regions)
+        if not regions:
+            return
+        status = triton_client.get_system_shared_memory_status(as_json=True)
+        registered = status.get("regions", {})
+        for name, (key, byte_size) in regions.items():
+            if name not in registered:
+                triton_client.register_system_shared_memory(name, key, byte_size)
+
+    def _endpoint_channels(self):
+        channels = {}
+        for channel in self.channels:
+            if channel.healthy and channel.endpoint not in channels:
+                channels[channel.endpoint] = channel
+        return list(channels.values())
+
+    def _acquire(self):
+        # least outstanding requests
+        with self._lock:
+            healthy = [channel for channel in self.channels if channel.healthy]
+            if not healthy:
+                raise_error("FAILED : no healthy triton endpoint")
+            channel = min(healthy, key=lambda c: c.outstanding)
+            channel.outstanding += 1
+            client = channel.triton_client
+            channel.inflight[client] = channel.inflight.get(client, 0) + 1
+            return channel, client
+
+    def _release(self, channel, client):
+        with self._lock:
+            channel.outstanding -= 1
+            count = channel.inflight.get(client, 0) - 1
+            if count > 0:
+                channel.inflight[client] = count
+                return
+            channel.inflight.pop(client, None)
+            # 重连替换下的旧客户端, 最后一个在途请求结束后关闭
+            retired = client is not channel.triton_client
+        if retired:
+            client.close()
+
+    def _check_error(self, channel, error):
+        # 连接不可用时立即剔除, 等待后台重连
+        status = error.status() if isinstance(error, InferenceServerException) else None
+        if status == "StatusCode.UNAVAILABLE":
+            print("triton endpoint {} unavailable: {}".format(channel.endpoint, error))
+            self._mark_failed(channel)
+        elif SHM_UNKNOWN_REGION in str(error):
+            # triton在两次健康检查之间重启, 共享内存注册已丢失: 剔除连接, 重连时补注册
+            print("triton endpoint {} lost shared memory registration: {}".format(channel.endpoint, error))
+            self._mark_failed(channel)
+
+    def _mark_failed(self, channel):
+        with self._lock:
+            channel.healthy = False
+            channel.failures += 1
+            channel.next_retry = time.time() + min(2 ** (channel.failures - 1), self.max_backoff)
+
+    def _connect(self, channel):
+        """建立新的连接并替换channel的客户端; 旧客户端上仍有在途请求时延迟到请求结束后关闭, 不取消这些请求"""
+        triton_client = None
+        try:
+            kwargs = {}
+            if self.channels_per_host > 1:
+                # 同一地址的多个连接不共享底层subchannel
+                kwargs["channel_args"] = [
+                    ("grpc.max_send_message_length", grpcclient.MAX_GRPC_MESSAGE_SIZE),
+                    ("grpc.max_receive_message_length", grpcclient.MAX_GRPC_MESSAGE_SIZE),
+                    ("grpc.use_local_subchannel_pool", 1),
+                ]
+            triton_client = grpcclient.InferenceServerClient(
+                url=channel.endpoint,
+                verbose=self.verbose,
+                **kwargs)
+
+            if not _with_client_timeout(triton_client.is_server_ready, self.connect_timeout):
+                raise_error("FAILED : is_server_ready")
+            self._restore_shared_memory(triton_client)
+        except Exception as e:
+            print("triton channel {} creation failed: {}".format(channel.endpoint, e))
+            if triton_client is not None:
+                triton_client.close()
+            self._mark_failed(channel)
+            return False
+
+        with self._lock:
+            retired = channel.triton_client
+            channel.triton_client = triton_client
+            channel.healthy = True
+            channel.failures = 0
+            if retired is not None and channel.inflight.get(retired, 0) > 0:
+                retired = None
+        if retired is not None:
+            retired.close()
+        return True
+
+    def _health_loop(self):
+        while not self._closed:
+            time.sleep(self.health_interval)
+            for channel in self.channels:
+                if self._closed:
+                    break
+                if channel.healthy:
+                    try:
+                        ready = _with_client_timeout(channel.triton_client.is_server_ready, self.health_interval)
+                    except Exception:
+                        ready = False
+                    if not ready:
+                        print("triton endpoint {} is not ready, evicted".format(channel.endpoint))
+                        self._mark_failed(channel)
+                elif time.time() >= channel.next_retry:
+                    with self._connect_lock:
+                        if not channel.healthy:
+                            self._connect(channel)
+
+    def reconnect(self):
+        """立即重连所有不健康的连接(不等待退避), 用于启动时等待triton就绪
+
+        Returns:
+            bool: 是否有健康的连接
+        """
+        with self._connect_lock:
+            for channel in self.channels:
+                if not channel.healthy and not self._closed:
+                    self._connect(channel)
+        return self.triton_client is not None
+
+    def _request_generator(self, input_dict, output_list, output_shm=None, model_name=None):
+        return _build_request(grpcclient, input_dict, output_list, output_shm, self.templates.get(model_name))
+
+
+class TritonGrpcStream():
+    """单个双向grpc流, 独占一个grpc连接, 用于视频帧等连续发送的请求
+
+    每个InferenceServerClient只能有一个流, 因此不与TritonGrpcClient的连接池共用连接。
+    结果通过callback(result, error)返回, 与请求的对应关系由request_id确定;
+    流中任一请求失败或连接断开时callback收到error, 之后的请求不会再有结果。
+    """
+
+    transport = "grpc"
+
+    def __init__(self, client, endpoint, callback, stream_timeout=None):
+        """
+        Args:
+            client (TritonGrpcClient): 所属的连接池, 用于构造请求.
+            endpoint (str): triton地址.
+            callback (function): 每个请求完成时调用callback(result, error).
+            stream_timeout (float, optional): 整个流的超时时间(秒). Defaults to None.
+        """
+        self.client = client
+        self.endpoint = endpoint
+        self.triton_client = grpcclient.InferenceServerClient(url=endpoint, verbose=client.verbose)
+        self.triton_client.start_stream(callback=callback, stream_timeout=stream_timeout)
 
     def async_stream_infer(self,
                            model_name: str,
                            input_dict: dict,
                            output_name_list: list,
                            req_cnt: str,
-                           seq_id: int,
-                           start: bool,
-                           end: bool
+                           seq_id: int = 0,
+                           start: bool = False,
+                           end: bool = False
                            ):
-        if self.triton_client is None:
-            self.init()
-
+        """在流上发送一个请求, 非sequence模型seq_id/start/end保持默认值"""
+        labels = metrics.labels_for(self.transport)
         # construct InferInput/InferRequestedOutput object list
-        triton_inputs, triton_outputs = self._request_generator(
-            input_dict, output_name_list)
+        with metrics.timed("request_build", _batch_size(input_dict), labels):
+            triton_inputs, triton_outputs = self.client._request_generator(
+                input_dict, output_name_list, model_name=model_name)
 
         # Inference call
         self.triton_client.async_stream_infer(model_name=model_name,
@@ -170,17 +746,145 @@ class TritonGrpcClient():
                                               sequence_end=end,
                                               outputs=triton_outputs)
 
-    def _request_generator(self, input_dict, output_list):
-        inputs, outputs = [], []
+    def close(self, cancel_requests=False):
+        """关闭流, cancel_requests为False时等待在途请求完成"""
+        self.triton_client.stop_stream(cancel_requests=cancel_requests)
+        self.triton_client.close()
 
-        for key in input_dict:
-            value = input_dict[key]
-            infer_input = grpcclient.InferInput(
-                key, value.shape, np_to_triton_dtype(value.dtype))
-            infer_input.set_data_from_numpy(value)
-            inputs.append(infer_input)
 
-        for name in output_list:
-            outputs.append(grpcclient.InferRequestedOutput(name))
+class AsyncTritonHttpClient():
+    """ 
+    基于tritonclient.http.aio的asyncio版本TritonHttpClient, 所有调用都需在同一个事件循环中await.
+
+    Note:
+    -----
+    aiohttp连接池需在事件循环内创建, 因此连接在第一次调用时才初始化.
+    """
+
+    transport = "http"
+
+    def __init__(self, predictor_host, verbose=False, concurrency=1):
+        """
+        Args:
+            predictor_host (str): The triton predictor host url.
+            concurrency (int, optional): 连接池最大连接数. Defaults to 1.
+        """
+        self.predictor_host = predictor_host
+        self.verbose = verbose
+        self.concurrency = concurrency
+        self.triton_client = None
+        self.templates = {}
+
+    async def init(self):
+        if self.triton_client is not None:
+            await self.triton_client.close()
+
+        self.triton_client = aiohttpclient.InferenceServerClient(
+            url=self.predictor_host, verbose=self.verbose, conn_limit=self.concurrency)
+
+        if not await self.triton_client.is_server_ready():
+            await self.triton_client.close()
+            self.triton_client = None
+            raise_error("FAILED : is_server_ready")
+
+    async def infer(self, model_name, input_dict, output_name_list):
+        """Call tritonclient asyncio inference.
+
+        Args:
+            model_name (str): The name of the model to run inference.
+            input_dict (dict): A dict of input objects, each describing data for a input numpy data required by the model.
+            output_name_list (list): A list of output tensor name, each describing how the output data must be returned.
+
+        Returns:
+            InferResult: The object holding the result of the inference.
+
+        Raises:
+            InferenceServerException: If server fails to issue inference.
+        """
+        if self.triton_client is None:
+            await self.init()
+
+        admission.check_deadline("triton_rpc")
+        batch_size = _batch_size(input_dict)
+        labels = metrics.labels_for(self.transport)
+        with metrics.timed("request_build", batch_size, labels):
+            triton_inputs, triton_outputs = self._request_generator(input_dict, output_name_list, model_name)
+
+        with metrics.timed("triton_rpc", batch_size, labels):
+            return await self.triton_client.infer(model_name, triton_inputs, outputs=triton_outputs)
+
+    async def close(self):
+        if self.triton_client is not None:
+            await self.triton_client.close()
+            self.triton_client = None
+
+    def load_model(self, model_name, spec):
+        """按启动时(通过同步客户端)获取的模型元数据及配置构造请求模板"""
+        self.templates[model_name] = RequestTemplate(spec, aiohttpclient)
+        return spec
+
+    def _request_generator(self, input_dict, output_list, model_name=None):
+        return _build_request(aiohttpclient, input_dict, output_list, template=self.templates.get(model_name))
+
+
+class AsyncTritonGrpcClient():
+    """ 
+    基于tritonclient.grpc.aio的asyncio版本TritonGrpcClient, 所有调用都需在同一个事件循环中await.
+
+    Note:
+    -----
+    grpc aio channel需在事件循环内创建, 因此连接在第一次调用时才初始化.
+    """
+
+    transport = "grpc"
+
+    def __init__(self, predictor_host, verbose=False, concurrency=1, timeout=30):
+        self.predictor_host = predictor_host
+        self.verbose = verbose
+        self.concurrency = concurrency
+        self.triton_client = None
+        self.client_timeout = timeout
+        self.templates = {}
+
+    async def init(self):
+        if self.triton_client is not None:
+            await self.triton_client.close()
+
+        self.triton_client = aiogrpcclient.InferenceServerClient(
+            url=self.predictor_host,
+            verbose=self.verbose)
+
+        if not await self.triton_client.is_server_ready():
+            await self.triton_client.close()
+            self.triton_client = None
+            raise_error("FAILED : is_server_ready")
+
+    async def infer(self, model_name: str, input_dict: dict, output_name_list: list):
+        if self.triton_client is None:
+            await self.init()
+
+        admission.check_deadline("triton_rpc")
+        batch_size = _batch_size(input_dict)
+        labels = metrics.labels_for(self.transport)
+        with metrics.timed("request_build", batch_size, labels):
+            triton_inputs, triton_outputs = self._request_generator(input_dict, output_name_list, model_name)
+
+        with metrics.timed("triton_rpc", batch_size, labels):
+            return await self.triton_client.infer(
+                model_name=model_name,
+                inputs=triton_inputs,
+                outputs=triton_outputs,
+                client_timeout=admission.remaining(self.client_timeout))
+
+    async def close(self):
+        if self.triton_client is not None:
+            await self.triton_client.close()
+            self.triton_client = None
+
+    def load_model(self, model_name, spec):
+        """按启动时(通过同步客户端)获取的模型元数据及配置构造请求模板"""
+        self.templates[model_name] = RequestTemplate(spec, aiogrpcclient)
+        return spec
 
-        return inputs, outputs
\ No newline at end of file
+    def _request_generator(self, input_dict, output_list, model_name=None):
+        return _build_request(aiogrpcclient, input_dict, output_list, template=self.templates.get(model_name))
@@ -0,0 +1,294 @@
+# -*- encoding: utf-8 -*-
+'''
+@File    : tuner.py
+@Time    : 2026/10/18 22:10:48
+@Author  : zhangbiao
+@Contact : zhangbiao@mgtv.com
+@Version : 1.0
+@Desc    : batch上限及在途请求数自动调优, 在延迟SLO内最大化吞吐
+
+启动时在后台线程对triton做一轮探测, 遍历batch大小及在途请求数, 选出p95延迟不超过SLO且吞吐最高的组合;
+之后按线上请求的p95延迟周期性调整: 超过SLO时先降低在途请求数再降低batch上限, 明显低于SLO时逐步恢复。
+调优结果通过prometheus指标暴露, 运行中通过可调整上限的信号量及DynamicBatcher.max_batch_size生效。
+'''
+
+import time
+import asyncio
+import threading
+from collections import deque
+
+import numpy as np
+
+from . import metrics
+
+
+class AdjustableSemaphore():
+    """上限可在运行中调整的信号量(线程), 调小后已在途的请求不受影响, 完成后才放行新的请求"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.active < self.limit, timeout):
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def set_limit(self, limit):
+        with self._cond:
+            self.limit = limit
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AsyncAdjustableSemaphore():
+    """上限可在运行中调整的asyncio信号量, set_limit可在其他线程中调用
+
+    第一次使用时绑定事件循环, 之后set_limit通过call_soon_threadsafe在事件循环中生效。
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._loop = None
+        self._waiters = deque()
+
+    async def __aenter__(self):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        while self.active >= self.limit:
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # 已被唤醒却被取消时, 把名额让给下一个等待者
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._wake()
+                raise
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._wake()
+
+    def set_limit(self, limit):
+        if self._loop is None:
+            self.limit = limit
+            return
+        self._loop.call_soon_threadsafe(self._set_limit, limit)
+
+    def _set_limit(self, limit):
+        self.limit = limit
+        self._wake()
+
+    def _wake(self):
+        free = self.limit - self.active
+        while self._waiters and free > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+
+class AutoTuner():
+    """batch上限及在途请求数自动调优
+
+    探测直接调用FaceQualityPrediction, 在start启动的后台线程中进行, 调用方应在服务预热完成后start;
+    grpc及CPU后端通过grpc_async_infer保持concurrency个请求在途, http客户端按轮发送concurrency个请求并在探测线程中等待结果
+    (http客户端每个线程各自建立连接)。asyncio调用方式的客户端绑定在服务的事件循环上, 不做启动探测, 只按线上延迟调整。
+    线上延迟由调用方通过record记录, 应只包含获得在途名额之后的推理耗时, 不含排队等待,
+    否则过载时降低并发反而使延迟升高。
+    """
+
+    def __init__(self, predictor, apply, slo_ms=100, max_batch_size=64, max_concurrency=100,
+                 batch_size=None, concurrency=None, probe=True, probe_seconds=1.0, interval=30,
+                 min_samples=20):
+        """
+        Args:
+            predictor (FaceQualityPrediction): 用于探测的算法调用对象.
+            apply (function): 调优结果生效的回调apply(batch_size, concurrency).
+            slo_ms (float, optional): 延迟SLO, 按p95计算(毫秒). Defaults to 100.
+            max_batch_size (int, optional): batch上限的最大值. Defaults to 64.
+            max_concurrency (int, optional): 在途请求数的最大值. Defaults to 100.
+            batch_size (int, optional): 探测完成前使用的batch上限, None时为max_batch_size. Defaults to None.
+            concurrency (int, optional): 探测完成前使用的在途请求数, None时为max_concurrency. Defaults to None.
+            probe (bool, optional): 启动时是否探测triton. Defaults to True.
+            probe_seconds (float, optional): 每个组合的探测时长(秒). Defaults to 1.0.
+            interval (float, optional): 按线上延迟调整的周期(秒). Defaults to 30.
+            min_samples (int, optional): 一个周期内至少多少个请求才做调整. Defaults to 20.
+        """
+        self.predictor = predictor
+        self.apply = apply
+        self.slo = slo_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size or max_batch_size
+        self.concurrency = concurrency or max_concurrency
+        self.probe_enabled = probe
+        self.probe_seconds = probe_seconds
+        self.interval = interval
+        self.min_samples = min_samples
+        # 调整的上界, 探测完成后为探测得到的最优值
+        self.batch_ceiling = self.batch_size
+        self.probe_results = []
+
+        self._samples = deque(maxlen=10000)
+        self._closed = False
+        self._thread = None
+
+    def start(self):
+        self._publish()
+        target = self._probe_and_run if self.probe_enabled else self._run
+        self._thread = threading.Thread(target=target, name="auto-tuner", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._closed = True
+
+    def limit_batch_size(self, limit):
+        """batch上限的最大值不超过limit(模型的max_batch_size), 获取模型配置后调用"""
+        self.max_batch_size = min(self.max_batch_size, limit)
+        self.batch_ceiling = min(self.batch_ceiling, limit)
+        if self.batch_size > limit:
+            self._set(limit, self.concurrency)
+
+    def record(self, seconds, batch_size):
+        """记录一次线上推理的耗时(不含等待在途名额的时间)"""
+        self._samples.append(seconds)
+
+    def probe(self):
+        """遍历batch大小及在途请求数, 选出p95延迟不超过SLO且吞吐最高的组合
+
+        Returns:
+            tuple: (batch_size, concurrency), 没有满足SLO的组合时为(1, 1)
+        """
+        results = []
+        batch_size = 1
+        while batch_size <= self.max_batch_size:
+            best_ips = 0.0
+            concurrency = 1
+            while concurrency <= self.max_concurrency:
+                p95, ips = self._measure(batch_size, concurrency)
+                results.append((batch_size, concurrency, p95, ips))
+                metrics.observe_tuner_probe(batch_size, concurrency, p95, ips)
+                # 超过SLO或吞吐不再明显增加时, 更大的并发没有意义
+                if p95 > self.slo or ips < best_ips * 1.05:
+                    break
+                best_ips = ips
+                concurrency *= 2
+            batch_size *= 2
+
+        self.probe_results = results
+        feasible = [r for r in results if r[2] <= self.slo]
+        if not feasible:
+            return 1, 1
+        batch_size, concurrency, _, _ = max(feasible, key=lambda r: (r[3], -r[1]))
+        return batch_size, concurrency
+
+    def _measure(self, batch_size, concurrency):
+        images = [np.zeros(self.predictor.input_size[::-1] + (3,), dtype=np.uint8)] * batch_size
+        latencies = []
+        deadline = time.time() + self.probe_seconds
+        t0 = time.perf_counter()
+        if self.predictor.tritonclient.transport == "http":
+            while time.time() < deadline:
+                handles = [(time.perf_counter(), self.predictor.async_infer(images)) for _ in range(concurrency)]
+                for t1, handle in handles:
+                    handle.get_result()
+                    latencies.append(time.perf_counter() - t1)
+        else:
+            window = threading.Semaphore(concurrency)
+            errors = []
+
+            def done(t1, future):
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                latencies.append(time.perf_counter() - t1)
+                window.release()
+
+            while time.time() < deadline and not errors:
+                window.acquire()
+                t1 = time.perf_counter()
+                self.predictor.grpc_async_infer(images).add_done_callback(lambda f, t1=t1: done(t1, f))
+            for _ in range(concurrency):
+                window.acquire()
+            if errors:
+                raise errors[0]
+        elapsed = time.perf_counter() - t0
+        return float(np.percentile(latencies, 95)), len(latencies) * batch_size / elapsed
+
+    def adjust(self):
+        """按最近一个周期的线上p95延迟调整一次"""
+        samples = []
+        while self._samples:
+            samples.append(self._samples.popleft())
+        if len(samples) < self.min_samples:
+            return
+        p95 = float(np.percentile(samples, 95))
+        batch_size, concurrency = self.batch_size, self.concurrency
+        if p95 > self.slo:
+            # 超过SLO: 先减少在途请求数, 已为1时减小batch上限
+            if concurrency > 1:
+                concurrency = max(1, concurrency * 3 // 4)
+            elif batch_size > 1:
+                batch_size = batch_size // 2
+        elif p95 < self.slo * 0.7:
+            # 明显低于SLO: 先恢复batch上限, 再逐步增加在途请求数
+            if batch_size < self.batch_ceiling:
+                batch_size = min(batch_size * 2, self.batch_ceiling)
+            elif concurrency < self.max_concurrency:
+                concurrency = min(concurrency + max(1, concurrency // 10), self.max_concurrency)
+        if (batch_size, concurrency) != (self.batch_size, self.concurrency):
+            print("auto tuner: p95 {:.1f}ms, batch size {} -> {}, concurrency {} -> {}".format(
+                p95 * 1000, self.batch_size, batch_size, self.concurrency, concurrency))
+            self._set(batch_size, concurrency)
+
+    def _probe(self):
+        try:
+            batch_size, concurrency = self.probe()
+            self.batch_ceiling = batch_size
+            print("auto tuner: probe selected batch size {}, concurrency {}".format(batch_size, concurrency))
+            self._set(batch_size, concurrency)
+        except Exception as e:
+            print("auto tuner: probe failed, keep batch size {}, concurrency {}: {}".format(
+                self.batch_size, self.concurrency, e))
+        # 探测期间的请求不计入线上延迟
+        self._samples.clear()
+
+    def _probe_and_run(self):
+        self._probe()
+        self._run()
+
+    def _run(self):
+        while not self._closed:
+            time.sleep(self.interval)
+            try:
+                self.adjust()
+            except Exception as e:
+                print("auto tuner: adjust failed: {}".format(e))
+
+    def _set(self, batch_size, concurrency):
+        self.apply(batch_size, concurrency)
+        self.batch_size, self.concurrency = batch_size, concurrency
+        self._publish()
+
+    def _publish(self):
+        metrics.observe_tuner_decision(self.batch_size, self.concurrency)
@@ -13,35 +13,253 @@
 import numpy as np
 import cv2
 import base64
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-def parse_item_image(item):
+def parse_item_image(item, min_size=None):
     if item[:4] == "http":
-        image = UrlImageDecode(item)
+        image = UrlImageDecode(item, min_size)
     elif item[:4] == "path":
-        image_path = item.strip("path:")
-        image = cv2.imread(image_path)
+        image_path = item[5:]
+        image = PathImageDecode(image_path, min_size)
     elif item[:4] == "data":
-        b64code = item.strip("data:image/jpeg;base64,")
-        image = B64ImageDecode(b64code)
+        # data:image/<type>;base64,<code>, 兼容旧客户端发送的str(bytes)格式: b'<code>'
+        b64code = item[item.find(",") + 1:]
+        if b64code[:2] == "b'" and b64code[-1:] == "'":
+            b64code = b64code[2:-1]
+        image = B64ImageDecode(b64code, min_size)
     else:
         raise ValueError(
             "invalid input item, must be one of path, url, base64 code")
     return image
 
-def BufferImageDecode(image_buffer):
-    nparr = np.frombuffer(image_buffer, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_UNCHANGED)
+def parse_item_images(items, executor=None, fetcher=None, indices=None, min_size=None):
+    """批量解析图片, 提供线程池时并行解码(cv2解码时释放GIL), 返回结果与输入顺序一致
+
+    Args:
+        items (list): 图片item列表, 每个item为path, url或base64编码
+        executor (concurrent.futures.Executor, optional): 解码线程池, None时串行解码. Defaults to None.
+        fetcher (UrlImageFetcher, optional): url图片下载器, 所有url图片并发下载, None时使用全局默认下载器. Defaults to None.
+        indices (list, optional): 各item在原始请求中的序号, 用于错误信息, None时为items中的序号. Defaults to None.
+        min_size (tuple, optional): (宽, 高), 指定时jpeg图片按不小于该尺寸的最大比例缩小解码. Defaults to None.
+
+    Returns:
+        list: 解码后的图片列表(BGR, uint8)
+
+    Raises:
+        ValueError: 存在解码失败的图片时, 异常信息中列出每个失败item的序号及原因
+    """
+    def parse(item):
+        try:
+            image = parse_item_image(item, min_size)
+            if image is None:
+                return None, "failed to decode image"
+            return image, None
+        except Exception as e:
+            return None, str(e)
+
+    # url图片先全部提交下载, 与本地/base64图片的解码并行进行
+    if fetcher is None:
+        fetcher = get_url_fetcher()
+    url_futures = {}
+    for i, item in enumerate(items):
+        if item[:4] == "http":
+            url_futures[i] = fetcher.submit(item, min_size)
+
+    local_items = [item for i, item in enumerate(items) if i not in url_futures]
+    if executor is None or len(local_items) <= 1:
+        local_results = [parse(item) for item in local_items]
+    else:
+        local_results = list(executor.map(parse, local_items))
+
+    results = []
+    local_results = iter(local_results)
+    for i in range(len(items)):
+        if i not in url_futures:
+            results.append(next(local_results))
+            continue
+        try:
+            image = url_futures[i].result()
+            results.append((image, None) if image is not None else (None, "failed to decode image"))
+        except Exception as e:
+            results.append((None, str(e)))
+    return _collect_images(results, indices)
+
+def decode_image_buffers(buffers, executor=None, indices=None, min_size=None):
+    """批量解码二进制请求中的图片字节, 提供线程池时并行解码, 返回结果与输入顺序一致
+
+    Args:
+        buffers (list): 图片字节列表(bytes或指向请求体的memoryview)
+        executor (concurrent.futures.Executor, optional): 解码线程池, None时串行解码. Defaults to None.
+        indices (list, optional): 各图片在原始请求中的序号, 用于错误信息. Defaults to None.
+        min_size (tuple, optional): (宽, 高), 指定时jpeg图片按不小于该尺寸的最大比例缩小解码. Defaults to None.
+
+    Returns:
+        list: 解码后的图片列表(BGR, uint8)
+
+    Raises:
+        ValueError: 存在解码失败的图片时, 异常信息中列出每个失败图片的序号及原因
+    """
+    def decode(buffer):
+        try:
+            image = BufferImageDecode(buffer, min_size)
+            if image is None:
+                return None, "failed to decode image"
+            return image, None
+        except Exception as e:
+            return None, str(e)
+
+    if executor is None or len(buffers) <= 1:
+        results = [decode(buffer) for buffer in buffers]
+    else:
+        results = list(executor.map(decode, buffers))
+    return _collect_images(results, indices)
+
+def _collect_images(results, indices=None):
+    if indices is None:
+        indices = range(len(results))
+    errors = ["item[{}]: {}".format(index, error) for index, (_, error) in zip(indices, results) if error is not None]
+    if errors:
+        raise ValueError("invalid input images, " + "; ".join(errors))
+    return [image for image, _ in results]
+
+def read_video_frames(video_path, step=1):
+    """逐帧读取视频文件
+
+    Args:
+        video_path (str): 视频文件路径或cv2.VideoCapture支持的地址
+        step (int, optional): 抽帧间隔, 每step帧取一帧. Defaults to 1.
+
+    Yields:
+        numpy.ndarray: BGR帧
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError("failed to open video: {}".format(video_path))
+    try:
+        index = 0
+        while capture.grab():
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                yield frame
+            index += 1
+    finally:
+        capture.release()
+
+# jpeg缩小解码(libjpeg DCT缩放)的比例及对应的imread标志, 从大到小尝试
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+# jpeg SOF标记(帧头, 含图片宽高), 0xC4(DHT), 0xC8(JPG), 0xCC(DAC)除外
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def jpeg_size(image_buffer):
+    """从jpeg头中读取图片尺寸, 不解码
+
+    Args:
+        image_buffer (bytes or numpy.ndarray): 图片字节
+
+    Returns:
+        tuple: (宽, 高), 不是jpeg或头部不完整时为None
+    """
+    data = memoryview(image_buffer).cast("B")
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # 填充字节
+            pos += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            # 没有长度字段的标记
+            pos += 2
+            continue
+        length = (data[pos + 2] << 8) | data[pos + 3]
+        if marker in _JPEG_SOF_MARKERS:
+            if pos + 9 > len(data):
+                return None
+            height = (data[pos + 5] << 8) | data[pos + 6]
+            width = (data[pos + 7] << 8) | data[pos + 8]
+            return width, height
+        if marker == 0xDA:
+            # 扫描数据开始前没有帧头
+            return None
+        pos += 2 + length
+    return None
+
+def reduced_decode_flag(image_buffer, min_size):
+    """选择jpeg缩小解码的imread标志: 缩小后宽高仍不小于min_size的最大比例
+
+    Args:
+        image_buffer (bytes or numpy.ndarray): 图片字节
+        min_size (tuple): (宽, 高), 如模型输入尺寸
+
+    Returns:
+        int: cv2.IMREAD_REDUCED_COLOR_2/4/8, 不是jpeg或不能缩小时为None
+    """
+    size = jpeg_size(image_buffer)
+    if size is None:
+        return None
+    width, height = size
+    for factor, flag in _REDUCED_FLAGS:
+        # libjpeg缩放后的尺寸向上取整
+        if -(-width // factor) >= min_size[0] and -(-height // factor) >= min_size[1]:
+            return flag
+    return None
+
+def to_bgr(image):
+    """统一为3通道8位BGR图片
+
+    IMREAD_UNCHANGED保留原始通道数及位深: 灰度图转为3通道, 带alpha通道的图片去掉alpha(与IMREAD_COLOR相同, 不做背景合成),
+    16位图片按高8位转为8位。
+    """
+    if image.dtype == np.uint16:
+        image = cv2.convertScaleAbs(image, alpha=1.0 / 256)
+    elif image.dtype != np.uint8:
+        raise ValueError("unsupported image depth: {}".format(image.dtype))
+    if image.ndim == 2 or image.shape[2] == 1:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    if image.shape[2] != 3:
+        raise ValueError("unsupported image channels: {}".format(image.shape[2]))
     return image
 
-def B64ImageDecode(image_b64):
+def BufferImageDecode(image_buffer, min_size=None):
+    """解码图片字节, 返回3通道8位BGR图片, 解码失败时为None
+
+    Args:
+        image_buffer (bytes or memoryview): 图片字节
+        min_size (tuple, optional): (宽, 高), 指定时jpeg图片直接按不小于该尺寸的最大比例(1/2, 1/4, 1/8)缩小解码,
+            之后只需小幅resize, 省去全尺寸解码的大部分耗时及内存. Defaults to None.
+    """
+    nparr = np.frombuffer(image_buffer, np.uint8)
+    flag = reduced_decode_flag(nparr, min_size) if min_size is not None else None
+    if flag is not None:
+        # 与IMREAD_UNCHANGED一样不按EXIF方向旋转
+        image = cv2.imdecode(nparr, flag | cv2.IMREAD_IGNORE_ORIENTATION)
+    else:
+        image = cv2.imdecode(nparr, cv2.IMREAD_UNCHANGED)
+    return to_bgr(image) if image is not None else None
+
+def PathImageDecode(image_path, min_size=None):
+    if min_size is None:
+        return cv2.imread(image_path)
+    nparr = np.fromfile(image_path, np.uint8)
+    flag = reduced_decode_flag(nparr, min_size)
+    # 与cv2.imread一样按EXIF方向旋转
+    return cv2.imdecode(nparr, flag if flag is not None else cv2.IMREAD_COLOR)
+
+def B64ImageDecode(image_b64, min_size=None):
     image_buffer = base64.b64decode(image_b64)
-    return BufferImageDecode(image_buffer)
+    return BufferImageDecode(image_buffer, min_size)
 
-def UrlImageDecode(image_url):
-    r = requests.get(image_url,stream=True)
-    image_buffer=r.content
-    return BufferImageDecode(image_buffer)
+def UrlImageDecode(image_url, min_size=None):
+    return get_url_fetcher().fetch(image_url, min_size)
 
 def B64ImageEncode(image_array):
     rect,image_buffer=cv2.imencode(".jpg", image_array)
@@ -49,3 +267,108 @@ def B64ImageEncode(image_array):
     return image_b64
 
 
+class UrlImageFetcher():
+    """url图片下载器
+
+    共享一个requests.Session连接池(keep-alive), 每个host的连接数受pool_maxsize限制,
+    请求带超时及重试, 下载内容直接读入预分配的缓冲区交给cv2.imdecode解码。
+    submit提交到内部线程池, 同一请求中的多个url并发下载。
+
+    Note:
+    -----
+    只依赖url本身, 可直接对本地http stub服务(如http.server)进行测试。
+    """
+
+    def __init__(self, max_workers=16, pool_maxsize=8, timeout=(3, 10), retries=2, backoff_factor=0.1):
+        """
+        Args:
+            max_workers (int, optional): 并发下载线程数. Defaults to 16.
+            pool_maxsize (int, optional): 每个host的最大连接数. Defaults to 8.
+            timeout (tuple, optional): (连接超时, 读取超时), 单位秒. Defaults to (3, 10).
+            retries (int, optional): 连接失败及5xx时的重试次数. Defaults to 2.
+            backoff_factor (float, optional): 重试退避系数(秒). Defaults to 0.1.
+        """
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.pool_maxsize = pool_maxsize
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        # 连接池在第一次下载时创建, 不使用url图片的服务不导入requests
+        self._session = None
+        self._lock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="url-fetch")
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=self.retries, backoff_factor=self.backoff_factor,
+                      status_forcelist=(500, 502, 503, 504), allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.pool_maxsize,
+                              max_retries=retry, pool_block=True)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # 不压缩, Content-Length即为图片字节数, 可直接读入预分配缓冲区
+        session.headers["Accept-Encoding"] = "identity"
+        return session
+
+    def fetch(self, image_url, min_size=None):
+        """下载并解码一张url图片, min_size同BufferImageDecode
+
+        Raises:
+            requests.RequestException: 连接/读取超时, 重试后仍失败或返回非2xx状态码
+        """
+        with self.session.get(image_url, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            image_buffer = self._read_body(r)
+        return BufferImageDecode(image_buffer, min_size)
+
+    def submit(self, image_url, min_size=None):
+        """异步下载并解码一张url图片, 返回concurrent.futures.Future"""
+        return self.executor.submit(self.fetch, image_url, min_size)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        if self._session is not None:
+            self._session.close()
+
+    @staticmethod
+    def _read_body(r):
+        length = r.headers.get("Content-Length")
+        if length is None:
+            return b"".join(r.iter_content(chunk_size=64 * 1024))
+
+        buffer = bytearray(int(length))
+        view = memoryview(buffer)
+        offset = 0
+        while offset < len(buffer):
+            n = r.raw.readinto(view[offset:])
+            if not n:
+                break
+            offset += n
+        return view[:offset]
+
+
+_url_fetcher = None
+_url_fetcher_lock = threading.Lock()
+
+
+def get_url_fetcher():
+    """全局默认url图片下载器, 第一次使用时创建"""
+    global _url_fetcher
+    if _url_fetcher is None:
+        with _url_fetcher_lock:
+            if _url_fetcher is None:
+                _url_fetcher = UrlImageFetcher()
+    return _url_fetcher